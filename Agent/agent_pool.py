@@ -0,0 +1,161 @@
+import collections
+import concurrent.futures
+import threading
+
+from pipeline import AgentLoop
+
+
+def parse_actors(spec):
+    """
+    Parses an actor list like "1,2,unit:1234" into for_actor() keyword dicts: plain numbers are
+    player indices, "unit:N" is a vehicle or character by unit_number.
+    """
+    actors = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if part.startswith("unit:"):
+            actors.append({"unit_number": int(part[len("unit:"):])})
+        else:
+            actors.append({"player_index": int(part)})
+    return actors or [{"player_index": 1}]
+
+
+def actor_name(actor):
+    if actor.get("unit_number") is not None:
+        return f"unit_{actor['unit_number']}"
+    return f"player_{actor.get('player_index', 1)}"
+
+
+class FairScheduler:
+    """
+    Runs submitted calls (LLM decisions) on `max_concurrent` worker threads, taking turns between
+    bots so one bot with several requests waiting cannot starve the others. Speculative requests
+    only run when no bot has a regular request waiting.
+    """
+
+    def __init__(self, max_concurrent=2):
+        self._queues = collections.OrderedDict() # bot_id -> deque of (future, fn, args, speculative)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.served = collections.Counter()
+        self._workers = [threading.Thread(target=self._work, name=f"llm-{i}", daemon=True) for i in range(max(1, max_concurrent))]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, bot_id, fn, *args, speculative=False):
+        future = concurrent.futures.Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler is closed.")
+            self._queues.setdefault(bot_id, collections.deque()).append((future, fn, args, speculative))
+            self._cond.notify()
+        return future
+
+    def for_bot(self, bot_id):
+        """
+        Returns an object with submit(fn, *args, speculative=False) bound to `bot_id`, as expected by AgentLoop.
+        """
+        return _BotScheduler(self, bot_id)
+
+    def pending(self):
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def _next(self):
+        # Bots are visited in round-robin order: the one that was just served moves to the back.
+        for want_speculative in (False, True):
+            for bot_id, queue in self._queues.items():
+                for i, item in enumerate(queue):
+                    if item[3] == want_speculative:
+                        del queue[i]
+                        self._queues.move_to_end(bot_id)
+                        return bot_id, item
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                picked = self._next()
+                while picked is None and not self._closed:
+                    self._cond.wait()
+                    picked = self._next()
+                if picked is None:
+                    return
+            bot_id, (future, fn, args, _) = picked
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            self.served[bot_id] += 1
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for queue in self._queues.values():
+                for future, _, _, _ in queue:
+                    future.cancel()
+                queue.clear()
+            self._cond.notify_all()
+
+
+class _BotScheduler:
+    __slots__ = ("scheduler", "bot_id")
+
+    def __init__(self, scheduler, bot_id):
+        self.scheduler = scheduler
+        self.bot_id = bot_id
+
+    def submit(self, fn, *args, speculative=False):
+        return self.scheduler.submit(self.bot_id, fn, *args, speculative=speculative)
+
+
+class AgentPool:
+    """
+    Drives several bots from one process. Each bot gets an AgentLoop on its own thread with its
+    own action queue, while the RCON connections, the recipe list, the WorldModel and the
+    decision agent are shared. LLM calls go through a FairScheduler so at most
+    `llm_concurrency` are in flight and every bot gets its turn.
+
+    `actors` is a list of for_actor() keyword dicts ({"player_index": n} or {"unit_number": n}).
+    """
+
+    def __init__(self, rcon_client, ai_agent, world, recipes, actors, llm_concurrency=2, loop_class=AgentLoop, **loop_options):
+        self.scheduler = FairScheduler(llm_concurrency)
+        self.loops = collections.OrderedDict()
+        for actor in actors:
+            name = actor_name(actor)
+            self.loops[name] = loop_class(rcon_client.for_actor(**actor), ai_agent, world, recipes,
+                                          think_scheduler=self.scheduler.for_bot(name), name=name, **loop_options)
+
+    def enqueue(self, name, decision):
+        """
+        Queues a decision for one bot; it runs before that bot's next LLM decision.
+        """
+        self.loops[name].enqueue(decision)
+
+    def _run_bot(self, name, loop, max_loops):
+        try:
+            loop.run(max_loops)
+        except Exception as e:
+            print(f"Bot {name} stopped: {e}")
+
+    def run(self, max_loops):
+        threads = [threading.Thread(target=self._run_bot, args=(name, loop, max_loops), name=name, daemon=True)
+                   for name, loop in self.loops.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"Agent pool stats: {self.stats()}")
+
+    def stats(self):
+        return {name: dict(loop.stats, llm_calls=self.scheduler.served[name]) for name, loop in self.loops.items()}
+
+    def close(self):
+        for loop in self.loops.values():
+            loop.close()
+        self.scheduler.close()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def _amount_bucket(amount):
+    """
+    Order-of-magnitude bucket for resource amounts: 5000 and 6000 ore look the same, 50 and 5000 do not.
+    """
+    if not amount:
+        return 0
+    return int(math.log2(amount)) + 1
+
+
+def fingerprint_state(game_state, nearby_entities, task=None, position_quantum=4.0, inventory_quantum=10, entity_quantum=2.0):
+    """
+    Returns a stable hash of the parts of the game state a decision depends on, quantized so
+    that small changes (a step or two of walking, a few more ore, a slightly smaller patch)
+    map to the same key. `task` is any extra JSON-serializable context, e.g. the current goal step.
+    """
+    position = game_state.get("position", {}) or {}
+    px = math.floor(float(position.get("x", 0)) / position_quantum)
+    py = math.floor(float(position.get("y", 0)) / position_quantum)
+
+    inventory = sorted((name, count // inventory_quantum) for name, count in (game_state.get("inventory") or {}).items()
+                       if count and count >= inventory_quantum)
+
+    entities = []
+    for entity in (nearby_entities or {}).get("entities", []):
+        entity_position = entity.get("position", {})
+        ex = float(entity.get("x", entity_position.get("x", 0)))
+        ey = float(entity.get("y", entity_position.get("y", 0)))
+        entities.append((entity.get("name"), math.floor(ex / entity_quantum), math.floor(ey / entity_quantum),
+                         _amount_bucket(entity.get("amount", 0)), entity.get("unit_number")))
+    entities.sort(key=lambda e: (e[0] or "", e[1], e[2], e[3], e[4] or 0))
+
+    canonical = json.dumps({"p": [px, py], "i": inventory, "e": entities, "t": task}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class DecisionCache:
+    """
+    LRU cache of agent decisions with a time-to-live, keyed by fingerprint_state().
+
+    Entries expire `ttl` seconds after they were stored (wall-clock time, so a persisted cache
+    stays meaningful across restarts). If `path` is set, the cache is loaded from and written
+    back to that JSON file. Hit/miss counters are kept for reporting. Safe to share between
+    threads (e.g. a regular and a speculative decision in flight at once).
+    """
+
+    def __init__(self, max_entries=256, ttl=120.0, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict() # key -> (stored_at, decision)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.rejected = 0
+        self._lock = threading.RLock()
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, now=None):
+        """
+        Returns the cached decision for `key`, or None if it is missing or expired.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, decision = entry
+            if now - stored_at > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return decision
+
+    def put(self, key, decision, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._entries[key] = (now, decision)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self.path:
+                self.save()
+
+    def reject(self, key):
+        """
+        Drops an entry whose decision turned out to be unusable (e.g. its target no longer exists).
+        The lookup that returned it is counted as a miss instead of a hit.
+        """
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.rejected += 1
+                self.hits -= 1
+                self.misses += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "rejected": self.rejected,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load decision cache from {self.path}: {e}")
+            return
+        now = time.time()
+        for key, stored_at, decision in stored.get("entries", []):
+            if now - stored_at <= self.ttl:
+                self._entries[key] = (stored_at, decision)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        with self._lock:
+            if not self.path:
+                return
+            payload = {"entries": [[key, stored_at, decision] for key, (stored_at, decision) in self._entries.items()]}
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(payload, f, separators=(",", ":"))
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Could not save decision cache to {self.path}: {e}")
@@ -0,0 +1,176 @@
+import numpy as np
+
+# One row per scanned entity: 14 bytes instead of a dict with a nested position dict of strings.
+ENTITY_DTYPE = np.dtype([("x", "<f4"), ("y", "<f4"), ("amount", "<i4"), ("name_id", "<i2")])
+
+
+class NameTable:
+    """
+    Interns entity names to small integer ids so rows only store an int16.
+    """
+    __slots__ = ("names", "_ids")
+
+    def __init__(self):
+        self.names = []
+        self._ids = {}
+
+    def intern(self, name):
+        name_id = self._ids.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.names.append(name)
+            self._ids[name] = name_id
+        return name_id
+
+    def lookup(self, name):
+        return self._ids.get(name, -1)
+
+
+class EntityColumns:
+    """
+    Columnar store for scan results backed by a NumPy structured array (see ENTITY_DTYPE).
+
+    Built straight from the mod's "columns" wire format; distance filtering and nearest-k
+    selection are vectorized. Keys are only kept when the scan is used in delta mode.
+    """
+    __slots__ = ("names", "data", "keys", "_index")
+
+    def __init__(self, data=None, names=None, keys=None):
+        self.names = names if names is not None else NameTable()
+        self.data = data if data is not None else np.empty(0, dtype=ENTITY_DTYPE)
+        self.keys = keys
+        self._index = None
+
+    @classmethod
+    def from_wire(cls, payload, names=None):
+        """
+        Decodes {"names", "name_id", "x", "y", "amount", ["key"]} columns sent by the mod.
+        Wire name ids are remapped to ids in the (possibly shared) NameTable.
+        """
+        names = names if names is not None else NameTable()
+        x = payload.get("x") or []
+        data = np.empty(len(x), dtype=ENTITY_DTYPE)
+        if len(x):
+            remap = np.array([names.intern(n) for n in payload.get("names", [])], dtype=np.int16)
+            data["x"] = x
+            data["y"] = payload["y"]
+            data["amount"] = payload["amount"]
+            data["name_id"] = remap[np.asarray(payload["name_id"], dtype=np.int64)]
+        keys = payload.get("key")
+        return cls(data, names, list(keys) if keys is not None else None)
+
+    @classmethod
+    def from_records(cls, entities, names=None):
+        """
+        Builds a store from the legacy list-of-dicts scan format.
+        """
+        names = names if names is not None else NameTable()
+        data = np.empty(len(entities), dtype=ENTITY_DTYPE)
+        for i, entity in enumerate(entities):
+            position = entity.get("position", {})
+            data[i] = (float(position.get("x", 0)), float(position.get("y", 0)), entity.get("amount", 0), names.intern(entity.get("name")))
+        keys = [entity.get("key") for entity in entities] if entities and "key" in entities[0] else None
+        return cls(data, names, keys)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def _mask_for_name(self, name):
+        if name is None:
+            return None
+        return self.data["name_id"] == self.names.lookup(name)
+
+    def distances_sq(self, x, y):
+        dx = self.data["x"] - np.float32(x)
+        dy = self.data["y"] - np.float32(y)
+        return dx * dx + dy * dy
+
+    def nearest_indices(self, x, y, k=1, name=None, max_radius=None):
+        """
+        Row indices of the k entities (optionally of one name) closest to (x, y), nearest first.
+        """
+        if not len(self.data):
+            return np.empty(0, dtype=np.int64)
+        dist_sq = self.distances_sq(x, y)
+        candidates = np.arange(len(self.data))
+        mask = self._mask_for_name(name)
+        if max_radius is not None:
+            within = dist_sq <= max_radius * max_radius
+            mask = within if mask is None else (mask & within)
+        if mask is not None:
+            candidates = candidates[mask]
+            dist_sq = dist_sq[mask]
+        if len(candidates) > k:
+            part = np.argpartition(dist_sq, k - 1)[:k]
+            candidates, dist_sq = candidates[part], dist_sq[part]
+        return candidates[np.argsort(dist_sq, kind="stable")]
+
+    def within_indices(self, x, y, radius, name=None):
+        """
+        Row indices of entities within `radius` of (x, y), nearest first.
+        """
+        return self.nearest_indices(x, y, k=len(self.data), name=name, max_radius=radius)
+
+    def record(self, i):
+        """
+        Materializes one row as a dict compatible with the legacy scan format.
+        """
+        row = self.data[i]
+        x, y = float(row["x"]), float(row["y"])
+        name = self.names.names[row["name_id"]]
+        record = {"name": name, "x": x, "y": y, "position": {"x": x, "y": y}}
+        if row["amount"]:
+            record["amount"] = int(row["amount"])
+        record["key"] = self.keys[i] if self.keys is not None else f"{name}@{x:.2f},{y:.2f}"
+        return record
+
+    def to_records(self, indices=None):
+        indices = range(len(self.data)) if indices is None else indices
+        return [self.record(int(i)) for i in indices]
+
+    def _key_index(self):
+        if self._index is None:
+            self._index = {key: i for i, key in enumerate(self.keys or [])}
+        return self._index
+
+    def contains_key(self, key):
+        return key in self._key_index()
+
+    def apply_delta(self, added=None, changed=None, removed=None):
+        """
+        Applies a delta scan in place: drops `removed` keys, updates amounts for `changed`
+        ({"key", "amount"} dicts) and appends the `added` columns payload.
+        Returns {"removed": records of the dropped rows, "updated": row indices of the changed
+        and added rows}, so consumers can follow the scan without rereading every row.
+        """
+        if self.keys is None:
+            self.keys = []
+        index = self._key_index()
+        updated_keys = []
+        dropped = []
+        if changed:
+            rows = [index[c["key"]] for c in changed if c["key"] in index]
+            amounts = [c["amount"] for c in changed if c["key"] in index]
+            self.data["amount"][rows] = amounts
+            updated_keys.extend(c["key"] for c in changed if c["key"] in index)
+        if removed:
+            rows = [index[key] for key in removed if key in index]
+            if rows:
+                dropped = self.to_records(rows)
+                keep = np.ones(len(self.data), dtype=bool)
+                keep[rows] = False
+                self.data = self.data[keep]
+                self.keys = [key for key, k in zip(self.keys, keep) if k]
+                self._index = None
+        if added and added.get("x"):
+            extra = EntityColumns.from_wire(added, self.names)
+            self.data = np.concatenate([self.data, extra.data])
+            self.keys.extend(extra.keys or [])
+            updated_keys.extend(extra.keys or [])
+            self._index = None
+        index = self._key_index()
+        return {"removed": dropped, "updated": np.array([index[key] for key in updated_keys if key in index], dtype=np.int64)}
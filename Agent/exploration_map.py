@@ -0,0 +1,267 @@
+import collections
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+CHUNK_SIZE = 32 # Factorio chunk size in tiles; one grid cell per chunk
+PAGE_SIZE = 64 # Cells per page side: a page covers 2048 x 2048 tiles
+RESOURCE_CHANNELS = ("iron-ore", "copper-ore", "coal", "stone", "uranium-ore", "crude-oil", "tree")
+MAP_VERSION = 1
+
+# explored: 0 never seen, 1 partly covered by a scan, 2 fully covered by a scan
+UNSEEN, PARTIAL, SCANNED = 0, 1, 2
+
+
+def _cell_dtype(channels):
+    return np.dtype([("explored", "u1"), ("last_seen", "<i8"),
+                     ("amount", "<f4", (channels,)), ("tiles", "<u2", (channels,))])
+
+
+class ExplorationMap:
+    """
+    Persistent chunk-level map of what the agent has seen, so a new run (or a bot that just
+    walked away) does not rediscover the same terrain.
+
+    One cell per chunk holds the explored state, the game tick it was last scanned and, per
+    resource channel (RESOURCE_CHANNELS; every tree variant counts as "tree"), the total amount
+    and number of entities seen in it. The grid is unbounded: it is split into PAGE_SIZE x
+    PAGE_SIZE pages, each a memory-mapped .npy file in `directory` created on its first write and
+    opened on first use, with at most `max_open_pages` kept open. Pages that were never written
+    read as unseen, so only the explored part of a map takes disk space and RAM.
+
+    Queries (nearest_unexplored, densest) read the window of pages they need as NumPy arrays and
+    are vectorized over its cells. Safe to share between bots.
+    """
+
+    def __init__(self, directory, channels=RESOURCE_CHANNELS, max_open_pages=64):
+        self.directory = directory
+        self.max_open_pages = max_open_pages
+        self._lock = threading.RLock()
+        self._pages = collections.OrderedDict() # (px, py) -> np.memmap, least recently used first
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != MAP_VERSION or meta.get("chunk_size") != CHUNK_SIZE or meta.get("page_size") != PAGE_SIZE:
+                raise ValueError(f"Exploration map in {directory} has an incompatible layout: {meta}")
+            channels = tuple(meta["channels"]) # The stored layout wins over the argument
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"version": MAP_VERSION, "chunk_size": CHUNK_SIZE, "page_size": PAGE_SIZE, "channels": list(channels)}, f)
+        self.channels = tuple(channels)
+        self._channel_index = {name: i for i, name in enumerate(self.channels)}
+        self.dtype = _cell_dtype(len(self.channels))
+
+    # --- Pages ---
+
+    def _page_path(self, px, py):
+        return os.path.join(self.directory, f"page_{px}_{py}.npy")
+
+    def _page(self, px, py, create=False):
+        """
+        The memory-mapped page, or None if it does not exist and `create` is false.
+        """
+        page = self._pages.get((px, py))
+        if page is not None:
+            self._pages.move_to_end((px, py))
+            return page
+        path = self._page_path(px, py)
+        if os.path.exists(path):
+            page = np.load(path, mmap_mode="r+")
+        elif create:
+            page = np.lib.format.open_memmap(path, mode="w+", dtype=self.dtype, shape=(PAGE_SIZE, PAGE_SIZE))
+        else:
+            return None
+        self._pages[(px, py)] = page
+        while len(self._pages) > self.max_open_pages:
+            _, evicted = self._pages.popitem(last=False)
+            evicted.flush()
+        return page
+
+    def _window(self, cx0, cy0, cx1, cy1):
+        """
+        Copy of the cells for chunks cx0..cx1 x cy0..cy1 (inclusive), indexed [cx - cx0, cy - cy0].
+        """
+        window = np.zeros((cx1 - cx0 + 1, cy1 - cy0 + 1), dtype=self.dtype)
+        for px in range(cx0 // PAGE_SIZE, cx1 // PAGE_SIZE + 1):
+            for py in range(cy0 // PAGE_SIZE, cy1 // PAGE_SIZE + 1):
+                page = self._page(px, py)
+                if page is None:
+                    continue
+                x0, y0 = max(cx0, px * PAGE_SIZE), max(cy0, py * PAGE_SIZE)
+                x1, y1 = min(cx1, (px + 1) * PAGE_SIZE - 1), min(cy1, (py + 1) * PAGE_SIZE - 1)
+                window[x0 - cx0:x1 - cx0 + 1, y0 - cy0:y1 - cy0 + 1] = \
+                    page[x0 - px * PAGE_SIZE:x1 - px * PAGE_SIZE + 1, y0 - py * PAGE_SIZE:y1 - py * PAGE_SIZE + 1]
+        return window
+
+    def flush(self):
+        with self._lock:
+            for page in self._pages.values():
+                page.flush()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._pages.clear()
+
+    def page_count(self):
+        return sum(1 for name in os.listdir(self.directory) if name.startswith("page_"))
+
+    # --- Updates ---
+
+    def channel_of(self, name):
+        if (name or "").startswith("tree"):
+            return self._channel_index.get("tree", -1)
+        return self._channel_index.get(name, -1)
+
+    def record_scan(self, records, center_x, center_y, radius, tick):
+        """
+        Folds one scan of the square around (center_x, center_y) into the map. Chunks the square
+        covers completely get their resource totals replaced by what the scan saw; chunks it only
+        touches are marked partly explored and keep the larger of the old and the seen totals, so
+        a rescan never counts the same entity twice. Records need "name", "x", "y" and "amount".
+        """
+        xs = np.fromiter((r["x"] for r in records), dtype=np.float64, count=len(records))
+        ys = np.fromiter((r["y"] for r in records), dtype=np.float64, count=len(records))
+        channel = np.fromiter((self.channel_of(r.get("name")) for r in records), dtype=np.int64, count=len(records))
+        amounts = np.fromiter((r.get("amount") or 0 for r in records), dtype=np.float64, count=len(records))
+        self._record_arrays(xs, ys, channel, amounts, center_x, center_y, radius, tick)
+
+    def record_columns(self, columns, center_x, center_y, radius, tick):
+        """
+        record_scan() reading an EntityColumns store's arrays directly, without building records.
+        """
+        channel_by_id = np.array([self.channel_of(name) for name in columns.names.names] or [-1], dtype=np.int64)
+        data = columns.data
+        self._record_arrays(data["x"].astype(np.float64), data["y"].astype(np.float64), channel_by_id[data["name_id"]],
+                            data["amount"].astype(np.float64), center_x, center_y, radius, tick)
+
+    def _record_arrays(self, xs, ys, channel, amounts, center_x, center_y, radius, tick):
+        min_cx, min_cy = math.floor((center_x - radius) / CHUNK_SIZE), math.floor((center_y - radius) / CHUNK_SIZE)
+        max_cx, max_cy = math.floor((center_x + radius) / CHUNK_SIZE), math.floor((center_y + radius) / CHUNK_SIZE)
+        width, height = max_cx - min_cx + 1, max_cy - min_cy + 1
+        channels = len(self.channels)
+        amount = np.zeros((width, height, channels), dtype=np.float64)
+        tiles = np.zeros((width, height, channels), dtype=np.int64)
+
+        if len(xs):
+            # Entities without an amount (trees) count one each, so their total is a count
+            amounts = np.where(amounts > 0, amounts, 1.0)
+            ix = np.floor(xs / CHUNK_SIZE).astype(np.int64) - min_cx
+            iy = np.floor(ys / CHUNK_SIZE).astype(np.int64) - min_cy
+            keep = (channel >= 0) & (ix >= 0) & (ix < width) & (iy >= 0) & (iy < height)
+            np.add.at(amount, (ix[keep], iy[keep], channel[keep]), amounts[keep])
+            np.add.at(tiles, (ix[keep], iy[keep], channel[keep]), 1)
+        np.minimum(tiles, np.iinfo(np.uint16).max, out=tiles)
+
+        # Chunks whose whole area lies inside the scanned square
+        cxs = np.arange(min_cx, max_cx + 1)
+        cys = np.arange(min_cy, max_cy + 1)
+        full_x = (cxs * CHUNK_SIZE >= center_x - radius) & ((cxs + 1) * CHUNK_SIZE <= center_x + radius)
+        full_y = (cys * CHUNK_SIZE >= center_y - radius) & ((cys + 1) * CHUNK_SIZE <= center_y + radius)
+        full = full_x[:, None] & full_y[None, :]
+
+        with self._lock:
+            for px in range(min_cx // PAGE_SIZE, max_cx // PAGE_SIZE + 1):
+                for py in range(min_cy // PAGE_SIZE, max_cy // PAGE_SIZE + 1):
+                    page = self._page(px, py, create=True)
+                    x0, y0 = max(min_cx, px * PAGE_SIZE), max(min_cy, py * PAGE_SIZE)
+                    x1, y1 = min(max_cx, (px + 1) * PAGE_SIZE - 1), min(max_cy, (py + 1) * PAGE_SIZE - 1)
+                    cells = page[x0 - px * PAGE_SIZE:x1 - px * PAGE_SIZE + 1, y0 - py * PAGE_SIZE:y1 - py * PAGE_SIZE + 1]
+                    sx, sy = slice(x0 - min_cx, x1 - min_cx + 1), slice(y0 - min_cy, y1 - min_cy + 1)
+                    is_full = full[sx, sy]
+                    seen_amount, seen_tiles = amount[sx, sy], tiles[sx, sy]
+                    cells["amount"] = np.where(is_full[..., None], seen_amount, np.maximum(cells["amount"], seen_amount))
+                    cells["tiles"] = np.where(is_full[..., None], seen_tiles, np.maximum(cells["tiles"], seen_tiles))
+                    cells["explored"] = np.maximum(cells["explored"], np.where(is_full, SCANNED, PARTIAL))
+                    cells["last_seen"] = tick
+
+    # --- Queries ---
+
+    @staticmethod
+    def chunk_center(cx, cy):
+        return (cx * CHUNK_SIZE + CHUNK_SIZE / 2, cy * CHUNK_SIZE + CHUNK_SIZE / 2)
+
+    def cell(self, x, y):
+        """
+        The cell holding tile position (x, y) as a dict.
+        """
+        cx, cy = math.floor(x / CHUNK_SIZE), math.floor(y / CHUNK_SIZE)
+        with self._lock:
+            cell = self._window(cx, cy, cx, cy)[0, 0]
+        return {"chunk": (cx, cy), "explored": int(cell["explored"]), "last_seen": int(cell["last_seen"]),
+                "amount": {name: float(cell["amount"][i]) for i, name in enumerate(self.channels) if cell["amount"][i]}}
+
+    def _distances(self, cx0, cy0, cx1, cy1, x, y):
+        centers_x = (np.arange(cx0, cx1 + 1) + 0.5) * CHUNK_SIZE - x
+        centers_y = (np.arange(cy0, cy1 + 1) + 0.5) * CHUNK_SIZE - y
+        return np.hypot(centers_x[:, None], centers_y[None, :])
+
+    def nearest_unexplored(self, x, y, max_radius=4096, below=SCANNED):
+        """
+        Center (x, y) and distance of the chunk nearest to (x, y) whose explored state is below
+        `below` (default: not fully scanned yet), or None within `max_radius` tiles. Searches a
+        window that doubles in size until the best candidate is closer than the window's edge.
+        """
+        ocx, ocy = math.floor(x / CHUNK_SIZE), math.floor(y / CHUNK_SIZE)
+        half = 4
+        max_half = int(max_radius // CHUNK_SIZE) + 1
+        with self._lock:
+            while True:
+                half = min(half, max_half)
+                window = self._window(ocx - half, ocy - half, ocx + half, ocy + half)
+                distances = self._distances(ocx - half, ocy - half, ocx + half, ocy + half, x, y)
+                distances[window["explored"] >= below] = np.inf
+                best = np.unravel_index(np.argmin(distances), distances.shape)
+                distance = distances[best]
+                # Every chunk outside the window is at least `half` chunks away from the origin chunk.
+                if distance <= half * CHUNK_SIZE or half >= max_half:
+                    if not np.isfinite(distance) or distance > max_radius:
+                        return None
+                    cx, cy = ocx - half + int(best[0]), ocy - half + int(best[1])
+                    center = self.chunk_center(cx, cy)
+                    return {"chunk": (cx, cy), "x": center[0], "y": center[1], "distance": float(distance)}
+                half *= 2
+
+    def densest(self, name, x, y, radius, k=1):
+        """
+        Up to k chunks within `radius` tiles of (x, y) holding the most of resource `name`, richest
+        first: [{"chunk", "x", "y" (chunk center), "amount", "tiles", "distance", "last_seen"}].
+        """
+        channel = self.channel_of(name)
+        if channel < 0:
+            return []
+        cx0, cy0 = math.floor((x - radius) / CHUNK_SIZE), math.floor((y - radius) / CHUNK_SIZE)
+        cx1, cy1 = math.floor((x + radius) / CHUNK_SIZE), math.floor((y + radius) / CHUNK_SIZE)
+        with self._lock:
+            window = self._window(cx0, cy0, cx1, cy1)
+        amount = window["amount"][..., channel].astype(np.float64)
+        distances = self._distances(cx0, cy0, cx1, cy1, x, y)
+        amount[(distances > radius) | (amount <= 0)] = 0
+        flat = np.argsort(-amount, axis=None, kind="stable")[:k]
+        found = []
+        for index in flat:
+            ix, iy = np.unravel_index(index, amount.shape)
+            if amount[ix, iy] <= 0:
+                break
+            center = self.chunk_center(cx0 + int(ix), cy0 + int(iy))
+            found.append({"chunk": (cx0 + int(ix), cy0 + int(iy)), "x": center[0], "y": center[1], "amount": float(amount[ix, iy]),
+                          "tiles": int(window["tiles"][ix, iy, channel]), "distance": round(float(distances[ix, iy]), 1),
+                          "last_seen": int(window["last_seen"][ix, iy])})
+        return found
+
+    def explored_fraction(self, x, y, radius):
+        """
+        Share of the chunks within `radius` tiles of (x, y) that were fully scanned.
+        """
+        cx0, cy0 = math.floor((x - radius) / CHUNK_SIZE), math.floor((y - radius) / CHUNK_SIZE)
+        cx1, cy1 = math.floor((x + radius) / CHUNK_SIZE), math.floor((y + radius) / CHUNK_SIZE)
+        with self._lock:
+            window = self._window(cx0, cy0, cx1, cy1)
+        inside = self._distances(cx0, cy0, cx1, cy1, x, y) <= radius
+        total = int(inside.sum())
+        return float((window["explored"][inside] == SCANNED).sum()) / total if total else 0.0
@@ -0,0 +1,235 @@
+import math
+import time
+
+import numpy as np
+
+from metrics import registry as metrics
+from recipe_graph import RecipeGraph
+
+WOOD_ITEM = "wood"
+CHUNK_SIZE = 32
+RESOURCE_REACH = 2.7 # Tiles a character mines resources from; being this close costs no walking
+DIAGONAL_EXTRA = math.sqrt(2) - 1
+FAILURE_PENALTY = 48.0 # Path cost added to a target per recent failed action on it
+FAILURE_MEMORY = 300.0 # Seconds a failed target stays penalized
+
+
+def item_of(resource_name):
+    """
+    The item mining an entity called `resource_name` yields (trees give wood).
+    """
+    return WOOD_ITEM if resource_name.startswith("tree") else resource_name
+
+
+def _position(record):
+    position = record.get("position") or {}
+    return float(record.get("x", position.get("x", 0))), float(record.get("y", position.get("y", 0)))
+
+
+def path_costs(px, py, boxes):
+    """
+    Walking cost from (px, py) to the nearest point of each box ((n, 4) array of min_x, min_y,
+    max_x, max_y): the octile distance a character moving on the tile grid covers, minus the
+    mining reach.
+    """
+    dx = np.maximum(np.maximum(boxes[:, 0] - px, px - boxes[:, 2]), 0.0)
+    dy = np.maximum(np.maximum(boxes[:, 1] - py, py - boxes[:, 3]), 0.0)
+    octile = np.maximum(dx, dy) + DIAGONAL_EXTRA * np.minimum(dx, dy)
+    return np.maximum(octile - RESOURCE_REACH, 0.0)
+
+
+def score_candidates(px, py, boxes, amounts, needed, penalties, amount_weight=4.0):
+    """
+    Cost of every candidate in one batch (lower is better): path cost plus penalties, minus a
+    bonus that grows with the log of how many of the needed units the candidate holds, so a
+    patch that covers the whole need beats a slightly closer tile that runs out.
+    Returns (costs, path_costs).
+    """
+    paths = path_costs(px, py, boxes) + penalties
+    covered = np.minimum(amounts, needed) / np.maximum(needed, 1.0)
+    return paths - amount_weight * np.log1p(covered * 9.0), paths
+
+
+class LocalPolicy:
+    """
+    Decision policy that answers routine gathering steps itself and hands everything else to
+    `fallback` (normally GeminiAgent), which has the same decide_next_action() interface.
+
+    The crafting plan for the goal decides which raw resources are still needed. Every visible
+    entity, resource patch and remembered dense chunk of those is scored in one NumPy batch by
+    path cost, amount and recent failures (score_candidates). The best one becomes a MINE (or,
+    for a remembered chunk, a MOVE) decision if the policy is confident enough. Escalation rules
+    (all configurable):
+      - the plan has no raw material left to gather (crafting is a strategic decision);
+      - confidence (CONFIDENCE_SCALE / (CONFIDENCE_SCALE + path cost)) is below `min_confidence`,
+        i.e. the best target is far away, or several attempts on it failed;
+      - `max_failures` local decisions in a row failed;
+      - every `llm_every`-th decision (0 = never), so the model still reviews the strategy.
+    """
+
+    CONFIDENCE_SCALE = 32.0
+
+    def __init__(self, fallback=None, goal_item="iron-gear-wheel", goal_quantity=10, min_confidence=0.25, llm_every=0,
+                 max_failures=3, amount_weight=4.0):
+        self.fallback = fallback
+        self.goal_item = getattr(fallback, "goal_item", goal_item)
+        self.goal_quantity = getattr(fallback, "goal_quantity", goal_quantity)
+        self.min_confidence = min_confidence
+        self.llm_every = llm_every
+        self.max_failures = max_failures
+        self.amount_weight = amount_weight
+        self.stats = {"local": 0, "escalated": 0}
+        self.consecutive_failures = 0
+        self._failed = {} # target key -> (failures, last failure time)
+        self._recipe_graph = None
+        self._recipe_graph_source = None
+
+    @property
+    def decision_cache(self):
+        return getattr(self.fallback, "decision_cache", None)
+
+    def recipe_graph(self, known_recipes_dict):
+        if self.fallback is not None and hasattr(self.fallback, "recipe_graph"):
+            return self.fallback.recipe_graph(known_recipes_dict)
+        if self._recipe_graph is None or self._recipe_graph_source is not known_recipes_dict:
+            self._recipe_graph = RecipeGraph(known_recipes_dict or {})
+            self._recipe_graph_source = known_recipes_dict
+        return self._recipe_graph
+
+    # --- Outcome feedback (called by AgentLoop after each action) ---
+
+    @staticmethod
+    def target_key(decision):
+        params = (decision or {}).get("parameters") or {}
+        if decision.get("action") == "MINE":
+            if params.get("patch_id") is not None:
+                return f"patch:{params['patch_id']}"
+            if params.get("target_entity_id") is not None:
+                return f"unit:{params['target_entity_id']}"
+            return f"name:{params.get('target_name')}"
+        if decision.get("action") == "MOVE":
+            return f"chunk:{math.floor(float(params.get('x', 0)) / CHUNK_SIZE)},{math.floor(float(params.get('y', 0)) / CHUNK_SIZE)}"
+        return None
+
+    def record_result(self, decision, succeeded):
+        if not (decision or {}).get("local"):
+            return
+        key = self.target_key(decision)
+        if succeeded:
+            self.consecutive_failures = 0
+            self._failed.pop(key, None)
+            return
+        self.consecutive_failures += 1
+        failures, _ = self._failed.get(key, (0, 0.0))
+        self._failed[key] = (failures + 1, time.time())
+
+    def _penalty(self, key, now):
+        failures, when = self._failed.get(key, (0, 0.0))
+        if failures and now - when > FAILURE_MEMORY:
+            del self._failed[key]
+            return 0.0
+        return failures * FAILURE_PENALTY
+
+    # --- Decisions ---
+
+    def candidates(self, nearby_entities, needed):
+        """
+        Targets for the needed items as (boxes, amounts, needs, decisions): patches, entities of
+        resources without a patch (trees, single rocks) and remembered dense chunks.
+        """
+        nearby_entities = nearby_entities or {}
+        boxes, amounts, needs, decisions = [], [], [], []
+
+        def add(box, amount, item, decision):
+            boxes.append(box)
+            amounts.append(amount)
+            needs.append(needed[item])
+            decisions.append(decision)
+
+        patched = set()
+        for patch in nearby_entities.get("patches") or []:
+            item = item_of(patch.get("name") or "")
+            if item not in needed:
+                continue
+            patched.add(patch["name"])
+            add(patch["bbox"], patch.get("amount") or 0, item,
+                {"action": "MINE", "parameters": {"patch_id": patch["patch_id"], "quantity": needed[item]},
+                 "reasoning": f"Need {needed[item]} more {item}; mining patch {patch['patch_id']} ({patch.get('tiles')} tiles)."})
+
+        seen = set()
+        for entity in (nearby_entities.get("entities") or []) + (nearby_entities.get("known") or []):
+            name = entity.get("name") or ""
+            item = item_of(name)
+            key = entity.get("key") or entity.get("unit_number") or _position(entity)
+            if item not in needed or name in patched or key in seen:
+                continue
+            seen.add(key)
+            x, y = _position(entity)
+            params = {"target_entity_id": entity.get("unit_number"), "target_name": name, "quantity": needed[item]}
+            add((x - 0.5, y - 0.5, x + 0.5, y + 0.5), entity.get("amount") or 1, item,
+                {"action": "MINE", "parameters": params, "reasoning": f"Need {needed[item]} more {item}; mining the best {name} in sight."})
+
+        exploration = nearby_entities.get("exploration") or {}
+        for name, chunk in (exploration.get("densest") or {}).items():
+            item = item_of(name)
+            if item not in needed or name in patched:
+                continue
+            cx, cy = chunk["chunk"]
+            add((cx * CHUNK_SIZE, cy * CHUNK_SIZE, (cx + 1) * CHUNK_SIZE, (cy + 1) * CHUNK_SIZE), chunk.get("amount") or 0, item,
+                {"action": "MOVE", "parameters": {"x": chunk["x"], "y": chunk["y"]},
+                 "reasoning": f"Need {needed[item]} more {item}; none in sight, going to the densest remembered {name} chunk."})
+        return boxes, amounts, needs, decisions
+
+    def choose(self, game_state, nearby_entities, needed):
+        """
+        Returns (decision, confidence) for the best-scoring target, or (None, 0.0) without candidates.
+        """
+        boxes, amounts, needs, decisions = self.candidates(nearby_entities, needed)
+        if not decisions:
+            return None, 0.0
+        position = game_state.get("position") or {}
+        px, py = float(position.get("x", 0)), float(position.get("y", 0))
+        now = time.time()
+        penalties = np.array([self._penalty(self.target_key(d), now) for d in decisions], dtype=np.float64)
+        costs, paths = score_candidates(px, py, np.asarray(boxes, dtype=np.float64), np.asarray(amounts, dtype=np.float64),
+                                        np.asarray(needs, dtype=np.float64), penalties, self.amount_weight)
+        best = int(np.argmin(costs))
+        confidence = self.CONFIDENCE_SCALE / (self.CONFIDENCE_SCALE + float(paths[best]))
+        return decisions[best], confidence
+
+    def _escalate(self, reason, game_state, nearby_entities, known_recipes_dict):
+        self.stats["escalated"] += 1
+        metrics.inc("local_policy_decisions_total", outcome="escalated", reason=reason)
+        print(f"LocalPolicy: escalating to the model ({reason}).")
+        if self.fallback is None:
+            return None
+        return self.fallback.decide_next_action(game_state, nearby_entities, known_recipes_dict)
+
+    def decide_next_action(self, game_state, nearby_entities, known_recipes_dict):
+        if not game_state:
+            return None
+        decisions = self.stats["local"] + self.stats["escalated"] + 1
+        if self.llm_every and decisions % self.llm_every == 0:
+            return self._escalate("review", game_state, nearby_entities, known_recipes_dict)
+        if self.max_failures and self.consecutive_failures >= self.max_failures:
+            self.consecutive_failures = 0
+            return self._escalate("failures", game_state, nearby_entities, known_recipes_dict)
+
+        inventory = game_state.get("inventory")
+        if not isinstance(inventory, dict):
+            inventory = {}
+        plan = self.recipe_graph(known_recipes_dict).plan(self.goal_item, self.goal_quantity, inventory)
+        needed = {item: int(math.ceil(amount)) for item, amount in plan["raw"].items() if amount > 0}
+        if not needed:
+            return self._escalate("strategic", game_state, nearby_entities, known_recipes_dict)
+
+        decision, confidence = self.choose(game_state, nearby_entities, needed)
+        if decision is None:
+            return self._escalate("no_target", game_state, nearby_entities, known_recipes_dict)
+        if confidence < self.min_confidence:
+            return self._escalate("low_confidence", game_state, nearby_entities, known_recipes_dict)
+        self.stats["local"] += 1
+        metrics.inc("local_policy_decisions_total", outcome="local", reason=decision["action"].lower())
+        decision["local"] = True
+        decision["reasoning"] += f" (local policy, confidence {confidence:.2f})"
+        return decision
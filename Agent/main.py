@@ -1,76 +1,138 @@
+import asyncio
+import copy
+import datetime
 import json
-import re
+import threading
 import time
 import os
-from mcrcon import MCRcon
-import google.generativeai as genai
+try:
+    import google.generativeai as genai
+except ImportError: # Only needed by GeminiAgent; the RCON client and loop work without it
+    genai = None
+from rcon import AsyncFactorioRCONClient, RCONConnectionPool, extract_json, parse_json_response
+from world_model import WorldModel
+from exploration_map import ExplorationMap
+from entity_store import EntityColumns, NameTable
+from recipe_graph import RecipeGraph
+from recipe_cache import RecipeCache
+from decision_cache import DecisionCache, fingerprint_state
+from pipeline import AgentLoop
+from local_policy import LocalPolicy
+from agent_pool import AgentPool, parse_actors
+from metrics import SIZE_BUCKETS, registry as metrics
+from prompt_builder import PromptBuilder
+from session_trace import ReplayModel, ReplayRCONClient, ReplaySource, TraceWriter
 
 class FactorioRCONClient:
-    def __init__(self, host, port, password):
+    """
+    Blocking facade over AsyncFactorioRCONClient. The async client runs on a private event loop
+    in a background thread, so callers on several threads can have requests in flight at once.
+
+    Mod actions act on `player_index` / `unit_number` when set (the mod defaults to player 1).
+    for_actor() returns a client for another bot that shares the connections and event loop.
+    `async_client` replaces the network client (e.g. session_trace.ReplayRCONClient), and
+    `sleep` is what polling and retry waits call, so a replay can skip them.
+    """
+    def __init__(self, host, port, password, timeout=10.0, pool_size=1, player_index=None, unit_number=None, async_client=None):
         self.host = host
         self.port = port
         self.password = password
-        self.rcon = MCRcon(self.host, self.password, port=self.port)
-        self._is_connected = False
+        self.sleep = time.sleep
+        if async_client is not None:
+            self._async_client = async_client
+        elif pool_size > 1:
+            self._async_client = RCONConnectionPool(self.host, self.port, self.password, size=pool_size, timeout=timeout)
+        else:
+            self._async_client = AsyncFactorioRCONClient(self.host, self.port, self.password, timeout=timeout)
+        self._root = self # Owner of the event loop; bot clients from for_actor() point at it
+        self._loop = None
+        self._loop_thread = None
+        self.player_index = player_index
+        self.unit_number = unit_number
+        self._scan_token = None
+        self._scan_columns = None
+        self.last_scan_delta = None # What the last delta scan changed (EntityColumns.apply_delta), None after a full scan
+        self.entity_names = NameTable() # Name interning for this client's columnar scan results
+
+    def for_actor(self, player_index=None, unit_number=None):
+        """
+        Returns a client for another player or vehicle that shares this client's RCON connections
+        and event loop but keeps its own delta-scan state.
+        """
+        bot = copy.copy(self)
+        bot.player_index = player_index
+        bot.unit_number = unit_number
+        bot._scan_token = None
+        bot._scan_columns = None
+        bot.last_scan_delta = None
+        bot._loop = None
+        bot._loop_thread = None
+        bot.entity_names = NameTable()
+        return bot
+
+    def actor_params(self, params=None):
+        """
+        Adds this client's player_index / unit_number to a mod action's params.
+        """
+        merged = {}
+        if self.player_index is not None:
+            merged["player_index"] = self.player_index
+        if self.unit_number is not None:
+            merged["unit_number"] = self.unit_number
+        if params:
+            merged.update(params)
+        return merged or params
+
+    @property
+    def async_client(self):
+        return self._async_client
+
+    @property
+    def is_connected(self):
+        return self._async_client.is_connected
+
+    def _run(self, coro):
+        root = self._root
+        if root._loop is None:
+            root._loop = asyncio.new_event_loop()
+            root._loop_thread = threading.Thread(target=root._loop.run_forever, name="rcon-loop", daemon=True)
+            root._loop_thread.start()
+        return asyncio.run_coroutine_threadsafe(coro, root._loop).result()
 
     def connect(self):
         try:
-            self.rcon.connect()
-            self._is_connected = True
+            self._run(self._async_client.connect())
             print(f"Successfully connected to Factorio server at {self.host}:{self.port}")
         except Exception as e:
-            self._is_connected = False
             print(f"Failed to connect to RCON: {e}")
             raise
 
     def disconnect(self):
+        if self._root is not self: # Connections belong to the client for_actor() was called on
+            return
         try:
-            self.rcon.disconnect()
-            self._is_connected = False
+            self._run(self._async_client.disconnect())
             print("Disconnected from RCON.")
         except Exception as e:
             print(f"Error during RCON disconnect: {e}")
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join(timeout=5)
+            self._loop.close()
+            self._loop = None
+            self._loop_thread = None
 
     def _parse_json_from_response(self, raw_response):
-        if not raw_response:
-            print("Received empty response from RCON.")
-            return None
-        # Try to find JSON within the string, accommodating potential prefixes/suffixes from Factorio console
-        # Matches {...} or [...]
-        json_match = re.search(r'(\{.*\})|(\[.*\])', raw_response)
-        if json_match:
-            json_str = json_match.group(0)
-            try:
-                data = json.loads(json_str)
-                return data
-            except json.JSONDecodeError as e:
-                print(f"Failed to decode JSON: {e}")
-                print(f"Received string that failed parsing: '{json_str}'")
-                print(f"Full raw response for context: '{raw_response}'")
-                return None
-        else:
-            print(f"Could not find valid JSON in RCON response: '{raw_response}'")
-            return None
+        return parse_json_response(raw_response)
 
     def _execute_command(self, command):
-        if not self._is_connected:
-            print("RCON not connected. Attempting to reconnect...")
-            try:
-                self.connect()
-            except Exception as e:
-                    raise ConnectionError(f"RCON reconnection failed: {e}")
-
         try:
             # print(f"Sending RCON command: {command}") # Verbose
-            response = self.rcon.command(command)
+            response = self._run(self._async_client.command(command))
             # print(f"Raw RCON response: {response}") # Verbose
             return response
         except Exception as e:
             print(f"Error executing RCON command '{command}': {e}")
-            self._is_connected = False # Assume connection is lost on error
-            # Attempt to determine if the connection was lost
-            if "Broken pipe" in str(e) or "Connection reset" in str(e) or "Not connected" in str(e) or "Socket is not connected" in str(e):
-                print("Connection lost. Will attempt to reconnect on next command.")
             raise
 
     def _execute_lua_call(self, function_name, params=None):
@@ -78,36 +140,16 @@ class FactorioRCONClient:
         Helper to execute a remote.call to a Lua function in the mod.
         Ensures the call is wrapped with game.print for output and handles parameter formatting.
         """
-        param_str = ""
-        if params is not None:
-            # Basic Lua table representation for simple dicts/lists
-            # For more complex structures, a proper Lua serializer might be needed on Python side,
-            # or pass as JSON string and have Lua parse it (if Lua has JSON lib).
-            # Current Lua mod expects simple {x=number, y=number} table for start_pathfinding_to.
-            if isinstance(params, dict):
-                parts = []
-                for k, v in params.items():
-                    if isinstance(v, str):
-                        parts.append(f'{k}="{v}"') # Basic string quoting
-                    else:
-                        parts.append(f'{k}={v}') # Numbers, booleans
-                param_str = ", {" + ", ".join(parts) + "}"
-            else: # Should not happen with current functions
-                print(f"Warning: Unsupported parameter type for Lua call: {type(params)}")
-
-
-        lua_command = f'game.print(remote.call("factorio_autonomo_bot", "{function_name}"{param_str}))'
-        rcon_command = f"/sc {lua_command}" # /silent-command
+        return self._run(self._async_client.call_lua(function_name, self.actor_params(params)))
 
-        try:
-            raw_response = self._execute_command(rcon_command)
-            return self._parse_json_from_response(raw_response)
-        except ConnectionError as e:
-            print(f"RCON Connection error during Lua call '{function_name}': {e}")
-            return None
-        except Exception as e:
-            print(f"An unexpected error occurred during Lua call '{function_name}': {e}")
-            return None
+    def call_many(self, calls):
+        """
+        Runs several mod actions in a single RCON round trip via the mod's `batch` remote function.
+        `calls` is a list of (request_id, function_name, params) tuples; params may be None.
+        Returns a dict mapping each request_id to its decoded result (None if it is missing).
+        """
+        calls = [(request_id, function_name, self.actor_params(params)) for request_id, function_name, params in calls]
+        return self._run(self._async_client.call_many(calls))
 
     def get_player_info(self):
         return self._execute_lua_call("get_player_info")
@@ -125,36 +167,237 @@ class FactorioRCONClient:
         """
         return self._execute_lua_call("get_movement_status")
 
-    def scan_area(self, radius):
+    def poll_events(self, since=0):
+        """
+        Drains the mod's event queue: returns {"events": [...], "cursor": int} with every event
+        whose id is greater than `since`.
+        """
+        return self._execute_lua_call("poll_events", {"since": since})
+
+    def wait_for_event(self, match, since=0, timeout=120, min_interval=0.05, max_interval=1.0):
+        """
+        Long-polls the mod's event queue until `match(event)` is true for an event after `since`.
+        Returns (event, cursor); event is None on timeout or if polling failed. The poll interval
+        starts at `min_interval`, backs off up to `max_interval` while nothing happens and resets
+        whenever new events arrive, so completion is noticed within one short poll.
+        """
+        deadline = time.time() + timeout
+        interval = min_interval
+        while time.time() < deadline:
+            response = self.poll_events(since)
+            if not response:
+                return None, since
+            events = response.get("events", [])
+            since = response.get("cursor", since)
+            for event in events:
+                if match(event):
+                    return event, since
+            interval = min_interval if events else min(interval * 2, max_interval)
+            metrics.inc("agent_sleep_seconds_total", interval, reason="event_poll")
+            self.sleep(interval)
+        return None, since
+
+    def wait_for_movement(self, vehicle_key, since=0, timeout=120, min_interval=0.05, max_interval=1.0):
+        """
+        Waits until the pathfinding state machine reports that `vehicle_key` finished (IDLE) or failed (PATH_FAILED).
+        """
+        def finished(event):
+            return (event.get("type") == "pf_state" and str(event.get("vehicle_key")) == str(vehicle_key)
+                    and event.get("state") in ("IDLE", "PATH_FAILED"))
+        event, cursor = self.wait_for_event(finished, since, timeout, min_interval, max_interval)
+        if event is None:
+            return {"destination_reached": False, "state": "TIMEOUT", "cursor": cursor}
+        return {"destination_reached": event.get("state") == "IDLE", "state": event.get("state"), "tick": event.get("tick"), "cursor": cursor}
+
+    def wait_for_mining(self, since=0, timeout=15, player_index=None):
+        """
+        Waits for the mod's "player_mined_item" event for this client's player after `since`.
+        """
+        player_index = player_index or self.player_index or 1
+        def mined(event):
+            return event.get("type") == "player_mined_item" and event.get("player_index", player_index) == player_index
+        event, cursor = self.wait_for_event(mined, since, timeout)
+        if event is None:
+            return {"mined": False, "state": "TIMEOUT", "cursor": cursor}
+        return {"mined": True, "item": event.get("item"), "count": event.get("count"), "tick": event.get("tick"), "cursor": cursor}
+
+    def scan_area(self, radius, delta=False):
         """
         Scans the area around the player for entities.
+        With delta=True only changes since the previous delta scan are transferred (as numeric
+        columns) and merged into a client-side EntityColumns store, which is returned.
         """
-        return self._execute_lua_call("scan_nearby_entities", {"radius": radius})
+        response = self._execute_lua_call("scan_nearby_entities", self.scan_params(radius, delta))
+        return self.apply_scan_result(response) if delta else response
 
-    def get_recipes(self):
+    def scan_params(self, radius, delta=True):
+        """
+        Parameters for scan_nearby_entities, including the current delta token if there is one.
+        Useful when the scan is issued as part of a call_many batch.
         """
-        Retrieves all unlocked recipes for the player's force.
+        params = {"radius": radius}
+        if delta:
+            params["delta"] = True
+            params["format"] = "columns"
+            if self._scan_token is not None:
+                params["token"] = self._scan_token
+        return params
+
+    def apply_scan_result(self, response):
         """
-        return self._execute_lua_call("get_all_unlocked_recipes")
+        Merges a delta scan response into the client-side EntityColumns store and returns it.
+        Errors are passed through and force a full scan next time. last_scan_delta tells which
+        rows the response touched (None when it replaced the whole store).
+        """
+        if not response or "error" in response or "token" not in response:
+            self._scan_token = None
+            return response
+        if response.get("full") or self._scan_columns is None:
+            self._scan_columns = EntityColumns.from_wire(response.get("entities", {}), self.entity_names)
+            self.last_scan_delta = None
+        else:
+            self.last_scan_delta = self._scan_columns.apply_delta(response.get("added"), response.get("changed"), response.get("removed"))
+        self._scan_token = response["token"]
+        return self._scan_columns
 
+    def get_recipes(self, offset=None, limit=None):
+        """
+        Retrieves the unlocked recipes for the player's force: all of them, or `limit` starting
+        after `offset` ({"recipes", "offset", "total", "next"}; "next" is missing after the last page).
+        """
+        params = {"offset": offset, "limit": limit} if limit is not None else None
+        return self._execute_lua_call("get_all_unlocked_recipes", params)
 
-    def mine_target_entity(self, entity_id):
+    def get_recipe_fingerprint(self):
         """
-        Commands the player to mine the entity with the given unit_number.
+        Cheap identity of the force's recipe set: {"fingerprint", "epoch", "researched", ...}.
         """
-        if entity_id is None:
-            print("RCONClient Error: entity_id cannot be None for mine_target_entity.")
-            return {"status": "error", "message": "entity_id was None"}
-        return self._execute_lua_call("mine_target_entity", {"unit_number": entity_id})
+        return self._execute_lua_call("get_recipe_fingerprint")
+
+
+    def mine_target_entity(self, entity_id=None, position=None, name=None):
+        """
+        Commands the player to mine the entity with the given unit_number, or, for entities that
+        have none (resources, trees), the entity named `name` at `position` (x, y).
+        """
+        if entity_id is not None:
+            return self._execute_lua_call("mine_target_entity", {"target_unit_number": entity_id})
+        if position is None:
+            print("RCONClient Error: mine_target_entity needs an entity_id or a position.")
+            return {"status": "error", "message": "entity_id and position were None"}
+        return self._execute_lua_call("mine_target_entity", {"x": position[0], "y": position[1], "target_name": name})
+
+    def enqueue_actions(self, actions, append=False):
+        """
+        Hands the mod a list of actions to run tick by tick, e.g.
+        [{"type": "walk", "x": 10, "y": 5}, {"type": "mine", "name": "iron-ore", "count": 20, "x": 12, "y": 5}].
+        Replaces the actor's running queue unless `append` is set. The response carries the
+        job_id and the event_cursor to pass to wait_for_action_queue().
+        """
+        return self._execute_lua_call("enqueue_actions", {"actions": actions, "append": append})
+
+    def get_action_queue_status(self):
+        return self._execute_lua_call("get_action_queue_status")
+
+    def cancel_action_queue(self):
+        return self._execute_lua_call("cancel_action_queue")
+
+    def wait_for_action_queue(self, job_id, since=0, timeout=120):
+        """
+        Waits for the "action_queue_done" event of `job_id` and returns its summary
+        ({"state", "actions_done", "total", "mined": {item: count}, "message", "ticks"}), or
+        {"state": "TIMEOUT"} if it did not finish in time.
+        """
+        def done(event):
+            return event.get("type") == "action_queue_done" and event.get("job_id") == job_id
+        event, cursor = self.wait_for_event(done, since, timeout)
+        if event is None:
+            return {"state": "TIMEOUT", "cursor": cursor}
+        summary = dict(event)
+        summary["mined"] = event.get("mined") or {} # An empty Lua table arrives as []
+        summary["cursor"] = cursor
+        return summary
 
 class GeminiAgent:
-    def __init__(self, api_key):
-        if not api_key:
-            raise ValueError("Gemini API key not provided.")
-        genai.configure(api_key=api_key)
-        # Consider making model configurable e.g. 'gemini-1.5-flash' for speed/cost
-        self.model = genai.GenerativeModel('gemini-1.0-pro')
-        print("Gemini Agent initialized with gemini-1.0-pro.")
+    def __init__(self, api_key, goal_item="iron-gear-wheel", goal_quantity=10, decision_cache=None, model=None, trace=None,
+                 model_name="gemini-1.0-pro", token_budget=1200, context_cache_ttl=0):
+        self.prompts = PromptBuilder(goal_item, goal_quantity, token_budget=token_budget)
+        self.prefix_cached = False # True when the model holds the static instructions as cached content
+        if model is None:
+            if not api_key:
+                raise ValueError("Gemini API key not provided.")
+            if genai is None:
+                raise ValueError("google-generativeai is not installed (pip install -r requirements.txt).")
+            genai.configure(api_key=api_key)
+            model = self._cached_prefix_model(model_name, context_cache_ttl) if context_cache_ttl > 0 else None
+            if model is None:
+                model = genai.GenerativeModel(model_name)
+        self.model = model # Anything with generate_content(prompt) -> object with .text
+        self.trace = trace # Optional session_trace.TraceWriter recording prompts and responses
+        self.goal_item = goal_item
+        self.goal_quantity = goal_quantity
+        self._recipe_graph = None
+        self._recipe_graph_source = None
+        self.decision_cache = decision_cache # Optional DecisionCache; None disables caching
+        print(f"Gemini Agent initialized with {model_name}{' (instructions in context cache)' if self.prefix_cached else ''}.")
+
+    def _cached_prefix_model(self, model_name, ttl):
+        """
+        Puts the static prompt prefix into Gemini context caching and returns a model bound to it,
+        or None if the model or SDK version does not support caching (or the prefix is below the
+        model's minimum cacheable size).
+        """
+        try:
+            cached = genai.caching.CachedContent.create(model=model_name, system_instruction=self.prompts.static_prefix(),
+                                                        ttl=datetime.timedelta(seconds=ttl))
+            model = genai.GenerativeModel.from_cached_content(cached_content=cached)
+        except Exception as e:
+            print(f"Context caching unavailable for {model_name} ({e}); sending the instructions with every prompt.")
+            return None
+        self.prefix_cached = True
+        return model
+
+    def recipe_graph(self, known_recipes_dict):
+        """
+        Returns the RecipeGraph for the given recipes payload, rebuilding it only when the payload changes.
+        """
+        if self._recipe_graph is None or self._recipe_graph_source is not known_recipes_dict:
+            self._recipe_graph = RecipeGraph(known_recipes_dict or {})
+            self._recipe_graph_source = known_recipes_dict
+        return self._recipe_graph
+
+    def current_task(self, inventory, graph):
+        """
+        Derives the current task from the crafting plan for the goal: gather the most-needed raw
+        resource first, then craft the next step in order. Returns (description, plan).
+        """
+        plan = graph.plan(self.goal_item, self.goal_quantity, inventory)
+        raw_needed = plan["raw"]
+        if raw_needed:
+            item, amount = sorted(raw_needed.items(), key=lambda kv: (-kv[1], kv[0]))[0]
+            have = inventory.get(item, 0)
+            description = f"Current Task: Acquire at least {amount} more {item} (you have {have}). Still needed for {self.goal_quantity} {self.goal_item}: {raw_needed}."
+        elif plan["steps"]:
+            step = plan["steps"][0]
+            description = f"Current Task: All raw materials for {self.goal_quantity} {self.goal_item} are in hand. Next step: {step['crafts']}x {step['recipe']} ({step['category']})."
+        else:
+            description = f"Current Task: You already have {self.goal_quantity} {self.goal_item}. Consider expanding production."
+        return description, plan
+
+    @staticmethod
+    def _cached_decision_usable(decision, nearby_entities_list):
+        """
+        A cached MINE decision that names a specific entity or patch is only reused if it is still listed.
+        """
+        if decision.get("action") != "MINE":
+            return True
+        params = decision.get("parameters") or {}
+        if params.get("patch_id") is not None:
+            return any(p.get("patch_id") == params["patch_id"] for p in (nearby_entities_list or {}).get("patches", []))
+        target_id = params.get("target_entity_id")
+        if target_id is None:
+            return True
+        return any(e.get("unit_number") == target_id for e in (nearby_entities_list or {}).get("entities", []))
 
     def decide_next_action(self, game_state_dict, nearby_entities_list, known_recipes_dict):
         """
@@ -164,122 +407,60 @@ class GeminiAgent:
             print("GeminiAgent: Player game state not provided.")
             return None
 
-        # Prepare concise representations for the prompt
         inventory_summary = game_state_dict.get('inventory', {})
-        position_summary = game_state_dict.get('position', {})
-
-        # For recipes, sending all might be too much. For now, let's send a count.
-        # A better approach might be to let Gemini ask for specific recipe details if needed,
-        # or provide a way to query recipes based on item names.
-        # For this iteration, we'll include a snippet of recipes, e.g. for basic iron items.
-        recipes_summary_list = []
-        if known_recipes_dict and 'recipes' in known_recipes_dict:
-            recipes_summary_list.append(f"Total recipes known: {len(known_recipes_dict['recipes'])}.")
-            # Example: Find a few key recipes to include
-            for recipe in known_recipes_dict['recipes'][:5]: # Show first 5 for brevity
-                    recipes_summary_list.append(f"  - {recipe['name']}: Produces {[(p['name'], p['amount']) for p in recipe['products']]}")
-
-        recipes_summary = "\n".join(recipes_summary_list) if recipes_summary_list else "No recipes loaded."
-
-        # Define current task based on a simple logic for now
-        # This can be expanded into a more sophisticated task planner/state machine later
-
-        iron_ore_needed = 20
-        coal_needed_for_smelting = 10 # Assuming we'll need fuel
-
-        iron_ore_count = inventory_summary.get("iron-ore", 0)
-        coal_count = inventory_summary.get("coal", 0)
-
-        if iron_ore_count < iron_ore_needed:
-            current_task_description = f"Current Task: Acquire at least {iron_ore_needed} iron ore. You currently have {iron_ore_count}."
-        elif coal_count < coal_needed_for_smelting:
-            current_task_description = f"Current Task: Acquire at least {coal_needed_for_smelting} coal for smelting. You have {iron_ore_count} iron ore and {coal_count} coal."
-        else:
-            current_task_description = f"Current Task: You have {iron_ore_count} iron ore and {coal_count} coal. Consider next steps for iron plate production (e.g., finding a spot for furnaces, or gathering more resources if needed for building them, or crafting a furnace if possible)."
-
-        # Update entities summary to include amount if available
-        entities_prompt_list_updated = []
-        if nearby_entities_list and 'entities' in nearby_entities_list:
-            for entity in nearby_entities_list['entities'][:15]: # Limit to avoid excessive prompt length
-                amount_str = f", amount: {entity['amount']}" if 'amount' in entity else ""
-                entities_prompt_list_updated.append(f"- {entity['name']} at ({entity['position']['x']}, {entity['position']['y']}) id:{entity.get('unit_number', 'N/A')}{amount_str}")
-        entities_summary_updated = "\n".join(entities_prompt_list_updated) if entities_prompt_list_updated else "None visible"
-
-
-        prompt = f"""You are an AI agent playing Factorio.
-Overall Goal: Automate the production of iron gear wheels, which requires iron plates, which requires iron ore and coal.
-{current_task_description}
-
-Current Player State:
-Position: {position_summary}
-Inventory: {inventory_summary}
-Health: {game_state_dict.get('health')}
-Game Tick: {game_state_dict.get('tick')}
-
-Nearby Resources (max 15 shown, with their unique unit_number as 'id' and remaining 'amount' if applicable):
-{entities_summary_updated}
-
-Known Recipes (sample of first 5):
-{recipes_summary}
-
-Based on ALL this information, what is the single most important action to perform NEXT to achieve your CURRENT TASK and progress the OVERALL GOAL?
-Respond with ONLY a valid JSON object specifying the action and its parameters.
-Valid actions are:
-1. "MOVE": To move to a specific x, y coordinate.
-   Parameters: {{"x": float, "y": float}}
-   Use this if you need to get closer to resources or a strategic location.
-
-2. "MINE": To mine a target resource.
-   Parameters: {{"target_entity_id": int | null, "target_name": "resource-name" | null}}
-   - Provide `target_entity_id` if you see a specific resource entity in 'Nearby Resources' that you want to mine. Use its 'id' value. Consider its 'amount' if available.
-   - Provide `target_name` (e.g., "iron-ore", "coal", "stone", "tree") if you want to mine that type of resource but don't have a specific ID, or if the ID is not critical.
-   - If you specify `target_entity_id`, the agent will attempt to move to and mine that specific entity.
-   - If you only specify `target_name`, the agent will try to find the closest one from its scan.
-   Priority: Use `target_entity_id` if a suitable one is listed in 'Nearby Resources'.
-
-3. "CRAFT": To craft an item from a recipe. (Currently, the agent can only craft items that don't require a machine).
-   Parameters: {{"recipe_name": "recipe-internal-name", "quantity": int}}
-
-Example Response for MOVE to coordinates 123.5, -45.0:
-{{"action": "MOVE", "parameters": {{"x": 123.5, "y": -45.0}}, "reasoning": "Moving to a large iron ore patch spotted earlier."}}
-
-Example Response for MINE a specific iron ore entity with id 789 (which has 5000 ore remaining):
-{{"action": "MINE", "parameters": {{"target_entity_id": 789, "target_name": "iron-ore"}}, "reasoning": "Need iron ore for plates, and entity 789 is the closest rich iron ore patch."}}
-
-Example Response for MINE any nearby coal if no specific ID is crucial:
-{{"action": "MINE", "parameters": {{"target_entity_id": null, "target_name": "coal"}}, "reasoning": "Need coal for fuel."}}
-
-Example Response for CRAFT (e.g., a stone furnace, assuming it's a player-craftable recipe):
-{{"action": "CRAFT", "parameters": {{"recipe_name": "stone-furnace", "quantity": 1}}, "reasoning": "Need a furnace to smelt iron ore."}}
-
-Your decision must be strategic.
-- If you need a resource for your current task and it's listed in 'Nearby Resources', prefer 'MINE' with the `target_entity_id`. Choose richer patches (higher 'amount') if multiple options exist.
-- If you need a resource not immediately visible, you might need to 'MOVE' to a known location or explore.
-- Only 'CRAFT' if you have the ingredients and the item is essential for the current task.
-Ensure your response is ONLY the JSON object. No other text, explanations, or markdown formatting.
-"""
-        # print(f"\n--- Gemini Prompt (Refined Further) ---\n{prompt}\n--------------------") # Verbose debug
+        graph = self.recipe_graph(known_recipes_dict)
+
+        # The current task comes from the crafting plan for the goal
+        current_task_description, plan = self.current_task(inventory_summary, graph)
+
+        cache_key = None
+        if self.decision_cache is not None:
+            task_context = [self.goal_item, self.goal_quantity, sorted(plan["raw"]), [step["recipe"] for step in plan["steps"][:1]]]
+            cache_key = fingerprint_state(game_state_dict, nearby_entities_list, task_context)
+            cached = self.decision_cache.get(cache_key)
+            if cached is not None:
+                if self._cached_decision_usable(cached, nearby_entities_list):
+                    metrics.inc("llm_decisions_total", source="cache")
+                    print(f"Reusing cached decision: {cached.get('action')}, Parameters: {cached.get('parameters')} (hit rate {self.decision_cache.stats()['hit_rate']:.0%})")
+                    return json.loads(json.dumps(cached)) # Callers may mutate the plan
+                self.decision_cache.reject(cache_key)
+
+        # Ranked state filled into the token budget; the instructions are sent separately when the model caches them.
+        prompt = self.prompts.build(game_state_dict, nearby_entities_list, graph, plan, current_task_description,
+                                    include_prefix=not self.prefix_cached)
+        # print(f"\n--- Gemini Prompt ({self.prompts.last_stats}) ---\n{prompt}\n--------------------") # Verbose debug
 
         try:
-            response = self.model.generate_content(prompt)
+            metrics.observe("llm_prompt_chars", len(prompt), buckets=SIZE_BUCKETS)
+            started = time.time()
+            try:
+                with metrics.timer("llm_call_seconds"):
+                    response = self.model.generate_content(prompt)
+            except Exception as e:
+                metrics.inc("llm_errors_total", kind="api")
+                if self.trace is not None:
+                    self.trace.record("llm", t=started, dt=time.time() - started, prompt=prompt, error=str(e))
+                raise
+            if self.trace is not None:
+                self.trace.record("llm", t=started, dt=time.time() - started, prompt=prompt, response=response.text)
+            metrics.inc("llm_decisions_total", source="model")
+            metrics.observe("llm_response_chars", len(response.text), buckets=SIZE_BUCKETS)
             # print(f"Raw Gemini Response Text: {response.text}") # Verbose debug
 
-            json_match = re.search(r'\{[\s\S]*\}', response.text) # More robust regex for JSON block
-            if json_match:
-                json_str = json_match.group(0)
-                try:
-                    action_plan = json.loads(json_str)
-                    # Basic validation
-                    if isinstance(action_plan, dict) and "action" in action_plan and "parameters" in action_plan:
-                        print(f"Gemini decided action: {action_plan.get('action')}, Parameters: {action_plan.get('parameters')}, Reasoning: {action_plan.get('reasoning')}")
-                        return action_plan
-                    else:
-                        print(f"Gemini response JSON does not match expected structure: {json_str}")
-                        return None
-                except json.JSONDecodeError as e:
-                    print(f"Failed to decode JSON from Gemini response: {e}. String was: {json_str}")
+            action_plan = extract_json(response.text) # First JSON value in the reply, ignoring markdown fences or prose
+            if action_plan is not None:
+                # Basic validation
+                if isinstance(action_plan, dict) and "action" in action_plan and "parameters" in action_plan:
+                    print(f"Gemini decided action: {action_plan.get('action')}, Parameters: {action_plan.get('parameters')}, Reasoning: {action_plan.get('reasoning')}")
+                    if cache_key is not None:
+                        self.decision_cache.put(cache_key, json.loads(json.dumps(action_plan)))
+                    return action_plan
+                else:
+                    metrics.inc("llm_errors_total", kind="bad_structure")
+                    print(f"Gemini response JSON does not match expected structure: {action_plan}")
                     return None
             else:
+                metrics.inc("llm_errors_total", kind="no_json")
                 print(f"Could not find valid JSON in Gemini response: '{response.text}'")
                 return None
 
@@ -293,267 +474,120 @@ def main():
     factorio_rcon_port = int(os.getenv("FACTORIO_RCON_PORT", 27015))
     factorio_rcon_password = os.getenv("FACTORIO_RCON_PASSWORD", "YOUR_RCON_PASSWORD")
     gemini_api_key = os.getenv("GEMINI_API_KEY")
-    scan_radius = int(os.getenv("SCAN_RADIUS", 32)) # Default scan radius if not set
+    trace_path = os.getenv("AGENT_TRACE") # Record every RCON and LLM exchange to this file (.gz, or .zst with zstandard)
+    replay_path = os.getenv("AGENT_REPLAY") # Serve RCON and LLM responses from a recorded trace instead
+    replay_source = ReplaySource(replay_path) if replay_path else None
+    replay_settings = replay_source.meta.get("settings", {}) if replay_source else {}
+    settings = {}
+
+    def setting(name, default=None):
+        # Replays default to the settings the trace was recorded with; recordings store them.
+        value = os.getenv(name, replay_settings.get(name, default))
+        settings[name] = value
+        return value
+
+    scan_radius = int(setting("SCAN_RADIUS", 32)) # Default scan radius if not set
+    scan_max_age = float(setting("SCAN_MAX_AGE", 0)) # Seconds a scanned area is trusted without rescanning (0 = always scan)
+    nearby_entity_limit = 15 # Closest entities passed to the decision step
+    goal_item = setting("AGENT_GOAL_ITEM", "iron-gear-wheel")
+    goal_quantity = int(setting("AGENT_GOAL_QUANTITY", 10))
+    decision_cache_ttl = float(setting("DECISION_CACHE_TTL", 120)) # Seconds a cached LLM decision stays valid (0 = no caching)
+    decision_cache_size = int(setting("DECISION_CACHE_SIZE", 256))
+    decision_cache_path = os.getenv("DECISION_CACHE_PATH") # Optional JSON file to persist decisions across runs
+    speculate = setting("AGENT_SPECULATE", "1") != "0" # Decide the next step while the current action runs
+    actors = parse_actors(setting("AGENT_ACTORS", "1")) # e.g. "1,2,3" players or "unit:1234" vehicles
+    rcon_pool_size = int(setting("RCON_POOL_SIZE", 1 if len(actors) == 1 else min(4, len(actors))))
+    llm_concurrency = int(setting("LLM_CONCURRENCY", 2)) # LLM calls in flight across all bots
+    gemini_model = setting("GEMINI_MODEL", "gemini-1.0-pro")
+    prompt_token_budget = int(setting("PROMPT_TOKEN_BUDGET", 1200)) # Estimated tokens per prompt, instructions included
+    context_cache_ttl = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", 0)) # Seconds to keep the instructions in Gemini context caching (0 = off)
+    # Decide routine gathering steps locally, asking the LLM only when needed (off when replaying traces recorded without it)
+    local_policy = setting("LOCAL_POLICY", "0" if replay_source else "1") != "0"
+    local_min_confidence = float(setting("LOCAL_POLICY_MIN_CONFIDENCE", 0.25)) # Below this the LLM decides (0.25 ~ target 96 tiles away)
+    local_llm_every = int(setting("LOCAL_POLICY_LLM_EVERY", 0)) # Also ask the LLM every Nth decision (0 = only when escalating)
+    local_max_failures = int(setting("LOCAL_POLICY_MAX_FAILURES", 3)) # Failed local decisions in a row before the LLM takes over
+    exploration_map_path = os.getenv("EXPLORATION_MAP") # Directory of the persistent chunk exploration map (off if unset)
+    recipe_cache_path = os.getenv("RECIPE_CACHE_PATH", "recipe_cache.json") # Recipes keyed by mod/research fingerprint ("" = memory only)
+    metrics_port = os.getenv("METRICS_PORT") # Serve Prometheus metrics at http://host:port/metrics
+    metrics_jsonl = os.getenv("METRICS_JSONL") # Append a metrics snapshot to this file periodically
+    metrics_interval = float(os.getenv("METRICS_INTERVAL", 30))
 
     print("Factorio Autonomo-Bot Agent - Environmental Awareness Update")
     print("-------------------------------------------------------------")
 
-    if factorio_rcon_password == "YOUR_RCON_PASSWORD" or not factorio_rcon_password:
+    if replay_source:
+        print(f"Replaying session trace {replay_path} (recorded with {replay_settings}).")
+    elif factorio_rcon_password == "YOUR_RCON_PASSWORD" or not factorio_rcon_password:
         print("\nCRITICAL WARNING: FACTORIO_RCON_PASSWORD is not set or using default. Agent will likely fail.")
         # return # Optionally exit
-    if not gemini_api_key:
+    if not gemini_api_key and not replay_source:
         print("\nCRITICAL WARNING: GEMINI_API_KEY environment variable not set. GeminiAgent will not function.")
         # return
 
-    rcon_client = FactorioRCONClient(factorio_server_host, factorio_rcon_port, factorio_rcon_password)
+    if metrics_port or metrics_jsonl:
+        metrics.enable()
+        if metrics_port:
+            print(f"Serving metrics on port {metrics.serve(int(metrics_port))} (/metrics).")
+        if metrics_jsonl:
+            print(f"Writing metrics to {metrics_jsonl} every {metrics_interval:g}s.")
+            metrics.start_jsonl_dump(metrics_jsonl, metrics_interval)
+
+    trace = None
+    if replay_source:
+        rcon_client = FactorioRCONClient(factorio_server_host, factorio_rcon_port, factorio_rcon_password, async_client=ReplayRCONClient(replay_source))
+        rcon_client.sleep = lambda seconds: None # Recorded responses are served as fast as they are asked for
+    else:
+        rcon_client = FactorioRCONClient(factorio_server_host, factorio_rcon_port, factorio_rcon_password, pool_size=rcon_pool_size)
+        if trace_path:
+            trace = TraceWriter(trace_path, meta={"settings": settings})
+            rcon_client.async_client.trace = trace
+            print(f"Recording session trace to {trace_path}.")
 
     ai_agent = None
-    if gemini_api_key:
+    if gemini_api_key or replay_source:
         try:
-            ai_agent = GeminiAgent(api_key=gemini_api_key)
+            decision_cache = DecisionCache(decision_cache_size, decision_cache_ttl, None if replay_source else decision_cache_path) if decision_cache_ttl > 0 else None
+            ai_agent = GeminiAgent(api_key=gemini_api_key, goal_item=goal_item, goal_quantity=goal_quantity, decision_cache=decision_cache,
+                                   model=ReplayModel(replay_source) if replay_source else None, trace=trace,
+                                   model_name=gemini_model, token_budget=prompt_token_budget, context_cache_ttl=context_cache_ttl)
         except ValueError as e:
             print(f"Error initializing Gemini Agent: {e}")
     else:
         print("Proceeding without Gemini Agent due to missing API key.")
+    policy = ai_agent
+    if ai_agent and local_policy:
+        policy = LocalPolicy(ai_agent, min_confidence=local_min_confidence, llm_every=local_llm_every, max_failures=local_max_failures)
+        print(f"Routine gathering decided locally (min confidence {local_min_confidence:g}); other decisions go to Gemini.")
 
     all_recipes_data = None # To store recipes
+    recipe_cache = RecipeCache(None if replay_source else (recipe_cache_path or None))
+    world = WorldModel() # Remembers resources seen in earlier scans
+    exploration = None
+    if exploration_map_path and not replay_source: # A replay must not overwrite what the live runs recorded
+        exploration = ExplorationMap(exploration_map_path)
+        print(f"Using exploration map {exploration_map_path} ({exploration.page_count()} page(s) recorded so far).")
 
     try:
         rcon_client.connect() # Initial connection attempt
 
-        # Get recipes once at the beginning
-        print("Fetching all unlocked recipes...")
-        all_recipes_data = rcon_client.get_recipes()
-        if not all_recipes_data or "recipes" not in all_recipes_data:
-            print("CRITICAL: Failed to fetch recipes. Check mod and RCON connection. Exiting.")
-            return
-        print(f"Successfully fetched {len(all_recipes_data['recipes'])} recipes.")
+        # Recipes come from the on-disk cache unless mods or research changed since they were stored
+        print("Loading unlocked recipes...")
+        all_recipes_data = recipe_cache.load(rcon_client)
 
 
-        loop_count = 0
         max_loops = 10 # Limit loops for testing
         print(f"*** Running for a maximum of {max_loops} loops for this test run. ***")
-
-        while loop_count < max_loops :
-            loop_count += 1
-            print(f"\n--- Main Loop Iteration: {loop_count}/{max_loops} ---")
-
-            # 1. SENSE
-            print("SENSE: Gathering game state...")
-            player_info = rcon_client.get_player_info()
-            if not player_info or "error" in player_info: # Basic check for player_info validity
-                print(f"Failed to get player info: {player_info.get('error', 'Unknown error') if player_info else 'No response'}. Retrying in 5s...")
-                time.sleep(5)
-                continue
-
-            # Log key inventory items at the start of the Sense phase
-            current_inventory = player_info.get('inventory', {})
-            print(f"  Inventory Snapshot: Iron Ore: {current_inventory.get('iron-ore', 0)}, Coal: {current_inventory.get('coal', 0)}, Stone: {current_inventory.get('stone', 0)}, Copper Ore: {current_inventory.get('copper-ore', 0)}")
-
-            nearby_entities = rcon_client.scan_area(radius=scan_radius)
-            if not nearby_entities or "error" in nearby_entities: # Basic check for nearby_entities validity
-                print(f"Failed to scan nearby entities: {nearby_entities.get('error', 'Unknown error') if nearby_entities else 'No response'}. Using empty scan for this cycle.")
-                nearby_entities = {"entities": []}
-
-            print(f"  Player Pos: {player_info.get('position')}")
-            print(f"  Nearby Entities Scanned: {len(nearby_entities.get('entities', []))} found within radius {scan_radius}.")
-            # Optional: Log a few scanned entities for quick check
-            # for i, entity in enumerate(nearby_entities.get('entities', [])[:3]):
-            #     print(f"     Entity {i+1}: {entity.get('name')} at {entity.get('position')} ID: {entity.get('unit_number')} Amt: {entity.get('amount')}")
-
-            if not ai_agent:
-                print("THINK: Skipping AI decision (GeminiAgent not initialized).")
-                print("Stopping loop as no decisions can be made.")
-                break
-
-            # 2. THINK
-            print("THINK: Asking Gemini for the next action...")
-            action_to_perform = ai_agent.decide_next_action(player_info, nearby_entities, all_recipes_data)
-
-            if not action_to_perform or "action" not in action_to_perform:
-                print("Gemini failed to provide a valid action. Retrying decision in 10 seconds...")
-                time.sleep(10)
-                continue
-
-            action_type = action_to_perform.get("action")
-            action_params = action_to_perform.get("parameters", {})
-            action_reasoning = action_to_perform.get("reasoning", "No reasoning provided.")
-            print(f"  AI Action: {action_type}, Params: {action_params}, Reasoning: {action_reasoning}")
-
-            # 3. ACT
-            print(f"ACT: Executing action: {action_type}")
-            if action_type == "MOVE":
-                dest_x = action_params.get("x")
-                dest_y = action_params.get("y")
-                if dest_x is not None and dest_y is not None:
-                    print(f"  Commanding player to walk to ({dest_x}, {dest_y})...")
-                    walk_command_response = rcon_client.start_walking(dest_x, dest_y)
-                    if not walk_command_response or walk_command_response.get("path_found") is False:
-                        print(f"  Failed to initiate walking or path not found. Response: {walk_command_response}")
-                        time.sleep(2) # Brief pause before next cycle
-                        continue
-
-                    print(f"  Pathfinding response: {walk_command_response.get('status')}, Waypoints: {walk_command_response.get('waypoints', 'N/A')}")
-
-                    # Monitor Movement
-                    print("  Monitoring movement status...")
-                    movement_timeout_seconds = 120 # Max time to wait
-                    start_time = time.time()
-                    destination_reached = False
-                    while time.time() - start_time < movement_timeout_seconds:
-                        time.sleep(2) # Check status every 2 seconds
-                        status = rcon_client.check_movement_status()
-                        if not status:
-                            print("  Failed to get movement status. Assuming movement interrupted.")
-                            break
-                        if status.get("destination_reached"):
-                            print("  Movement status: Destination Reached!")
-                            destination_reached = True
-                            break
-                        else:
-                            cp = status.get('current_position', {})
-                            print(f"  Moving... Pos: {cp.get('x')},{cp.get('y')}. Target: {dest_x},{dest_y}. Waypoint {status.get('current_waypoint')}/{status.get('total_waypoints')}")
-
-                    if not destination_reached:
-                        print("  Movement timeout or interruption.")
-                else:
-                    print(f"  Invalid parameters for MOVE action: {action_params}")
-
-            elif action_type == "MINE":
-                target_id = action_params.get("target_entity_id")
-                target_name = action_params.get("target_name") # Should usually be resource type like "iron-ore"
-
-                if not target_id and not target_name:
-                    print(f"  Invalid parameters for MINE action: Missing target_entity_id or target_name. Params: {action_params}")
-                    time.sleep(2)
-                    continue
-
-                print(f"  Attempting MINE action. Target ID: {target_id}, Target Name: {target_name}")
-
-                # Logic to handle MINE action
-                entity_to_mine = None
-                if target_id:
-                    # Find the entity in the nearby_entities list to get its position
-                    if nearby_entities and "entities" in nearby_entities:
-                        for entity in nearby_entities["entities"]:
-                            if entity.get("unit_number") == target_id:
-                                entity_to_mine = entity
-                                break
-                    if not entity_to_mine:
-                        print(f"  Warning: Target entity ID {target_id} for MINE action not found in recent scan. Gemini might be using outdated info or hallucinating.")
-                        # Fallback: if Gemini also gave a name, we could try to find by name, or just re-scan/re-think next loop.
-                        # For now, we'll just skip if specific ID not found in scan.
-                        time.sleep(2)
-                        continue
-
-                elif target_name: # No ID given, try to find closest by name
-                    if nearby_entities and "entities" in nearby_entities:
-                        closest_entity_of_type = None
-                        min_dist_sq = float('inf')
-                        player_pos = player_info.get("position", None)
-
-                        if player_pos:
-                            px = float(player_pos.get("x", 0))
-                            py = float(player_pos.get("y", 0))
-                            for entity in nearby_entities["entities"]:
-                                if entity.get("name") == target_name:
-                                    ex = float(entity.get("position", {}).get("x", 0))
-                                    ey = float(entity.get("position", {}).get("y", 0))
-                                    dist_sq = (px - ex)**2 + (py - ey)**2
-                                    if dist_sq < min_dist_sq:
-                                        min_dist_sq = dist_sq
-                                        closest_entity_of_type = entity
-                            entity_to_mine = closest_entity_of_type
-
-                    if not entity_to_mine:
-                        print(f"  Warning: Could not find any entity of type '{target_name}' in recent scan for MINE action.")
-                        time.sleep(2)
-                        continue
-
-                if entity_to_mine:
-                    print(f"  Selected entity for mining: {entity_to_mine.get('name')} (ID: {entity_to_mine.get('unit_number')}, Pos: {entity_to_mine.get('position')}, Amt: {entity_to_mine.get('amount', 'N/A')})")
-                    # TODO: For more precise mining, calculate an adjacent tile to the resource instead of its center.
-                    # Current approach: move to the entity's position. Factorio's pathfinder/player interaction usually handles this fine for mining.
-                    mine_target_pos = entity_to_mine.get("position")
-
-                    target_mine_x = float(mine_target_pos.get("x"))
-                    target_mine_y = float(mine_target_pos.get("y"))
-
-                    # Check if already close enough to the target to skip walking
-                    player_current_pos_dict = player_info.get("position", {})
-                    player_x = float(player_current_pos_dict.get("x", 0))
-                    player_y = float(player_current_pos_dict.get("y", 0))
-                    distance_to_target_sq = (player_x - target_mine_x)**2 + (player_y - target_mine_y)**2
-                    mining_reach_threshold_sq = 2.0**2 # Approx 2 tiles reach for mining
-
-                    mine_move_reached = False
-                    if distance_to_target_sq <= mining_reach_threshold_sq:
-                        print(f"  Player is already close enough to mining target (Dist^2: {distance_to_target_sq:.2f}). Skipping movement.")
-                        mine_move_reached = True
-                    else:
-                        print(f"  Moving to entity {entity_to_mine.get('unit_number')} at ({target_mine_x}, {target_mine_y}) to mine...")
-                        walk_resp = rcon_client.start_walking(target_mine_x, target_mine_y)
-                        if not walk_resp or walk_resp.get("path_found") is False:
-                            print(f"    Failed to initiate walking to mining target. Response: {walk_resp}")
-                            time.sleep(2)
-                            continue # Skip to next main loop iteration
-
-                        # Monitor movement to mining target
-                        print(f"    Pathfinding for MINE: {walk_resp.get('status')}, Waypoints: {walk_resp.get('waypoints', 'N/A')}")
-                        mine_move_timeout = 60 # Shorter timeout for moving to adjacent mining spot
-                        mine_move_start_time = time.time()
-
-                        while time.time() - mine_move_start_time < mine_move_timeout:
-                            time.sleep(1.5) # Check status
-                            status = rcon_client.check_movement_status()
-                            if not status:
-                                print("    Failed to get movement status while moving to mine.")
-                                break
-                            if status.get("destination_reached"):
-                                print("    Reached mining position.")
-                                mine_move_reached = True
-                                break
-                            else:
-                                cp_m = status.get('current_position', {})
-                                print(f"    Moving to mine... Pos: {cp_m.get('x')},{cp_m.get('y')}. Target: {target_mine_x},{target_mine_y}. Waypoint {status.get('current_waypoint')}/{status.get('total_waypoints')}")
-
-                    if mine_move_reached:
-                        print(f"  Executing MINE RCON command for {entity_to_mine.get('name')} (ID: {entity_to_mine.get('unit_number')}).")
-                        # Log current inventory of the target resource BEFORE mining
-                        resource_name_to_check = entity_to_mine.get('name') # e.g. "iron-ore"
-                        inv_before_mine = player_info.get('inventory', {}).get(resource_name_to_check, 0)
-                        print(f"    Inventory of '{resource_name_to_check}' before mining: {inv_before_mine}")
-
-                        mine_init_response = rcon_client.mine_target_entity(entity_to_mine.get('unit_number'))
-                        print(f"    MINE command RCON response: {mine_init_response}")
-
-                        if mine_init_response and mine_init_response.get("status") == "mining_initiated":
-                            simulated_mining_duration = 5 # seconds
-                            print(f"    Mining initiated. Simulating mining duration of {simulated_mining_duration} seconds...")
-                            time.sleep(simulated_mining_duration)
-                            print("    Finished simulated mining duration.")
-                            # Inventory check will happen in the next SENSE phase.
-                        else:
-                            print(f"    Failed to initiate mining via RCON or error reported: {mine_init_response}")
-                            time.sleep(1) # Brief pause if mining failed to start
-                    else:
-                        print("    Failed to reach mining position or movement timed out.")
-                else:
-                    # This case should be caught by earlier checks for target_id and target_name
-                    print(f"  Error: Could not determine a specific entity to mine based on parameters: {action_params}")
-
-            elif action_type == "CRAFT":
-                recipe_name = action_params.get("recipe_name")
-                quantity = action_params.get("quantity", 1)
-                print(f"  AI decided to CRAFT: Recipe: {recipe_name}, Quantity: {quantity}. (Action not yet implemented in Python agent)")
-                # Placeholder for future CRAFT implementation
-
-            else:
-                print(f"  Unknown or unsupported action from AI: {action_type}")
-
-            print("Waiting 5 seconds before next Sense-Think-Act cycle...")
-            time.sleep(5)
-
+        loop_options = {"scan_radius": scan_radius, "scan_max_age": scan_max_age, "nearby_entity_limit": nearby_entity_limit, "speculate": speculate,
+                        "exploration": exploration, "recipe_cache": recipe_cache}
+        if len(actors) > 1:
+            print(f"Driving {len(actors)} bots over {rcon_pool_size} RCON connection(s) with {llm_concurrency} concurrent LLM call(s).")
+            agent_loop = AgentPool(rcon_client, policy, world, all_recipes_data, actors, llm_concurrency=llm_concurrency, **loop_options)
+        else:
+            agent_loop = AgentLoop(rcon_client.for_actor(**actors[0]), policy, world, all_recipes_data, **loop_options)
+        try:
+            agent_loop.run(max_loops)
+        finally:
+            agent_loop.close()
 
     except ConnectionError as e:
         print(f"RCON Connection Error: {e}")
@@ -564,8 +598,19 @@ def main():
     except Exception as e:
         print(f"An unexpected error occurred in main loop: {e}")
     finally:
-        if rcon_client._is_connected:
-             rcon_client.disconnect()
+        if ai_agent and ai_agent.decision_cache is not None:
+            print(f"Decision cache: {ai_agent.decision_cache.stats()}")
+        if policy is not ai_agent:
+            print(f"Local policy: {policy.stats}")
+        rcon_client.disconnect()
+        if trace is not None:
+            trace.close()
+            print(f"Session trace: {trace.records} records written to {trace_path}.")
+        if replay_source:
+            print(f"Replay matches: {dict(replay_source.stats)}")
+        if exploration is not None:
+            exploration.close()
+        metrics.stop()
         print("Factorio Autonomo-Bot Agent stopped.")
 
 if __name__ == "__main__":
@@ -0,0 +1,250 @@
+import http.server
+import json
+import math
+import threading
+import time
+
+# Histogram upper bounds. Latencies are in seconds, sizes in bytes or characters.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("registry", "name", "labels", "start")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _Histogram:
+    __slots__ = ("bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        Estimate from the buckets (upper bound of the bucket holding the q-th observation).
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms keyed by metric name and labels, for finding out where a slow cycle
+    spent its time (RCON round trip, JSON parsing, the model, sleeping).
+
+    Disabled registries record nothing: timer() hands out a shared no-op context manager and
+    inc()/observe() return immediately, so instrumented code costs one attribute check per call.
+    Enabled, the data can be scraped in Prometheus text format (serve()) or appended to a JSONL
+    file at an interval (start_jsonl_dump()).
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {} # name -> {labels tuple: value}
+        self._histograms = {} # name -> {labels tuple: _Histogram}
+        self._server = None
+        self._dump_thread = None
+        self._dump_stop = threading.Event()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        """
+        Context manager that observes the wall time of its block into histogram `name` (seconds).
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def snapshot(self):
+        """
+        Plain-dict copy of every series: counters as values, histograms as count/sum/max, bucket
+        counts and estimated p50/p99.
+        """
+        with self._lock:
+            counters = {name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                        for name, series in self._counters.items()}
+            histograms = {name: [{"labels": dict(key), "count": h.count, "sum": h.sum, "max": h.max,
+                                  "p50": h.quantile(0.5), "p99": h.quantile(0.99),
+                                  "buckets": dict(zip([str(b) for b in h.bounds] + ["+Inf"], h.counts))}
+                                 for key, h in series.items()]
+                          for name, series in self._histograms.items()}
+        return {"counters": counters, "histograms": histograms}
+
+    def prometheus_text(self):
+        """
+        Renders all series in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for name in sorted(self._histograms):
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, n in zip(list(h.bounds) + [math.inf], h.counts):
+                        cumulative += n
+                        le = "+Inf" if bound == math.inf else _format_value(bound)
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(h.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="0.0.0.0"):
+        """
+        Serves prometheus_text() at http://host:port/metrics from a daemon thread.
+        """
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # Scrapes would otherwise flood the agent log
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        return self._server.server_address[1]
+
+    def dump_jsonl(self, path):
+        """
+        Appends one {"time": ..., "counters": ..., "histograms": ...} line to `path`.
+        """
+        record = {"time": time.time()}
+        record.update(self.snapshot())
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def start_jsonl_dump(self, path, interval=30.0):
+        """
+        Calls dump_jsonl(path) every `interval` seconds from a daemon thread until stop().
+        """
+        def loop():
+            while not self._dump_stop.wait(interval):
+                self.dump_jsonl(path)
+            self.dump_jsonl(path) # Final state on shutdown
+
+        self._dump_stop.clear()
+        self._dump_thread = threading.Thread(target=loop, name="metrics-jsonl", daemon=True)
+        self._dump_thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._dump_thread is not None:
+            self._dump_stop.set()
+            self._dump_thread.join(timeout=5)
+            self._dump_thread = None
+
+
+def _label_key(labels):
+    return tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    parts = []
+    for label, value in key:
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{label}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+# Process-wide registry used by the RCON client, the agent loop and GeminiAgent.
+registry = MetricsRegistry()
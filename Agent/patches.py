@@ -0,0 +1,285 @@
+import math
+
+# The 8 neighbours of a tile; ore tiles touching at a corner belong to the same patch.
+NEIGHBOURS = ((-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+
+
+def is_patch_resource(record):
+    """
+    Ore-like scan records (a tile with a remaining amount) are clustered; trees are not.
+    """
+    return not (record.get("name") or "").startswith("tree") and (record.get("amount") or 0) > 0
+
+
+class PatchIndex:
+    """
+    Groups resource tiles into patches (8-connected components of tiles of the same resource)
+    and keeps them up to date tile by tile: adding a tile joins or merges the patches around it,
+    changing its amount only updates the totals, and removing one (mined out) splits its patch
+    only if the neighbours it leaves behind are no longer connected to each other. A merge keeps
+    the id of the larger patch; a split keeps it for the part that takes longest to flood-fill
+    (normally the largest) and gives the parts split off new ids.
+
+    Count, amount and centroid sums are maintained incrementally; the bounding box is recomputed
+    lazily after a tile on its edge was removed. Not thread-safe; WorldModel calls it under its lock.
+    """
+
+    def __init__(self):
+        self._tiles = {} # (name, tx, ty) -> {"key", "amount", "patch"}
+        self._keys = {} # record key -> (name, tx, ty)
+        self._patches = {} # id -> patch dict
+        self._next_id = 1
+
+    def __len__(self):
+        return len(self._patches)
+
+    @staticmethod
+    def _tile_of(record):
+        return (record.get("name"), math.floor(record["x"]), math.floor(record["y"]))
+
+    def _new_patch(self, name):
+        patch = {"id": self._next_id, "name": name, "tiles": set(), "amount": 0, "sum_x": 0.0, "sum_y": 0.0, "bbox": None}
+        self._patches[patch["id"]] = patch
+        self._next_id += 1
+        return patch
+
+    def _attach(self, patch, tile, amount):
+        _, tx, ty = tile
+        patch["tiles"].add((tx, ty))
+        patch["amount"] += amount
+        patch["sum_x"] += tx + 0.5
+        patch["sum_y"] += ty + 0.5
+        bbox = patch["bbox"]
+        if bbox is not None:
+            patch["bbox"] = (min(bbox[0], tx), min(bbox[1], ty), max(bbox[2], tx + 1), max(bbox[3], ty + 1))
+        elif len(patch["tiles"]) == 1:
+            patch["bbox"] = (tx, ty, tx + 1, ty + 1)
+        self._tiles[tile]["patch"] = patch["id"]
+
+    def _detach(self, patch, tile, amount):
+        _, tx, ty = tile
+        patch["tiles"].discard((tx, ty))
+        patch["amount"] -= amount
+        patch["sum_x"] -= tx + 0.5
+        patch["sum_y"] -= ty + 0.5
+        bbox = patch["bbox"]
+        if bbox is not None and (tx == bbox[0] or ty == bbox[1] or tx + 1 == bbox[2] or ty + 1 == bbox[3]):
+            patch["bbox"] = None
+
+    def _neighbour_patches(self, tile):
+        name, tx, ty = tile
+        found = []
+        for dx, dy in NEIGHBOURS:
+            neighbour = self._tiles.get((name, tx + dx, ty + dy))
+            if neighbour is not None and neighbour["patch"] not in found:
+                found.append(neighbour["patch"])
+        return found
+
+    def add(self, record):
+        """
+        Adds a resource tile or updates its amount. Records that are not resources are ignored
+        (and removed if they were tracked).
+        """
+        key = record.get("key")
+        if not is_patch_resource(record):
+            self.remove(key)
+            return None
+        tile = self._tile_of(record)
+        amount = record.get("amount") or 0
+        if self._keys.get(key) == tile:
+            entry = self._tiles[tile]
+            self._patches[entry["patch"]]["amount"] += amount - entry["amount"]
+            entry["amount"] = amount
+            return entry["patch"]
+        self.remove(key)
+        if tile in self._tiles: # Same tile under another key: replace it
+            self.remove(self._tiles[tile]["key"])
+
+        self._tiles[tile] = {"key": key, "amount": amount, "patch": None}
+        self._keys[key] = tile
+        ids = self._neighbour_patches(tile)
+        if not ids:
+            patch = self._new_patch(tile[0])
+        else:
+            patches = sorted((self._patches[i] for i in ids), key=lambda p: -len(p["tiles"]))
+            patch = patches[0]
+            for other in patches[1:]:
+                self._merge(patch, other)
+        self._attach(patch, tile, amount)
+        return patch["id"]
+
+    def _merge(self, into, other):
+        name = other["name"]
+        for tx, ty in other["tiles"]:
+            self._tiles[(name, tx, ty)]["patch"] = into["id"]
+        into["tiles"] |= other["tiles"]
+        into["amount"] += other["amount"]
+        into["sum_x"] += other["sum_x"]
+        into["sum_y"] += other["sum_y"]
+        if into["bbox"] is not None and other["bbox"] is not None:
+            a, b = into["bbox"], other["bbox"]
+            into["bbox"] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+        else:
+            into["bbox"] = None
+        del self._patches[other["id"]]
+
+    def remove(self, key):
+        """
+        Drops a tile (mined out or no longer seen), splitting its patch if that disconnects it.
+        """
+        tile = self._keys.pop(key, None)
+        if tile is None:
+            return
+        entry = self._tiles.pop(tile)
+        patch = self._patches[entry["patch"]]
+        self._detach(patch, tile, entry["amount"])
+        if not patch["tiles"]:
+            del self._patches[patch["id"]]
+            return
+        _, tx, ty = tile
+        left = [(tx + dx, ty + dy) for dx, dy in NEIGHBOURS if (tx + dx, ty + dy) in patch["tiles"]]
+        groups = self._groups(left)
+        if len(groups) > 1:
+            self._split(patch, groups)
+
+    @staticmethod
+    def _groups(cells):
+        """
+        The neighbours of a removed tile grouped by whether they touch each other. A single group
+        means every path that went through the tile can go around it.
+        """
+        groups = []
+        remaining = set(cells)
+        while remaining:
+            group = [remaining.pop()]
+            i = 0
+            while i < len(group):
+                cx, cy = group[i]
+                for cell in [c for c in remaining if abs(c[0] - cx) <= 1 and abs(c[1] - cy) <= 1]:
+                    remaining.discard(cell)
+                    group.append(cell)
+                i += 1
+            groups.append(group)
+        return groups
+
+    def _split(self, patch, groups):
+        """
+        Flood-fills from each group one step at a time. Groups that meet are the same component;
+        a group whose fill runs out first is a separate, smaller part and becomes a new patch.
+        Stops as soon as one group is left, so the cost is bounded by the parts split off.
+        """
+        tiles = patch["tiles"]
+        owner = {} # cell -> group index
+        parent = list(range(len(groups)))
+        frontiers = []
+        for i, group in enumerate(groups):
+            for cell in group:
+                owner[cell] = i
+            frontiers.append(list(group))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        active = set(range(len(groups)))
+        finished = []
+        while len(active) > 1:
+            for i in list(active):
+                if i not in active or len(active) == 1:
+                    continue
+                frontier = frontiers[i]
+                if not frontier:
+                    active.discard(i)
+                    finished.append(i)
+                    continue
+                tx, ty = frontier.pop()
+                for dx, dy in NEIGHBOURS:
+                    cell = (tx + dx, ty + dy)
+                    if cell not in tiles:
+                        continue
+                    other = owner.get(cell)
+                    if other is None:
+                        owner[cell] = i
+                        frontier.append(cell)
+                    elif find(other) != i:
+                        # Two fills met: one component. Keep the root with the bigger frontier.
+                        j = find(other)
+                        keep, drop = (i, j) if len(frontiers[i]) >= len(frontiers[j]) else (j, i)
+                        parent[drop] = keep
+                        frontiers[keep].extend(frontiers[drop])
+                        frontiers[drop] = []
+                        active.discard(drop)
+                        if drop == i:
+                            # The rest of this cell's neighbours still need scanning, now by the kept fill.
+                            frontiers[keep].append((tx, ty))
+                            break
+        # Every finished group that was never merged is a closed component.
+        name = patch["name"]
+        for i in finished:
+            if find(i) != i:
+                continue
+            component = [cell for cell, g in owner.items() if find(g) == i]
+            new = self._new_patch(name)
+            for tx, ty in component:
+                tile = (name, tx, ty)
+                amount = self._tiles[tile]["amount"]
+                self._detach(patch, tile, amount)
+                self._attach(new, tile, amount)
+
+    def _bbox(self, patch):
+        if patch["bbox"] is None:
+            xs = [tx for tx, _ in patch["tiles"]]
+            ys = [ty for _, ty in patch["tiles"]]
+            patch["bbox"] = (min(xs), min(ys), max(xs) + 1, max(ys) + 1)
+        return patch["bbox"]
+
+    def summary(self, patch_id):
+        """
+        {"patch_id", "name", "x", "y" (centroid), "bbox" [min_x, min_y, max_x, max_y] (tile edges),
+        "tiles", "amount"} for one patch, or None.
+        """
+        patch = self._patches.get(patch_id)
+        if patch is None:
+            return None
+        count = len(patch["tiles"])
+        return {"patch_id": patch["id"], "name": patch["name"], "x": round(patch["sum_x"] / count, 2),
+                "y": round(patch["sum_y"] / count, 2), "bbox": list(self._bbox(patch)), "tiles": count, "amount": patch["amount"]}
+
+    def patch_of(self, key):
+        tile = self._keys.get(key)
+        return self._tiles[tile]["patch"] if tile else None
+
+    def query(self, x, y, name=None, radius=None, limit=None):
+        """
+        Summaries of the patches (of `name`, if given) whose bounding box is within `radius` of
+        (x, y), closest first, each with its "distance" to (x, y) (0 inside the box).
+        """
+        found = []
+        for patch in self._patches.values():
+            if name is not None and patch["name"] != name:
+                continue
+            min_x, min_y, max_x, max_y = self._bbox(patch)
+            distance = math.hypot(max(min_x - x, 0, x - max_x), max(min_y - y, 0, y - max_y))
+            if radius is None or distance <= radius:
+                found.append((distance, patch["id"]))
+        found.sort()
+        if limit is not None:
+            found = found[:limit]
+        summaries = []
+        for distance, patch_id in found:
+            summary = self.summary(patch_id)
+            summary["distance"] = round(distance, 2)
+            summaries.append(summary)
+        return summaries
+
+    def nearest_tile(self, patch_id, x, y):
+        """
+        Record key of the tile of the patch closest to (x, y), or None.
+        """
+        patch = self._patches.get(patch_id)
+        if patch is None:
+            return None
+        tx, ty = min(patch["tiles"], key=lambda t: ((t[0] + 0.5 - x) ** 2 + (t[1] + 0.5 - y) ** 2, t))
+        return self._tiles[(patch["name"], tx, ty)]["key"]
@@ -0,0 +1,485 @@
+import collections
+import concurrent.futures
+import time
+
+from entity_store import EntityColumns
+from decision_cache import fingerprint_state
+from metrics import registry as metrics
+
+MINING_REACH = 2.0 # Approx tiles the character can mine from without walking
+MOVE_TIMEOUT = 120
+MINE_MOVE_TIMEOUT = 60 # Shorter timeout for moving to an adjacent mining spot
+MINE_TIMEOUT = 15
+MINE_UNIT_TIMEOUT = 5 # Allowance per unit mined by the mod's action queue, on top of MINE_MOVE_TIMEOUT
+WOOD_ITEM = "wood"
+EXPLORATION_HINT_RADIUS = 512 # Tiles around the player searched for the densest remembered chunk of each resource
+
+
+class AgentLoop:
+    """
+    Runs SENSE -> THINK -> ACT as an overlapping pipeline instead of a serial loop with sleeps.
+
+    While an action runs on a worker thread, the state it should end in (destination position,
+    remembered resources around it) is predicted and the next THINK is started on that prediction.
+    When the action reports completion the real state is sensed; if its fingerprint matches the
+    prediction the speculative decision is used straight away, otherwise it is discarded and a
+    fresh THINK is issued. Actions wait on mod events (arrival, mined items) rather than fixed
+    sleeps; only consecutive failures back off. A MINE hands the mod one queued job (walk into
+    reach, mine `quantity` or `mine_batch` units, moving on to the next tile as each runs out)
+    and waits for its single completion event, instead of one round trip per unit.
+
+    Decisions put on the action queue (enqueue()) run before the next LLM decision. If
+    `think_scheduler` is given (see agent_pool.FairScheduler), THINK calls are submitted to it
+    instead of the loop's own threads so several bots can share a limited number of LLM slots.
+    With an `exploration` map (see exploration_map.ExplorationMap) every scan is also recorded
+    there, and snapshots carry the nearest unexplored chunk and the densest remembered chunk of
+    each resource, including what earlier runs found.
+    """
+
+    def __init__(self, rcon_client, ai_agent, world, recipes, scan_radius=32, scan_max_age=0,
+                 nearby_entity_limit=15, speculate=True, retry_delay=0.5, max_retry_delay=10.0,
+                 think_scheduler=None, name="agent", mine_batch=10, patch_limit=20, exploration=None,
+                 recipe_cache=None):
+        self.name = name
+        self.rcon = rcon_client
+        self.agent = ai_agent
+        self.world = world
+        self.recipes = recipes
+        self.scan_radius = scan_radius
+        self.scan_max_age = scan_max_age
+        self.nearby_entity_limit = nearby_entity_limit
+        self.speculate = speculate
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.think_scheduler = think_scheduler
+        self.mine_batch = mine_batch
+        self.patch_limit = patch_limit
+        self.exploration = exploration
+        self.recipe_cache = recipe_cache
+        self.research_epoch = recipe_cache.epoch if recipe_cache is not None else None
+        self.mod_action_queue = True # False while enqueue_actions fails (e.g. an older mod version)
+        self.action_queue = collections.deque()
+        self.last_position = None
+        self._ingested_at = None # Scan center of the last world update
+        self.failures = 0
+        self.stats = {"cycles": 0, "actions": 0, "speculative_hits": 0, "speculative_misses": 0, "think_wait": 0.0, "act_time": 0.0}
+        # One worker for the action, one for the speculative THINK and one for a THINK that
+        # replaces a stale speculation while the old model call is still running.
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=3, thread_name_prefix="agent")
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def enqueue(self, decision):
+        """
+        Queues a decision ({"action", "parameters"}) to run ahead of the LLM's next decision.
+        """
+        self.action_queue.append(decision)
+
+    def _submit_think(self, snapshot, speculative=False):
+        if self.think_scheduler is not None:
+            return self.think_scheduler.submit(self.think, snapshot, speculative=speculative)
+        return self._executor.submit(self.think, snapshot)
+
+    # --- SENSE ---
+
+    def sense(self):
+        """
+        Reads player info and the nearby resources in one batched RCON call and updates the
+        world model. Returns a snapshot dict, or None if the player could not be read.
+        """
+        with metrics.timer("agent_phase_seconds", phase="sense", bot=self.name):
+            return self._sense()
+
+    def check_research(self, epoch):
+        """
+        Reloads the recipes (from the cache, or the mod if the fingerprint changed) once the mod's
+        research epoch differs from the one they were loaded at.
+        """
+        if self.recipe_cache is None or epoch is None or epoch == self.research_epoch:
+            return
+        print(f"  Research changed (epoch {self.research_epoch} -> {epoch}); reloading recipes.")
+        self.recipes = self.recipe_cache.refresh(self.rcon, epoch)
+        self.research_epoch = epoch
+
+    def _sense(self):
+        print("SENSE: Gathering game state...")
+        sense_calls = [("player", "get_player_info", None)]
+        last = self.last_position
+        skip_scan = self.scan_max_age > 0 and last is not None and self.world.is_scanned(last[0], last[1], self.scan_radius, self.scan_max_age)
+        if not skip_scan:
+            sense_calls.append(("scan", "scan_nearby_entities", self.rcon.scan_params(self.scan_radius, delta=True)))
+        sense_results = self.rcon.call_many(sense_calls)
+        player_info = sense_results.get("player")
+        if not player_info or "error" in player_info:
+            print(f"Failed to get player info: {player_info.get('error', 'Unknown error') if player_info else 'No response'}.")
+            return None
+
+        if not isinstance(player_info.get("inventory"), dict): # The mod encodes an empty inventory as []
+            player_info["inventory"] = {}
+        self.check_research(player_info.get("research_epoch"))
+        current_inventory = player_info['inventory']
+        print(f"  Inventory Snapshot: Iron Ore: {current_inventory.get('iron-ore', 0)}, Coal: {current_inventory.get('coal', 0)}, Stone: {current_inventory.get('stone', 0)}, Copper Ore: {current_inventory.get('copper-ore', 0)}")
+
+        player_pos = player_info.get("position", {})
+        px = float(player_pos.get("x", 0))
+        py = float(player_pos.get("y", 0))
+        if skip_scan and (px, py) != last:
+            skip_scan = self.world.is_scanned(px, py, self.scan_radius, self.scan_max_age)
+        self.last_position = (px, py)
+
+        scanned_count = 0
+        if skip_scan:
+            print("  Area already scanned recently; using remembered entities.")
+            nearby_entities = {"entities": self.remembered_entities(px, py)}
+        else:
+            if "scan" in sense_results:
+                scan = self.rcon.apply_scan_result(sense_results.get("scan"))
+            else: # Moved out of the remembered area since the batch was built
+                scan = self.rcon.scan_area(self.scan_radius, delta=True)
+            if not isinstance(scan, EntityColumns):
+                print(f"Failed to scan nearby entities: {scan.get('error', 'Unknown error') if scan else 'No response'}. Using empty scan for this cycle.")
+                scan = EntityColumns(names=self.rcon.entity_names)
+            else:
+                with metrics.timer("agent_world_update_seconds", bot=self.name):
+                    # Only the rows the delta touched become records; the rest stay in the arrays.
+                    self.world.ingest_columns(scan, px, py, self.scan_radius, delta=self.rcon.last_scan_delta,
+                                              sweep=self._ingested_at != (px, py))
+                    self._ingested_at = (px, py)
+                    if self.exploration is not None:
+                        self.exploration.record_columns(scan, px, py, self.scan_radius, int(player_info.get("tick") or 0))
+            scanned_count = len(scan)
+            # Only the closest entities are materialized as dicts for the decision step
+            nearby_entities = {"entities": scan.to_records(scan.nearest_indices(px, py, k=self.nearby_entity_limit))}
+
+        nearby_entities["known"] = self.known_resources(px, py)
+        nearby_entities["patches"] = self.world.patches_near(px, py, limit=self.patch_limit)
+        if self.exploration is not None:
+            nearby_entities["exploration"] = self.exploration_hints(px, py)
+        print(f"  Player Pos: {player_info.get('position')}")
+        print(f"  Nearby Entities Scanned: {scanned_count} found within radius {self.scan_radius}. Remembered: {len(self.world)}.")
+        return {"player": player_info, "entities": nearby_entities, "x": px, "y": py}
+
+    def remembered_entities(self, x, y):
+        return self.world.within_radius(None, x, y, self.scan_radius)[:self.nearby_entity_limit]
+
+    def known_resources(self, x, y):
+        """
+        The closest remembered entity of every type, so the decision step also knows about
+        resources outside the current scan.
+        """
+        known = []
+        for name in self.world.names():
+            nearest = self.world.nearest(name, x, y, k=1)
+            if nearest:
+                known.append(nearest[0])
+        return known
+
+    def exploration_hints(self, x, y):
+        """
+        {"unexplored": nearest not fully scanned chunk, "densest": {resource: densest chunk within
+        EXPLORATION_HINT_RADIUS}} from the exploration map.
+        """
+        densest = {}
+        for name in self.exploration.channels:
+            found = self.exploration.densest(name, x, y, EXPLORATION_HINT_RADIUS, k=1)
+            if found:
+                densest[name] = found[0]
+        return {"unexplored": self.exploration.nearest_unexplored(x, y), "densest": densest}
+
+    def world_key(self, snapshot):
+        """
+        Fingerprint of a snapshot as seen through the world model, so a predicted snapshot and the
+        sensed one are compared on the same footing.
+        """
+        view = {"entities": self.remembered_entities(snapshot["x"], snapshot["y"])}
+        return fingerprint_state(snapshot["player"], view)
+
+    # --- THINK ---
+
+    def think(self, snapshot):
+        with metrics.timer("agent_phase_seconds", phase="think", bot=self.name):
+            return self.agent.decide_next_action(snapshot["player"], snapshot["entities"], self.recipes)
+
+    def predict(self, decision, snapshot):
+        """
+        The snapshot the decision is expected to end in, or None if it cannot be predicted.
+        Only the position, the surroundings and, for a queued MINE, the mined item change.
+        """
+        action_type = decision.get("action")
+        params = decision.get("parameters") or {}
+        if action_type == "MOVE":
+            if params.get("x") is None or params.get("y") is None:
+                return None
+            x, y = float(params["x"]), float(params["y"])
+        elif action_type == "MINE":
+            target = self.resolve_mine_target(params, snapshot, quiet=True)
+            if target is None:
+                return None
+            x, y = target["x"], target["y"]
+            if (x - snapshot["x"]) ** 2 + (y - snapshot["y"]) ** 2 <= MINING_REACH ** 2:
+                x, y = snapshot["x"], snapshot["y"]
+        else:
+            return None
+        player = dict(snapshot["player"])
+        if action_type == "MINE" and self.mod_action_queue:
+            item = WOOD_ITEM if (target.get("name") or "").startswith("tree") else target.get("name")
+            player["inventory"] = dict(player.get("inventory") or {})
+            player["inventory"][item] = player["inventory"].get(item, 0) + self.mine_count(params)
+        player["position"] = {"x": x, "y": y}
+        entities = {"entities": self.remembered_entities(x, y), "known": self.known_resources(x, y),
+                    "patches": self.world.patches_near(x, y, limit=self.patch_limit)}
+        if self.exploration is not None:
+            entities["exploration"] = self.exploration_hints(x, y)
+        return {"player": player, "entities": entities, "x": x, "y": y}
+
+    # --- ACT ---
+
+    def resolve_mine_target(self, params, snapshot, quiet=False):
+        """
+        Finds the entity a MINE decision refers to: by id among the sensed entities, the closest
+        tile of the given resource patch, otherwise the closest remembered entity of the requested
+        name. Returns a record with float x/y or None.
+        """
+        target_id = params.get("target_entity_id")
+        target_name = params.get("target_name")
+        patch_id = params.get("patch_id")
+        entity = None
+        if patch_id is not None:
+            try:
+                entity = self.world.nearest_in_patch(int(patch_id), snapshot["x"], snapshot["y"])
+            except (TypeError, ValueError):
+                entity = None
+            if not entity and not quiet:
+                print(f"  Warning: Resource patch {patch_id} for MINE action is not known (mined out or never seen).")
+        if entity is None and target_id:
+            for candidate in snapshot["entities"].get("entities", []):
+                if candidate.get("unit_number") == target_id:
+                    entity = candidate
+                    break
+            if not entity and not quiet:
+                print(f"  Warning: Target entity ID {target_id} for MINE action not found in recent scan. Gemini might be using outdated info or hallucinating.")
+        elif entity is None and target_name: # No ID given, use the closest known one (may be outside the current scan)
+            closest = self.world.nearest(target_name, snapshot["x"], snapshot["y"], k=1)
+            entity = closest[0] if closest else None
+            if not entity and not quiet:
+                print(f"  Warning: Could not find any known entity of type '{target_name}' for MINE action.")
+        if entity is None:
+            return None
+        position = entity.get("position", {})
+        entity = dict(entity)
+        entity["x"] = float(entity.get("x", position.get("x", 0)))
+        entity["y"] = float(entity.get("y", position.get("y", 0)))
+        return entity
+
+    def act(self, decision, snapshot, mine_target=None):
+        """
+        Executes one decision and returns once the mod reports it finished. Returns True if the
+        action was carried out.
+        """
+        action_type = decision.get("action")
+        action_params = decision.get("parameters", {})
+        print(f"ACT: Executing action: {action_type}")
+        if action_type == "MOVE":
+            dest_x = action_params.get("x")
+            dest_y = action_params.get("y")
+            if dest_x is None or dest_y is None:
+                print(f"  Invalid parameters for MOVE action: {action_params}")
+                return False
+            print(f"  Commanding player to walk to ({dest_x}, {dest_y})...")
+            return self.walk_to(dest_x, dest_y, MOVE_TIMEOUT)
+
+        if action_type == "MINE":
+            if not action_params.get("target_entity_id") and not action_params.get("target_name") and action_params.get("patch_id") is None:
+                print(f"  Invalid parameters for MINE action: Missing target_entity_id, target_name or patch_id. Params: {action_params}")
+                return False
+            print(f"  Attempting MINE action. Target ID: {action_params.get('target_entity_id')}, Target Name: {action_params.get('target_name')}")
+            entity = mine_target or self.resolve_mine_target(action_params, snapshot)
+            if entity is None:
+                return False
+            return self.mine(entity, snapshot, self.mine_count(action_params))
+
+        if action_type == "CRAFT":
+            recipe_name = action_params.get("recipe_name")
+            quantity = action_params.get("quantity", 1)
+            print(f"  AI decided to CRAFT: Recipe: {recipe_name}, Quantity: {quantity}. (Action not yet implemented in Python agent)")
+            return True
+
+        print(f"  Unknown or unsupported action from AI: {action_type}")
+        return False
+
+    def walk_to(self, x, y, timeout):
+        walk_resp = self.rcon.start_walking(x, y)
+        if not walk_resp or walk_resp.get("status") == "error":
+            print(f"  Failed to initiate walking or path not found. Response: {walk_resp}")
+            return False
+        print(f"  Pathfinding response: {walk_resp.get('status')}, Vehicle: {walk_resp.get('vehicle_key')}")
+        movement = self.rcon.wait_for_movement(walk_resp.get("vehicle_key"), walk_resp.get("event_cursor", 0), timeout=timeout)
+        if movement.get("destination_reached"):
+            print(f"  Movement status: Destination Reached! (tick {movement.get('tick')})")
+            return True
+        print(f"  Movement timeout or interruption. State: {movement.get('state')}")
+        return False
+
+    def mine_count(self, params):
+        try:
+            return max(1, int(params.get("quantity") or self.mine_batch))
+        except (TypeError, ValueError):
+            return self.mine_batch
+
+    def mine(self, entity, snapshot, count=1):
+        """
+        Mines `count` units starting at `entity` through the mod's action queue, which walks into
+        reach and moves on to the closest entity of the same name when one is used up. Falls back
+        to walking there and mining a single unit if the mod does not have the queue.
+        """
+        print(f"  Queueing mining of {count} {entity.get('name')} starting at ({entity['x']}, {entity['y']}).")
+        job = self.rcon.enqueue_actions([{"type": "mine", "name": entity.get("name"), "count": count, "x": entity["x"], "y": entity["y"]}])
+        self.mod_action_queue = job is not None
+        if job is None:
+            print("    Mod did not accept enqueue_actions; mining a single unit instead.")
+            return self.mine_single(entity, snapshot)
+        if job.get("status") == "error":
+            print(f"    Failed to queue mining: {job.get('message')}")
+            return False
+        summary = self.rcon.wait_for_action_queue(job.get("job_id"), job.get("event_cursor", 0),
+                                                  timeout=MINE_MOVE_TIMEOUT + count * MINE_UNIT_TIMEOUT)
+        if summary.get("state") == "TIMEOUT":
+            self.rcon.cancel_action_queue()
+        mined = ", ".join(f"{n} {item}" for item, n in summary["mined"].items()) if summary.get("mined") else "nothing"
+        print(f"    Mining queue {summary.get('state')}: mined {mined} in {summary.get('ticks', '?')} ticks."
+              + (f" ({summary['message']})" if summary.get("message") else ""))
+        metrics.inc("agent_mined_units_total", sum((summary.get("mined") or {}).values()), bot=self.name)
+        return summary.get("state") == "done"
+
+    def mine_single(self, entity, snapshot):
+        print(f"  Selected entity for mining: {entity.get('name')} (ID: {entity.get('unit_number')}, Pos: {entity.get('position')}, Amt: {entity.get('amount', 'N/A')})")
+        distance_sq = (snapshot["x"] - entity["x"]) ** 2 + (snapshot["y"] - entity["y"]) ** 2
+        if distance_sq <= MINING_REACH ** 2:
+            print(f"  Player is already close enough to mining target (Dist^2: {distance_sq:.2f}). Skipping movement.")
+        else:
+            print(f"  Moving to entity {entity.get('unit_number')} at ({entity['x']}, {entity['y']}) to mine...")
+            if not self.walk_to(entity["x"], entity["y"], MINE_MOVE_TIMEOUT):
+                print("    Failed to reach mining position or movement timed out.")
+                return False
+
+        print(f"  Executing MINE RCON command for {entity.get('name')} (ID: {entity.get('unit_number')}).")
+        mine_resp = self.rcon.mine_target_entity(entity.get('unit_number'), (entity["x"], entity["y"]), entity.get("name"))
+        print(f"    MINE command RCON response: {mine_resp}")
+        if not mine_resp or mine_resp.get("status") != "mining_initiated":
+            print(f"    Failed to initiate mining via RCON or error reported: {mine_resp}")
+            return False
+        # Wait for the mod to report the mined item instead of sleeping for a guessed duration.
+        mined = self.rcon.wait_for_mining(mine_resp.get("event_cursor", 0), timeout=MINE_TIMEOUT)
+        if mined.get("mined"):
+            print(f"    Mined {mined.get('count')} {mined.get('item')} (tick {mined.get('tick')}).")
+            return True
+        print(f"    Mining did not complete. State: {mined.get('state')}")
+        return False
+
+    # --- Scheduling ---
+
+    def _backoff(self, reason):
+        """
+        Sleeps only after consecutive failures (exponential, capped) so a broken server or API is
+        not hammered; the first failure retries immediately.
+        """
+        self.failures += 1
+        if self.failures > 1:
+            delay = min(self.retry_delay * 2 ** (self.failures - 2), self.max_retry_delay)
+            print(f"{reason} Retrying in {delay:.1f}s...")
+            metrics.inc("agent_sleep_seconds_total", delay, reason="backoff")
+            self.rcon.sleep(delay)
+        else:
+            print(f"{reason} Retrying now...")
+
+    def _sense_until_ok(self, max_attempts=10):
+        for _ in range(max_attempts):
+            snapshot = self.sense()
+            if snapshot is not None:
+                return snapshot
+            self._backoff("Could not read game state.")
+        raise ConnectionError("Could not read game state from the mod.")
+
+    def run(self, max_loops):
+        snapshot = self._sense_until_ok()
+        if not self.agent:
+            print("THINK: Skipping AI decision (GeminiAgent not initialized).")
+            print("Stopping loop as no decisions can be made.")
+            return
+        print("THINK: Asking Gemini for the next action...")
+        decision_future = self._submit_think(snapshot)
+
+        while self.stats["cycles"] < max_loops:
+            self.stats["cycles"] += 1
+            metrics.inc("agent_cycles_total", bot=self.name)
+            print(f"\n--- Main Loop Iteration: {self.stats['cycles']}/{max_loops} ---")
+
+            if self.action_queue:
+                decision = self.action_queue.popleft()
+                decision_future.cancel() # Thought about the state before the queued action; rethink afterwards
+                print(f"  Running queued action: {decision.get('action')}")
+            else:
+                wait_start = time.time()
+                decision = decision_future.result()
+                self.stats["think_wait"] += time.time() - wait_start
+                metrics.observe("agent_think_wait_seconds", time.time() - wait_start, bot=self.name)
+            if not decision or "action" not in decision:
+                self._backoff("Gemini failed to provide a valid action.")
+                snapshot = self._sense_until_ok()
+                decision_future = self._submit_think(snapshot)
+                continue
+            print(f"  AI Action: {decision.get('action')}, Params: {decision.get('parameters', {})}, Reasoning: {decision.get('reasoning', 'No reasoning provided.')}")
+
+            mine_target = None
+            if decision.get("action") == "MINE":
+                mine_target = self.resolve_mine_target(decision.get("parameters") or {}, snapshot, quiet=True)
+            act_start = time.time()
+            act_future = self._executor.submit(self.act, decision, snapshot, mine_target)
+
+            # Think about the next step while the character is busy.
+            speculation = None
+            if self.speculate:
+                predicted = self.predict(decision, snapshot)
+                if predicted is not None:
+                    print("THINK: Speculatively deciding the step after this action...")
+                    speculation = (self.world_key(predicted), self._submit_think(predicted, speculative=True))
+
+            try:
+                succeeded = act_future.result()
+            except Exception as e:
+                print(f"  Action raised an error: {e}")
+                succeeded = False
+            self.stats["act_time"] += time.time() - act_start
+            self.stats["actions"] += 1
+            metrics.observe("agent_phase_seconds", time.time() - act_start, phase="act", bot=self.name)
+            metrics.inc("agent_actions_total", action=decision.get("action"), result="ok" if succeeded else "failed", bot=self.name)
+            if succeeded:
+                self.failures = 0
+            record_result = getattr(self.agent, "record_result", None)
+            if record_result is not None: # Lets a local policy steer away from targets that keep failing
+                record_result(decision, succeeded)
+
+            snapshot = self.sense() if succeeded else None
+            if snapshot is None:
+                if speculation:
+                    speculation[1].cancel()
+                    self.stats["speculative_misses"] += 1
+                    metrics.inc("agent_speculation_total", result="miss", bot=self.name)
+                self._backoff("Action failed.")
+                snapshot = self._sense_until_ok()
+            elif speculation and speculation[0] == self.world_key(snapshot):
+                print("THINK: World matches the prediction; using the speculative decision.")
+                self.stats["speculative_hits"] += 1
+                metrics.inc("agent_speculation_total", result="hit", bot=self.name)
+                decision_future = speculation[1]
+                continue
+            elif speculation:
+                print("THINK: World changed during the action; discarding the speculative decision.")
+                speculation[1].cancel() # A model call already in flight just finishes unused
+                self.stats["speculative_misses"] += 1
+                metrics.inc("agent_speculation_total", result="miss", bot=self.name)
+            print("THINK: Asking Gemini for the next action...")
+            decision_future = self._submit_think(snapshot)
+
+        print(f"Pipeline stats ({self.name}): {self.stats}")
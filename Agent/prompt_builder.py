@@ -0,0 +1,253 @@
+import math
+
+CHARS_PER_TOKEN = 4 # Rough average for English text and JSON-ish state; no tokenizer call per prompt
+WOOD_ITEM = "wood"
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _position(entity):
+    position = entity.get("position", {})
+    return float(entity.get("x", position.get("x", 0))), float(entity.get("y", position.get("y", 0)))
+
+
+def _format_number(value):
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+class PromptBuilder:
+    """
+    Builds GeminiAgent prompts: a static instruction prefix, built once per goal so it can be
+    sent as a cached system instruction, followed by the current state.
+
+    The state is filled into a token budget (estimated at CHARS_PER_TOKEN characters per token)
+    in order of importance instead of being cut at a fixed position: the task and player state
+    always go in, then resource patches (one line per patch instead of one per ore tile),
+    entities ranked by need, distance and richness (taking turns between resource types so one
+    type cannot fill the list) and recipes in crafting-plan order.
+    """
+
+    def __init__(self, goal_item, goal_quantity, token_budget=1200, max_entities=15, max_recipes=12,
+                 max_inventory_items=25, richness_weight=1.5, max_patches=10):
+        self.goal_item = goal_item
+        self.goal_quantity = goal_quantity
+        self.token_budget = token_budget
+        self.max_entities = max_entities
+        self.max_recipes = max_recipes
+        self.max_inventory_items = max_inventory_items
+        self.richness_weight = richness_weight
+        self.max_patches = max_patches
+        self._prefix = None
+        self.last_stats = {}
+
+    def static_prefix(self):
+        """
+        Role, goal, action formats, examples and rules. Identical for every call with this goal.
+        """
+        if self._prefix is None:
+            self._prefix = f"""You are an AI agent playing Factorio.
+Overall Goal: Produce {self.goal_quantity} {self.goal_item} and work towards automating its production.
+
+Each turn you get the current task, the player state, the known resource patches (patch id, resource, number of tiles, total amount, centre, extent and distance), other nearby resources such as trees (name, position, distance, remaining amount, and 'id' when the entity has a unit_number), when available where to explore next and where the densest remembered deposits are, and the recipes needed for the goal. Choose the single most important action to perform NEXT for the current task.
+Respond with ONLY a valid JSON object specifying the action and its parameters. Valid actions are:
+1. "MOVE": Move to a specific x, y coordinate, to get closer to resources or a strategic location.
+   Parameters: {{"x": float, "y": float}}
+2. "MINE": Mine a target resource. The agent walks to it first if needed and keeps mining nearby ones of the same type until it has `quantity` units.
+   Parameters: {{"patch_id": int | null, "target_entity_id": int | null, "target_name": "resource-name" | null, "quantity": int (optional, default 10)}}
+   - Give `patch_id` to mine the closest tile of a listed resource patch.
+   - Give `target_entity_id` for a listed entity that has an 'id'.
+   - Otherwise give `target_name` (e.g. "iron-ore", "coal", "stone", "tree-01") and the agent mines the closest known one.
+3. "CRAFT": Craft an item from a recipe (only recipes that need no machine).
+   Parameters: {{"recipe_name": "recipe-internal-name", "quantity": int}}
+
+Examples:
+{{"action": "MOVE", "parameters": {{"x": 123.5, "y": -45.0}}, "reasoning": "Moving to a large iron ore patch spotted earlier."}}
+{{"action": "MINE", "parameters": {{"patch_id": 3, "target_entity_id": null, "target_name": "iron-ore", "quantity": 20}}, "reasoning": "Need 20 iron ore for plates; iron patch 3 is close and rich."}}
+{{"action": "CRAFT", "parameters": {{"recipe_name": "stone-furnace", "quantity": 1}}, "reasoning": "Need a furnace to smelt iron ore."}}
+
+Rules:
+- If a resource the task needs is listed, MINE it, preferring closer and richer (higher amount) ones.
+- If it is not listed, MOVE towards its densest remembered deposit, or to the nearest unexplored area.
+- Only CRAFT if you have the ingredients and the item is essential for the current task.
+- Your response must be ONLY the JSON object: no other text, explanations or markdown.
+"""
+        return self._prefix
+
+    @staticmethod
+    def needed_names(plan):
+        """
+        Entity names that yield raw materials the plan still needs (trees count for wood).
+        """
+        return set((plan or {}).get("raw", {}))
+
+    @staticmethod
+    def _kind(name):
+        return "tree" if (name or "").startswith("tree") else name # All tree variants yield wood
+
+    def _is_needed(self, kind, needed):
+        return kind in needed or (kind == "tree" and WOOD_ITEM in needed)
+
+    def rank_entities(self, entities, x, y, needed):
+        """
+        Orders candidate entities for the prompt. Within a resource type, lower
+        distance - richness_weight * log2(1 + amount) is better. The best entity of every type
+        comes first (needed types first), then the other entities of needed types, taking turns
+        between types, then those of the remaining types.
+        """
+        by_kind = {}
+        seen = set()
+        for entity in entities:
+            ex, ey = _position(entity)
+            key = entity.get("key") or (entity.get("name"), ex, ey)
+            if key in seen:
+                continue
+            seen.add(key)
+            distance = math.hypot(ex - x, ey - y)
+            score = distance - self.richness_weight * math.log2(1 + (entity.get("amount") or 0))
+            by_kind.setdefault(self._kind(entity.get("name")), []).append((score, distance, entity))
+        for candidates in by_kind.values():
+            candidates.sort(key=lambda c: (c[0], c[1]))
+        kinds = sorted(by_kind, key=lambda k: (not self._is_needed(k, needed), by_kind[k][0][0], k or ""))
+
+        ranked = [by_kind[kind][0] for kind in kinds]
+        for tier in ([k for k in kinds if self._is_needed(k, needed)], [k for k in kinds if not self._is_needed(k, needed)]):
+            depth = 1
+            while any(depth < len(by_kind[k]) for k in tier) and len(ranked) < self.max_entities:
+                ranked.extend(by_kind[k][depth] for k in tier if depth < len(by_kind[k]))
+                depth += 1
+        return [(distance, entity) for _, distance, entity in ranked[:self.max_entities]]
+
+    def rank_patches(self, patches, needed):
+        """
+        Patches of needed resources first, then by distance - richness_weight * log2(1 + amount).
+        """
+        def score(patch):
+            return (not self._is_needed(patch.get("name"), needed),
+                    patch.get("distance", 0) - self.richness_weight * math.log2(1 + (patch.get("amount") or 0)), patch.get("patch_id", 0))
+        return sorted(patches, key=score)[:self.max_patches]
+
+    @staticmethod
+    def patch_line(patch):
+        min_x, min_y, max_x, max_y = patch["bbox"]
+        return (f"- patch {patch['patch_id']}: {patch['name']}, {patch['tiles']} tiles, amount {patch['amount']}, "
+                f"centre ({patch['x']:.1f}, {patch['y']:.1f}), spans ({min_x}, {min_y})-({max_x}, {max_y}), dist {patch.get('distance', 0):.0f}")
+
+    def exploration_lines(self, exploration, needed):
+        """
+        Where to explore next and, needed resources first, the densest remembered chunk of each
+        resource (from the persistent exploration map, so it may be outside the current scan).
+        """
+        lines = []
+        unexplored = (exploration or {}).get("unexplored")
+        if unexplored:
+            lines.append(f"- nearest unexplored area: ({unexplored['x']:.0f}, {unexplored['y']:.0f}), dist {unexplored['distance']:.0f}")
+        densest = (exploration or {}).get("densest") or {}
+        for name in sorted(densest, key=lambda n: (not self._is_needed(n, needed), densest[n].get("distance", 0))):
+            chunk = densest[name]
+            lines.append(f"- densest {name} seen: chunk around ({chunk['x']:.0f}, {chunk['y']:.0f}), "
+                         f"{'count' if name == 'tree' else 'amount'} {chunk['amount']:.0f}, dist {chunk['distance']:.0f}")
+        return lines
+
+    def rank_recipes(self, graph, plan):
+        """
+        Recipes still to craft in plan order first, then the other recipes the goal depends on.
+        """
+        crafts = {step["recipe"]: step["crafts"] for step in (plan or {}).get("steps", [])}
+        ranked = [(graph.recipes[name], crafts[name]) for name in crafts if name in graph.recipes]
+        rest = sorted((r for r in graph.relevant_recipes(self.goal_item) if r["name"] not in crafts), key=lambda r: r["name"])
+        ranked.extend((recipe, None) for recipe in rest)
+        return ranked[:self.max_recipes]
+
+    @staticmethod
+    def entity_line(distance, entity):
+        ex, ey = _position(entity)
+        line = f"- {entity.get('name')} at ({ex:.1f}, {ey:.1f}) dist {distance:.0f}"
+        if entity.get("amount"):
+            line += f", amount {entity['amount']}"
+        if entity.get("unit_number") is not None:
+            line += f", id:{entity['unit_number']}"
+        return line
+
+    @staticmethod
+    def recipe_line(recipe, crafts):
+        ingredients = " + ".join(f"{i['amount']} {i['name']}" for i in recipe.get("ingredients", []))
+        products = " + ".join(f"{_format_number(p.get('amount', 1))} {p['name']}" for p in recipe.get("products", []))
+        line = f"- {recipe['name']} ({recipe.get('category', 'crafting')}): {ingredients or 'nothing'} -> {products or 'nothing'}"
+        if crafts:
+            line += f" [still to craft: {crafts}x]"
+        return line
+
+    def inventory_text(self, inventory, relevant):
+        items = sorted(inventory.items(), key=lambda kv: (kv[0] not in relevant, -kv[1], kv[0]))
+        shown = ", ".join(f"{name}: {count}" for name, count in items[:self.max_inventory_items])
+        if len(items) > self.max_inventory_items:
+            shown += f" (+{len(items) - self.max_inventory_items} more item types)"
+        return shown or "empty"
+
+    def build(self, game_state, nearby_entities, graph, plan, task_description, include_prefix=True):
+        """
+        Returns the prompt for one decision. With include_prefix=False the static prefix is left
+        out (it was sent as a cached system instruction) and the budget covers only the state.
+        """
+        prefix = self.static_prefix() if include_prefix else ""
+        position = game_state.get("position") or {}
+        x, y = float(position.get("x", 0)), float(position.get("y", 0))
+        inventory = game_state.get("inventory") or {}
+        needed = self.needed_names(plan)
+        relevant = needed | {step["recipe"] for step in (plan or {}).get("steps", [])} | {self.goal_item}
+
+        head = (f"{task_description}\n\n"
+                f"Player: position ({x:.1f}, {y:.1f}), health {game_state.get('health')}, tick {game_state.get('tick')}\n"
+                f"Inventory: {self.inventory_text(inventory, relevant)}\n")
+        used = estimate_tokens(prefix) + estimate_tokens(head) + 40 # Section titles and the closing line
+
+        # Resources that have patches are listed per patch, not per tile. "known" holds the closest
+        # remembered entity of each type, including ones outside the scan.
+        patches = self.rank_patches((nearby_entities or {}).get("patches") or [], needed)
+        patched = {patch["name"] for patch in patches}
+        candidates = [entity for entity in list((nearby_entities or {}).get("entities", [])) + list((nearby_entities or {}).get("known", []))
+                      if entity.get("name") not in patched]
+        patch_lines = [self.patch_line(patch) for patch in patches]
+        exploration_lines = self.exploration_lines((nearby_entities or {}).get("exploration"), needed)
+        entity_lines = [self.entity_line(distance, entity) for distance, entity in self.rank_entities(candidates, x, y, needed)]
+        recipe_lines = [self.recipe_line(recipe, crafts) for recipe, crafts in self.rank_recipes(graph, plan)]
+
+        # The most relevant few of each section go in first, then the rest while the budget lasts.
+        chosen = {"patches": [], "entities": [], "recipes": [], "exploration": []}
+        order = ([("patches", line) for line in patch_lines[:5]] + [("exploration", line) for line in exploration_lines[:2]]
+                 + [("entities", line) for line in entity_lines[:5]]
+                 + [("recipes", line) for line in recipe_lines[:3]] + [("patches", line) for line in patch_lines[5:]]
+                 + [("entities", line) for line in entity_lines[5:]] + [("recipes", line) for line in recipe_lines[3:]]
+                 + [("exploration", line) for line in exploration_lines[2:]])
+        for section, line in order:
+            cost = estimate_tokens(line) + 1
+            if used + cost <= self.token_budget:
+                chosen[section].append(line)
+                used += cost
+
+        patches_text = "\n".join(chosen["patches"]) or "None known"
+        if len(patch_lines) > len(chosen["patches"]):
+            patches_text += f"\n(+{len(patch_lines) - len(chosen['patches'])} more not shown)"
+        entities_text = "\n".join(chosen["entities"]) or "None visible"
+        omitted = len(entity_lines) - len(chosen["entities"])
+        if omitted:
+            entities_text += f"\n(+{omitted} more not shown)"
+        recipes_text = "\n".join(chosen["recipes"]) or "No recipes loaded."
+        if len(graph):
+            recipes_text = f"({len(graph)} recipes known; those needed for the goal:)\n" + recipes_text
+
+        exploration_text = ("Exploration:\n" + "\n".join(chosen["exploration"]) + "\n\n") if chosen["exploration"] else ""
+
+        state = (f"{head}\nResource Patches (most relevant first):\n{patches_text}\n\n"
+                 f"Other Nearby Resources (most relevant first):\n{entities_text}\n\n"
+                 f"{exploration_text}"
+                 f"Recipes:\n{recipes_text}\n\n"
+                 "Respond with ONLY the JSON object for the next action.")
+        prompt = prefix + "\n" + state if prefix else state
+        self.last_stats = {"tokens": estimate_tokens(prompt), "patches": len(chosen["patches"]),
+                           "patches_omitted": len(patch_lines) - len(chosen["patches"]),
+                           "entities": len(chosen["entities"]), "entities_omitted": omitted,
+                           "recipes": len(chosen["recipes"]), "recipes_omitted": len(recipe_lines) - len(chosen["recipes"])}
+        return prompt
@@ -0,0 +1,361 @@
+import asyncio
+import itertools
+import json
+import struct
+import time
+
+from metrics import SIZE_BUCKETS, registry as metrics
+
+try:
+    import orjson # Optional fast path for decoding large payloads
+except ImportError:
+    orjson = None
+
+# Source RCON packet types (https://developer.valvesoftware.com/wiki/Source_RCON_Protocol)
+SERVERDATA_AUTH = 3
+SERVERDATA_AUTH_RESPONSE = 2
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_RESPONSE_VALUE = 0
+
+MOD_INTERFACE_NAME = "factorio_autonomo_bot"
+
+# Sentinels the mod writes around every remote interface response (see framed() in control.lua).
+RESPONSE_START = "<<AFB>>"
+RESPONSE_END = "<</AFB>>"
+
+_json_decoder = json.JSONDecoder()
+
+
+def encode_packet(request_id, packet_type, body):
+    """
+    Encodes a single RCON packet: little-endian size, id and type, followed by the
+    null-terminated body and an empty null-terminated string.
+    """
+    payload = struct.pack("<ii", request_id, packet_type) + body.encode("utf-8") + b"\x00\x00"
+    return struct.pack("<i", len(payload)) + payload
+
+
+async def read_packet(reader):
+    """
+    Reads one RCON packet from an asyncio StreamReader and returns (request_id, packet_type, body).
+    Raises asyncio.IncompleteReadError if the connection closes mid-packet.
+    """
+    size_bytes = await reader.readexactly(4)
+    (size,) = struct.unpack("<i", size_bytes)
+    data = await reader.readexactly(size)
+    request_id, packet_type = struct.unpack("<ii", data[:8])
+    body = data[8:-2].decode("utf-8", errors="replace")
+    return request_id, packet_type, body
+
+
+def to_lua_literal(value):
+    """
+    Converts a Python value (dict, list, str, number, bool, None) into a Lua table/literal string
+    suitable for passing as a remote.call argument.
+    """
+    if value is None:
+        return "nil"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return f'"{escaped}"'
+    if isinstance(value, dict):
+        parts = []
+        for k, v in value.items():
+            key = str(k)
+            if key.isidentifier():
+                parts.append(f"{key}={to_lua_literal(v)}")
+            else:
+                parts.append(f"[{to_lua_literal(key)}]={to_lua_literal(v)}")
+        return "{" + ", ".join(parts) + "}"
+    if isinstance(value, (list, tuple)):
+        return "{" + ", ".join(to_lua_literal(v) for v in value) + "}"
+    raise TypeError(f"Unsupported parameter type for Lua call: {type(value)}")
+
+
+def build_remote_call(function_name, params=None):
+    """
+    Builds the /sc command that runs remote.call on the mod interface and prints the result.
+    """
+    param_str = ""
+    if params is not None:
+        param_str = ", " + to_lua_literal(params)
+    lua_command = f'game.print(remote.call("{MOD_INTERFACE_NAME}", "{function_name}"{param_str}))'
+    return f"/sc {lua_command}" # /silent-command
+
+
+def extract_json(text):
+    """
+    Returns the first JSON object or array embedded in free text, or None. Each candidate
+    opening bracket is tried with JSONDecoder.raw_decode, which stops at the end of the value
+    instead of backtracking over the rest of the text.
+    """
+    pos = 0
+    while True:
+        candidates = [i for i in (text.find("{", pos), text.find("[", pos)) if i != -1]
+        if not candidates:
+            return None
+        start = min(candidates)
+        try:
+            value, _ = _json_decoder.raw_decode(text, start)
+            return value
+        except json.JSONDecodeError:
+            pos = start + 1
+
+
+def parse_json_response(raw_response):
+    """
+    Extracts and decodes the JSON payload from a raw RCON response. Returns None if no
+    valid JSON is found.
+
+    Framed responses are decoded directly between RESPONSE_START and RESPONSE_END. Debug output
+    printed while the action ran comes before the result, so both markers are found with short
+    scans from either end. Unframed responses from older mod versions fall back to extract_json.
+    """
+    if not raw_response:
+        print("Received empty response from RCON.")
+        return None
+    start = raw_response.find(RESPONSE_START)
+    if start != -1:
+        body_start = start + len(RESPONSE_START)
+        end = raw_response.rfind(RESPONSE_END, body_start)
+        try:
+            if orjson is not None:
+                return orjson.loads(raw_response[body_start:end] if end != -1 else raw_response[body_start:])
+            value, value_end = _json_decoder.raw_decode(raw_response, body_start)
+            if end != -1 and value_end != end:
+                raise ValueError(f"Unexpected data after JSON payload at position {value_end}")
+            return value
+        except ValueError as e:
+            print(f"Failed to decode JSON: {e}")
+            print(f"Full raw response for context: '{raw_response[:500]}'")
+            return None
+    data = extract_json(raw_response)
+    if data is None:
+        print(f"Could not find valid JSON in RCON response: '{raw_response[:500]}'")
+    return data
+
+
+class AsyncFactorioRCONClient:
+    """
+    Asyncio RCON client that speaks the Source RCON protocol directly.
+
+    Several commands can be in flight at once; responses are matched to requests by packet id.
+    Each request has its own timeout, and a dropped connection is re-established on the next
+    command instead of being tracked by the caller. If `trace` is set (a
+    session_trace.TraceWriter), every command and its response or error is recorded.
+    """
+
+    def __init__(self, host, port, password, timeout=10.0, reconnect_attempts=3, reconnect_delay=0.5):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._connect_lock = None
+        self._write_lock = None
+        self.trace = None
+
+    @property
+    def is_connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    def _next_id(self):
+        request_id = next(self._ids)
+        if request_id >= 2**31 - 1:
+            self._ids = itertools.count(1)
+            request_id = next(self._ids)
+        return request_id
+
+    async def connect(self):
+        """
+        Opens the TCP connection, authenticates and starts the background response reader.
+        """
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+            self._write_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self.is_connected:
+                return
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+            auth_id = self._next_id()
+            writer.write(encode_packet(auth_id, SERVERDATA_AUTH, self.password))
+            await writer.drain()
+            # Some servers send an empty RESPONSE_VALUE before the AUTH_RESPONSE; skip it.
+            while True:
+                request_id, packet_type, _ = await asyncio.wait_for(read_packet(reader), self.timeout)
+                if packet_type == SERVERDATA_AUTH_RESPONSE:
+                    break
+            if request_id == -1 or request_id != auth_id:
+                writer.close()
+                raise ConnectionError("RCON authentication failed (check FACTORIO_RCON_PASSWORD).")
+            self._reader, self._writer = reader, writer
+            self._reader_task = asyncio.ensure_future(self._read_responses())
+            metrics.inc("rcon_connects_total")
+
+    async def disconnect(self):
+        if self._reader_task:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._writer:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader, self._writer = None, None
+        self._fail_pending(ConnectionError("RCON client disconnected."))
+
+    def _fail_pending(self, exc):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self._pending.clear()
+
+    async def _read_responses(self):
+        try:
+            while True:
+                request_id, _, body = await read_packet(self._reader)
+                future = self._pending.pop(request_id, None)
+                if future and not future.done():
+                    future.set_result(body)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"RCON connection lost: {e}")
+            metrics.inc("rcon_connections_lost_total")
+            if self._writer:
+                self._writer.close()
+            self._reader, self._writer = None, None
+            self._fail_pending(ConnectionError(f"RCON connection lost: {e}"))
+
+    async def _ensure_connected(self):
+        delay = self.reconnect_delay
+        last_error = None
+        for attempt in range(1, self.reconnect_attempts + 1):
+            if self.is_connected:
+                return
+            try:
+                await self.connect()
+                return
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                last_error = e
+                metrics.inc("rcon_connect_failures_total")
+                print(f"RCON connect attempt {attempt}/{self.reconnect_attempts} failed: {e}")
+                await asyncio.sleep(delay)
+                delay *= 2
+        raise ConnectionError(f"RCON reconnection failed: {last_error}")
+
+    async def command(self, command, timeout=None):
+        """
+        Sends a console command and returns the raw response body. Many commands may be
+        awaited concurrently; each one is matched to its own response.
+        """
+        if self.trace is None:
+            return await self._command(command, timeout)
+        started = time.time()
+        try:
+            response = await self._command(command, timeout)
+        except Exception as e:
+            self.trace.record("rcon", t=started, dt=time.time() - started, command=command, error=str(e), error_type=type(e).__name__)
+            raise
+        self.trace.record("rcon", t=started, dt=time.time() - started, command=command, response=response)
+        return response
+
+    async def _command(self, command, timeout=None):
+        await self._ensure_connected()
+        request_id = self._next_id()
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            async with self._write_lock:
+                self._writer.write(encode_packet(request_id, SERVERDATA_EXECCOMMAND, command))
+                await self._writer.drain()
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("rcon_timeouts_total")
+            raise TimeoutError(f"RCON command timed out after {timeout or self.timeout}s: {command[:80]}")
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def call_lua(self, function_name, params=None):
+        """
+        Executes a remote.call to a Lua function in the mod and returns the decoded JSON result,
+        or None on failure.
+        """
+        try:
+            rcon_command = build_remote_call(function_name, params)
+        except TypeError as e:
+            print(f"Warning: {e}")
+            return None
+        try:
+            with metrics.timer("rcon_call_seconds", function=function_name):
+                raw_response = await self.command(rcon_command)
+            if metrics.enabled:
+                metrics.observe("rcon_request_bytes", len(rcon_command), buckets=SIZE_BUCKETS, function=function_name)
+                metrics.observe("rcon_response_bytes", len(raw_response or ""), buckets=SIZE_BUCKETS, function=function_name)
+            with metrics.timer("rcon_parse_seconds", function=function_name):
+                return parse_json_response(raw_response)
+        except ConnectionError as e:
+            metrics.inc("rcon_errors_total", function=function_name, kind="connection")
+            print(f"RCON Connection error during Lua call '{function_name}': {e}")
+            return None
+        except Exception as e:
+            metrics.inc("rcon_errors_total", function=function_name, kind=type(e).__name__)
+            print(f"An unexpected error occurred during Lua call '{function_name}': {e}")
+            return None
+
+    async def call_many(self, calls):
+        """
+        Runs several mod actions in a single RCON round trip via the mod's `batch` remote function.
+        `calls` is a list of (request_id, function_name, params) tuples; params may be None.
+        Returns a dict mapping each request_id to its decoded result (None if it is missing).
+        """
+        batch_calls = []
+        for request_id, function_name, params in calls:
+            call = {"id": str(request_id), "fn": function_name}
+            metrics.inc("rcon_batched_calls_total", function=function_name)
+            if params is not None:
+                call["params"] = params
+            batch_calls.append(call)
+
+        envelope = await self.call_lua("batch", {"calls": batch_calls})
+        if not envelope or "results" not in envelope:
+            print(f"Batch call failed or returned unexpected data: {envelope}")
+            return {str(request_id): None for request_id, _, _ in calls}
+        results = envelope["results"]
+        return {str(request_id): results.get(str(request_id)) for request_id, _, _ in calls}
+
+
+class RCONConnectionPool(AsyncFactorioRCONClient):
+    """
+    Spreads commands over `size` RCON connections to the same server, sending each command on
+    the connected client with the fewest requests in flight. Used when many bots share one process.
+    """
+
+    def __init__(self, host, port, password, size=4, **kwargs):
+        super().__init__(host, port, password, **kwargs)
+        self.clients = [AsyncFactorioRCONClient(host, port, password, **kwargs) for _ in range(max(1, size))]
+
+    @property
+    def is_connected(self):
+        return any(client.is_connected for client in self.clients)
+
+    async def connect(self):
+        await asyncio.gather(*(client.connect() for client in self.clients))
+
+    async def disconnect(self):
+        await asyncio.gather(*(client.disconnect() for client in self.clients))
+
+    async def _command(self, command, timeout=None):
+        client = min(self.clients, key=lambda c: (not c.is_connected, len(c._pending)))
+        return await client.command(command, timeout)
@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+
+from metrics import registry as metrics
+
+DEFAULT_PAGE_SIZE = 100
+MAX_FINGERPRINTS = 8 # Recipe sets kept on disk (one per save/research state seen recently)
+
+
+class RecipeCache:
+    """
+    Recipe sets on disk, keyed by the mod's recipe fingerprint (active mod versions plus the
+    force's researched technologies). load() asks the mod for the fingerprint, one small call,
+    and only fetches the recipes, page by page, when no stored set matches it. A fetch that fails
+    falls back to the most recently stored set, so the agent can start without a working export.
+
+    `epoch` is the mod's research counter when the recipes were loaded; the agent loop compares
+    it with the one get_player_info reports and calls refresh() when research changed.
+    Without a path the cache only lives in memory (e.g. replays, which must not touch the file).
+    """
+
+    def __init__(self, path=None, page_size=DEFAULT_PAGE_SIZE, max_fingerprints=MAX_FINGERPRINTS):
+        self.path = path
+        self.page_size = page_size
+        self.max_fingerprints = max_fingerprints
+        self.fingerprint = None
+        self.epoch = None
+        self.recipes = None
+        self._entries = {} # fingerprint -> {"stored_at", "recipes"}
+        self._lock = threading.Lock()
+        self.load_file()
+
+    def load_file(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load recipe cache from {self.path}: {e}")
+            return
+        self._entries = stored.get("entries", {})
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": self._entries}, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not save recipe cache to {self.path}: {e}")
+
+    def _store(self, fingerprint, recipes):
+        self._entries[fingerprint] = {"stored_at": time.time(), "recipes": recipes}
+        while len(self._entries) > self.max_fingerprints:
+            oldest = min(self._entries, key=lambda key: self._entries[key]["stored_at"])
+            del self._entries[oldest]
+        self.save()
+
+    def _latest(self):
+        if not self._entries:
+            return None
+        return max(self._entries.values(), key=lambda entry: entry["stored_at"])["recipes"]
+
+    @staticmethod
+    def _call(method, **kwargs):
+        try:
+            return method(**kwargs)
+        except Exception as e: # A failed export must not stop the agent from starting
+            return {"error": str(e)}
+
+    def fetch(self, rcon_client):
+        """
+        Reads every enabled recipe from the mod in pages of `page_size`. Returns the list, or None
+        on an error response.
+        """
+        recipes = []
+        offset = 0
+        while offset is not None:
+            with metrics.timer("agent_recipe_page_seconds"):
+                page = self._call(rcon_client.get_recipes, offset=offset, limit=self.page_size)
+            if not page or "error" in page or "recipes" not in page:
+                print(f"Failed to fetch recipes at offset {offset}: {page.get('error', 'Unknown error') if page else 'No response'}.")
+                return None
+            recipes.extend(page["recipes"] or []) # An empty page is encoded as []
+            offset = page.get("next")
+            if offset is not None and offset <= page.get("offset", 0):
+                break # A mod that ignores paging returned everything at once
+        return recipes
+
+    def load(self, rcon_client):
+        """
+        Returns the recipes payload ({"recipes": [...]}) for the current fingerprint, fetching
+        it only if it is not cached. Never raises for a failed fetch: the last stored set (or an
+        empty one) is returned instead.
+        """
+        with self._lock:
+            info = self._call(rcon_client.get_recipe_fingerprint)
+            if not info or "error" in info or "fingerprint" not in info:
+                # Mods without the fingerprint action: always fetch, still in pages if supported.
+                print(f"Recipe fingerprint unavailable ({info.get('error', 'Unknown error') if info else 'No response'}); fetching recipes.")
+                fingerprint, epoch = None, None
+            else:
+                fingerprint, epoch = info["fingerprint"], info.get("epoch")
+
+            entry = self._entries.get(fingerprint) if fingerprint is not None else None
+            if entry is not None:
+                metrics.inc("agent_recipe_cache_total", result="hit")
+                recipes = entry["recipes"]
+                print(f"Loaded {len(recipes)} recipes from the recipe cache.")
+            else:
+                metrics.inc("agent_recipe_cache_total", result="miss")
+                recipes = self.fetch(rcon_client)
+                if recipes is not None:
+                    print(f"Fetched {len(recipes)} recipes.")
+                    if fingerprint is not None:
+                        self._store(fingerprint, recipes)
+                else:
+                    metrics.inc("agent_recipe_cache_total", result="stale")
+                    recipes = self._latest()
+                    if recipes is not None:
+                        print(f"Using {len(recipes)} recipes from the recipe cache, which may be out of date.")
+                    else:
+                        print("No recipes available; continuing without recipe knowledge.")
+                        recipes = []
+                    fingerprint = None # Not confirmed: look again at the next refresh
+
+            # Same set as before: keep the payload object so RecipeGraph is not rebuilt.
+            if fingerprint is None or fingerprint != self.fingerprint or self.recipes is None:
+                self.recipes = {"recipes": recipes}
+            self.fingerprint, self.epoch = fingerprint, epoch
+            return self.recipes
+
+    def refresh(self, rcon_client, epoch=None):
+        """
+        Reloads after the mod reported research epoch `epoch`; returns the (possibly unchanged)
+        recipes payload. Several loops sharing the cache reload only once per epoch.
+        """
+        if epoch is not None and epoch == self.epoch and self.fingerprint is not None and self.recipes is not None:
+            return self.recipes
+        previous = self.fingerprint
+        recipes = self.load(rcon_client)
+        if self.fingerprint != previous:
+            print(f"Recipes changed (research epoch {self.epoch}); now {len(recipes['recipes'])} recipes.")
+        return recipes
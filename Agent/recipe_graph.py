@@ -0,0 +1,167 @@
+import math
+from collections import Counter, OrderedDict
+
+# Fuel estimate for smelting steps: a stone furnace draws 90 kW and coal holds 4 MJ.
+SMELTING_CATEGORY = "smelting"
+FURNACE_POWER_W = 90e3
+FUEL_ITEM = "coal"
+FUEL_VALUE_J = 4e6
+
+
+def _product_amount(product):
+    amount = product.get("amount")
+    if amount is None:
+        amount = 1
+    return amount * product.get("probability", 1)
+
+
+class RecipeGraph:
+    """
+    Index over the get_all_unlocked_recipes payload: product -> recipes and ingredient -> recipes.
+
+    plan() expands a target item into raw-resource requirements and a crafting order, taking
+    the current inventory and multi-product byproducts into account. Items on a cycle
+    (e.g. a recipe that needs its own product) are treated as raw at the point the cycle closes.
+    Results are memoized per target and relevant inventory.
+    """
+
+    def __init__(self, recipes):
+        if isinstance(recipes, dict):
+            recipes = recipes.get("recipes", [])
+        self.recipes = OrderedDict((recipe["name"], recipe) for recipe in recipes)
+        self.producers = {}
+        self.consumers = {}
+        for name, recipe in self.recipes.items():
+            for product in recipe.get("products", []):
+                self.producers.setdefault(product["name"], []).append(name)
+            for ingredient in recipe.get("ingredients", []):
+                self.consumers.setdefault(ingredient["name"], []).append(name)
+        self._best_recipe_cache = {}
+        self._closure_cache = {}
+        self._plan_cache = {}
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def recipes_producing(self, item):
+        return [self.recipes[name] for name in self.producers.get(item, [])]
+
+    def recipes_using(self, item):
+        return [self.recipes[name] for name in self.consumers.get(item, [])]
+
+    def is_raw(self, item):
+        return item not in self.producers
+
+    def best_recipe(self, item):
+        """
+        The recipe used to make `item`: the one named after it if there is one, otherwise the
+        one with the fewest ingredients and the largest output of `item`. Recipes that consume
+        `item` themselves are skipped unless nothing else exists.
+        """
+        if item in self._best_recipe_cache:
+            return self._best_recipe_cache[item]
+        candidates = self.recipes_producing(item)
+        best = None
+        if candidates:
+            same_name = [r for r in candidates if r["name"] == item]
+            if same_name:
+                best = same_name[0]
+            else:
+                def score(recipe):
+                    consumes_self = any(i["name"] == item for i in recipe.get("ingredients", []))
+                    output = sum(_product_amount(p) for p in recipe.get("products", []) if p["name"] == item)
+                    return (consumes_self, len(recipe.get("ingredients", [])), -output, recipe["name"])
+                best = min(candidates, key=score)
+        self._best_recipe_cache[item] = best
+        return best
+
+    def closure(self, item):
+        """
+        Every item that can appear while planning `item` (the item itself plus all ingredients
+        of the chosen recipes, recursively).
+        """
+        if item in self._closure_cache:
+            return self._closure_cache[item]
+        seen = set()
+        stack = [item]
+        while stack:
+            current = stack.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            recipe = self.best_recipe(current)
+            if recipe:
+                stack.extend(i["name"] for i in recipe.get("ingredients", []))
+                stack.extend(p["name"] for p in recipe.get("products", []))
+        result = frozenset(seen)
+        self._closure_cache[item] = result
+        return result
+
+    def relevant_recipes(self, item):
+        """
+        Recipes the planner would use for `item`, in no particular order.
+        """
+        names = []
+        for current in self.closure(item):
+            recipe = self.best_recipe(current)
+            if recipe and recipe["name"] not in names:
+                names.append(recipe["name"])
+        return [self.recipes[name] for name in names]
+
+    def plan(self, target, quantity=1, inventory=None):
+        """
+        Expands `quantity` of `target` into:
+          raw:     raw items still needed after using the inventory (includes smelting fuel)
+          steps:   [{"recipe", "crafts", "category"}] in crafting order (ingredients first)
+          surplus: leftover products and byproducts
+        """
+        inventory = inventory or {}
+        relevant = self.closure(target) | {FUEL_ITEM}
+        cache_key = (target, quantity, tuple(sorted((k, v) for k, v in inventory.items() if k in relevant and v)))
+        cached = self._plan_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        available = Counter({k: v for k, v in inventory.items() if k in relevant})
+        raw = Counter()
+        steps = OrderedDict()
+
+        def need(item, amount, in_progress):
+            take = min(available[item], amount)
+            if take > 0:
+                available[item] -= take
+                amount -= take
+            if amount <= 0:
+                return
+            recipe = self.best_recipe(item) if item not in in_progress else None
+            if recipe is None:
+                raw[item] += amount
+                return
+            output = sum(_product_amount(p) for p in recipe.get("products", []) if p["name"] == item)
+            if output <= 0:
+                raw[item] += amount
+                return
+            crafts = math.ceil(amount / output)
+            for ingredient in recipe.get("ingredients", []):
+                need(ingredient["name"], ingredient["amount"] * crafts, in_progress | {item})
+            steps[recipe["name"]] = steps.get(recipe["name"], 0) + crafts
+            for product in recipe.get("products", []):
+                produced = _product_amount(product) * crafts
+                available[product["name"]] += produced - (amount if product["name"] == item else 0)
+
+        need(target, quantity, frozenset())
+
+        smelting_seconds = sum(self.recipes[name].get("energy", 0) * crafts for name, crafts in steps.items()
+                               if self.recipes[name].get("category") == SMELTING_CATEGORY)
+        if smelting_seconds:
+            need(FUEL_ITEM, math.ceil(smelting_seconds * FURNACE_POWER_W / FUEL_VALUE_J), frozenset())
+
+        result = {
+            "target": target,
+            "quantity": quantity,
+            "raw": {k: v for k, v in raw.items() if v > 0},
+            "steps": [{"recipe": name, "crafts": crafts, "category": self.recipes[name].get("category")} for name, crafts in steps.items()],
+            "surplus": {k: v - inventory.get(k, 0) for k, v in available.items() if v > inventory.get(k, 0)},
+        }
+        self._plan_cache[cache_key] = result
+        return result
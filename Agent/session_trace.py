@@ -0,0 +1,303 @@
+"""
+Append-only session traces: every RCON request/response and LLM prompt/response of a run,
+written as length-prefixed JSON records into a gzip (or, with the zstandard package and a .zst
+path, zstd) stream, plus replay sources that serve those responses again without a server or API.
+
+Record layout inside the compressed stream: 4-byte big-endian payload length, then UTF-8 JSON.
+The first record has kind "meta"; the others are kind "rcon" ({"command", "response"} or
+{"command", "error"}) and kind "llm" ({"prompt", "response"} or {"prompt", "error"}), each with
+the wall time "t" it started and its duration "dt" in seconds.
+
+Summarize a trace from the command line:
+    python session_trace.py trace.gz
+"""
+import collections
+import gzip
+import json
+import struct
+import sys
+import threading
+import time
+
+from rcon import AsyncFactorioRCONClient
+
+try:
+    import zstandard # Optional: smaller and faster than gzip for large scan payloads
+except ImportError:
+    zstandard = None
+
+TRACE_VERSION = 1
+_LENGTH = struct.Struct(">I")
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class TraceWriter:
+    """
+    Streams records to `path` as they happen; nothing is kept in memory beyond the compressor's
+    buffer. The stream is flushed at most every `flush_interval` seconds so a crashed run still
+    leaves a readable trace up to roughly that point. Safe to use from several threads.
+    """
+
+    def __init__(self, path, meta=None, flush_interval=1.0, level=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+        self.records = 0
+        if path.endswith(".zst"):
+            if zstandard is None:
+                raise ValueError("Writing a .zst trace needs the zstandard package (pip install zstandard).")
+            self._raw = open(path, "ab")
+            self._stream = zstandard.ZstdCompressor(level=level or 3).stream_writer(self._raw)
+        else:
+            self._raw = None
+            self._stream = gzip.open(path, "ab", compresslevel=level or 6)
+        self.record("meta", version=TRACE_VERSION, started=time.time(), **(meta or {}))
+
+    def record(self, kind, **fields):
+        fields["kind"] = kind
+        payload = json.dumps(fields, separators=(",", ":")).encode("utf-8")
+        with self._lock:
+            if self._stream is None:
+                return
+            self._stream.write(_LENGTH.pack(len(payload)))
+            self._stream.write(payload)
+            self.records += 1
+            now = time.time()
+            if now - self._last_flush >= self.flush_interval:
+                self._flush()
+                self._last_flush = now
+
+    def _flush(self):
+        if self._raw is not None:
+            self._stream.flush(zstandard.FLUSH_BLOCK)
+            self._raw.flush()
+        else:
+            self._stream.flush()
+
+    def close(self):
+        with self._lock:
+            if self._stream is None:
+                return
+            self._stream.close() # Also closes self._raw for zstd
+            self._stream = None
+
+
+def _open_stream(path):
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    if magic.startswith(_ZSTD_MAGIC):
+        if zstandard is None:
+            raise ValueError(f"{path} is zstd-compressed; install the zstandard package to read it.")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+    if magic.startswith(_GZIP_MAGIC):
+        return gzip.open(path, "rb")
+    raise ValueError(f"{path} is not a session trace (unknown compression).")
+
+
+def _read_exact(stream, n):
+    chunks = []
+    while n:
+        chunk = stream.read(n)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_trace(path):
+    """
+    Yields the records of a trace one at a time. A record cut off by a crash ends the trace.
+    """
+    stream = _open_stream(path)
+    try:
+        while True:
+            header = _read_exact(stream, _LENGTH.size)
+            if len(header) < _LENGTH.size:
+                return
+            payload = _read_exact(stream, _LENGTH.unpack(header)[0])
+            try:
+                yield json.loads(payload)
+            except ValueError:
+                return
+    except EOFError: # gzip member truncated mid-write
+        return
+    finally:
+        stream.close()
+
+
+class ReplaySource:
+    """
+    Hands out recorded responses for replay. A request is matched to the oldest unused record
+    with the same key (the exact RCON command or LLM prompt); if the agent asks for something
+    that was never recorded, the oldest unused record of the same group (mod function, or any
+    prompt) is used instead so replay can continue after a logic change. The trace is read lazily,
+    at most `lookahead` records past the last match, so memory stays bounded.
+    """
+
+    def __init__(self, path, lookahead=5000):
+        self.path = path
+        self.lookahead = lookahead
+        self._records = read_trace(path)
+        self.meta = {}
+        self._by_key = {} # (kind, key) -> deque of records
+        self._by_group = {} # (kind, group) -> deque of records, in trace order
+        self._lock = threading.Lock()
+        self.stats = collections.Counter()
+        first = next(self._records, None)
+        if first is not None and first.get("kind") == "meta":
+            self.meta = first
+        elif first is not None:
+            self._add(first)
+
+    def _add(self, record):
+        kind = record.get("kind")
+        if kind == "rcon":
+            key, group = record.get("command"), rcon_function(record.get("command"))
+        elif kind == "llm":
+            key, group = record.get("prompt"), None
+        else:
+            return
+        record["used"] = False
+        record["queues"] = (self._by_key.setdefault((kind, key), collections.deque()),
+                            self._by_group.setdefault((kind, group), collections.deque()))
+        for queue in record["queues"]:
+            queue.append(record)
+
+    @staticmethod
+    def _pop_unused(queue):
+        while queue:
+            record = queue.popleft()
+            if not record["used"]:
+                record["used"] = True
+                # Drop used records from the head of its other queue so a replay that keeps
+                # matching does not keep the whole trace in memory.
+                for other in record.pop("queues"):
+                    while other and other[0]["used"]:
+                        other.popleft()
+                return record
+        return None
+
+    def take(self, kind, key, group=None):
+        """
+        Returns the record to answer this request with, or None if the trace has no more.
+        """
+        with self._lock:
+            for _ in range(self.lookahead + 1):
+                record = self._pop_unused(self._by_key.get((kind, key), collections.deque()))
+                if record is not None:
+                    self.stats[f"{kind}_exact"] += 1
+                    return record
+                following = next(self._records, None)
+                if following is None:
+                    break
+                self._add(following)
+            record = self._pop_unused(self._by_group.get((kind, group), collections.deque()))
+            self.stats[f"{kind}_fallback" if record is not None else f"{kind}_missing"] += 1
+            return record
+
+
+def rcon_function(command):
+    """
+    The mod function a recorded remote.call command invokes, or None for other commands.
+    """
+    start = (command or "").find('", "')
+    if start == -1:
+        return None
+    end = command.find('"', start + 4)
+    return command[start + 4:end] if end != -1 else None
+
+
+class ReplayRCONClient(AsyncFactorioRCONClient):
+    """
+    AsyncFactorioRCONClient that never opens a socket: command() answers with the recorded
+    response (or raises the recorded error) immediately.
+    """
+
+    def __init__(self, source):
+        super().__init__(None, None, None)
+        self.source = source
+        self._open = False
+
+    @property
+    def is_connected(self):
+        return self._open
+
+    async def connect(self):
+        self._open = True
+
+    async def disconnect(self):
+        self._open = False
+
+    async def _command(self, command, timeout=None):
+        record = self.source.take("rcon", command, rcon_function(command))
+        if record is None:
+            raise ConnectionError("Session trace has no more RCON responses.")
+        if "error" in record:
+            if record.get("error_type") == "TimeoutError":
+                raise TimeoutError(record["error"])
+            raise ConnectionError(record["error"])
+        return record.get("response", "")
+
+
+class ReplayModel:
+    """
+    Stand-in for genai.GenerativeModel that answers generate_content() from a trace.
+    """
+
+    class Response:
+        def __init__(self, text):
+            self.text = text
+
+    def __init__(self, source):
+        self.source = source
+
+    def generate_content(self, prompt):
+        record = self.source.take("llm", prompt)
+        if record is None:
+            raise RuntimeError("Session trace has no more LLM responses.")
+        if "error" in record:
+            raise RuntimeError(f"Recorded LLM error: {record['error']}")
+        return self.Response(record.get("response", ""))
+
+
+def summarize(path):
+    """
+    Per-kind and per-mod-function counts, recorded latency and payload sizes of a trace.
+    """
+    summary = collections.OrderedDict()
+    meta = {}
+    for record in read_trace(path):
+        kind = record.get("kind")
+        if kind == "meta":
+            meta = record
+            continue
+        name = f"rcon:{rcon_function(record.get('command'))}" if kind == "rcon" else kind
+        entry = summary.setdefault(name, {"count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "request_chars": 0, "response_chars": 0})
+        entry["count"] += 1
+        entry["errors"] += "error" in record
+        entry["seconds"] += record.get("dt", 0.0)
+        entry["max_seconds"] = max(entry["max_seconds"], record.get("dt", 0.0))
+        entry["request_chars"] += len(record.get("command") or record.get("prompt") or "")
+        entry["response_chars"] += len(record.get("response") or "")
+    return meta, summary
+
+
+def main(argv):
+    if len(argv) != 2:
+        print("Usage: python session_trace.py <trace file>")
+        return 2
+    meta, summary = summarize(argv[1])
+    print(f"Trace {argv[1]} (version {meta.get('version')}, started {time.ctime(meta['started']) if 'started' in meta else 'unknown'})")
+    print(f"{'call':<40}{'count':>8}{'errors':>8}{'total s':>10}{'mean ms':>10}{'max ms':>10}{'resp kB':>10}")
+    for name, entry in sorted(summary.items(), key=lambda kv: -kv[1]["seconds"]):
+        mean_ms = entry["seconds"] / entry["count"] * 1000 if entry["count"] else 0
+        print(f"{name:<40}{entry['count']:>8}{entry['errors']:>8}{entry['seconds']:>10.2f}{mean_ms:>10.1f}"
+              f"{entry['max_seconds'] * 1000:>10.1f}{entry['response_chars'] / 1e3:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,304 @@
+import math
+import threading
+import time
+
+from patches import PatchIndex
+
+CHUNK_SIZE = 32 # Factorio chunk size in tiles
+
+
+class WorldModel:
+    """
+    Remembers scanned resources across cycles in a chunk-bucketed spatial index keyed by
+    resource name, so nearest/within-radius/richest-patch queries only touch nearby chunks and
+    resources outside the current scan radius are not forgotten.
+
+    Records are scan dicts (legacy or from EntityColumns.to_records) with float "x"/"y".
+    Resource tiles are also clustered into patches (see patches.PatchIndex), kept in step with
+    every upsert and removal, so callers can reason about tens of patches instead of thousands
+    of tiles. One model can be shared by several bots; public methods are serialized with a lock.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._buckets = {} # name -> {(cx, cy): {key: record}}
+        self._locations = {} # key -> (name, (cx, cy))
+        self._extent = {} # name -> [min_cx, min_cy, max_cx, max_cy]
+        self._scanned_chunks = {} # (cx, cy) -> time of the last scan fully covering the chunk
+        self.patches = PatchIndex()
+        self._lock = threading.RLock()
+
+    def _chunk_of(self, x, y):
+        return (math.floor(x / self.chunk_size), math.floor(y / self.chunk_size))
+
+    def _chunks_in(self, name, min_x, min_y, max_x, max_y):
+        """
+        The occupied chunks of `name` overlapping the box, as (chunk, bucket) pairs. The square is
+        clamped to the name's extent, and the existing buckets are walked instead when there are
+        fewer of them than chunks in the square, so the cost never scales with an empty area.
+        """
+        chunks = self._buckets.get(name)
+        extent = self._extent.get(name)
+        if not chunks or extent is None:
+            return []
+        min_cx, min_cy = self._chunk_of(min_x, min_y)
+        max_cx, max_cy = self._chunk_of(max_x, max_y)
+        min_cx, min_cy = max(min_cx, extent[0]), max(min_cy, extent[1])
+        max_cx, max_cy = min(max_cx, extent[2]), min(max_cy, extent[3])
+        if min_cx > max_cx or min_cy > max_cy:
+            return []
+        if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(chunks):
+            return [(chunk, bucket) for chunk, bucket in chunks.items()
+                    if bucket and min_cx <= chunk[0] <= max_cx and min_cy <= chunk[1] <= max_cy]
+        found = []
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                bucket = chunks.get((cx, cy))
+                if bucket:
+                    found.append(((cx, cy), bucket))
+        return found
+
+    @staticmethod
+    def _record_from_scan(entity):
+        record = dict(entity)
+        if "x" not in record: # Legacy scan dicts carry string coordinates in "position"
+            position = entity.get("position", {})
+            record["x"] = float(position.get("x", 0))
+            record["y"] = float(position.get("y", 0))
+        if "key" not in record:
+            record["key"] = f"{record.get('name')}@{record['x']:.2f},{record['y']:.2f}"
+        return record
+
+    def __len__(self):
+        return len(self._locations)
+
+    def names(self):
+        with self._lock:
+            return [name for name, chunks in self._buckets.items() if chunks]
+
+    def count(self, name=None):
+        with self._lock:
+            if name is None:
+                return len(self._locations)
+            return sum(len(bucket) for bucket in self._buckets.get(name, {}).values())
+
+    def get(self, key):
+        with self._lock:
+            location = self._locations.get(key)
+            if not location:
+                return None
+            name, chunk = location
+            return self._buckets[name][chunk].get(key)
+
+    def upsert(self, entity):
+        """
+        Adds or updates one scanned entity and returns its record.
+        """
+        with self._lock:
+            record = self._record_from_scan(entity)
+            key = record["key"]
+            if key in self._locations:
+                self._detach(key)
+            name = record.get("name")
+            chunk = self._chunk_of(record["x"], record["y"])
+            self._buckets.setdefault(name, {}).setdefault(chunk, {})[key] = record
+            self._locations[key] = (name, chunk)
+            extent = self._extent.get(name)
+            if extent is None:
+                self._extent[name] = [chunk[0], chunk[1], chunk[0], chunk[1]]
+            else:
+                extent[0] = min(extent[0], chunk[0]); extent[1] = min(extent[1], chunk[1])
+                extent[2] = max(extent[2], chunk[0]); extent[3] = max(extent[3], chunk[1])
+            self.patches.add(record)
+            return record
+
+    def _detach(self, key):
+        location = self._locations.pop(key, None)
+        if not location:
+            return
+        name, chunk = location
+        bucket = self._buckets[name][chunk]
+        bucket.pop(key, None)
+        if not bucket:
+            del self._buckets[name][chunk]
+
+    def remove(self, key):
+        with self._lock:
+            self._detach(key)
+            self.patches.remove(key)
+
+    def ingest_scan(self, entities, center_x, center_y, radius, now=None):
+        """
+        Replaces everything known inside the scanned square with the scan contents: listed
+        entities are upserted, remembered ones inside the square that were not listed are
+        dropped (mined out). Chunks fully inside the square are marked as freshly scanned.
+        """
+        with self._lock:
+            seen = set()
+            for entity in entities or []:
+                seen.add(self.upsert(entity)["key"])
+            bounds = (center_x - radius, center_y - radius, center_x + radius, center_y + radius)
+            self._drop_unlisted(bounds, seen.__contains__)
+            self._mark_scanned(bounds, now)
+
+    def ingest_columns(self, columns, center_x, center_y, radius, delta=None, sweep=True, now=None):
+        """
+        ingest_scan() for an EntityColumns scan store. With `delta` (what
+        EntityColumns.apply_delta returned) only the changed and added rows are materialized and
+        upserted. Removed rows are dropped if they lie inside the square; outside it they only
+        left the scan range. Without `delta` every row is ingested, as after a full scan.
+        `sweep` also drops remembered entities in the square that the store does not list. It is
+        needed after the square moved, and not while it stays put, because then the delta
+        already reports everything that disappeared.
+        """
+        if delta is None:
+            self.ingest_scan(columns.to_records(), center_x, center_y, radius, now)
+            return
+        with self._lock:
+            min_x, min_y, max_x, max_y = bounds = (center_x - radius, center_y - radius, center_x + radius, center_y + radius)
+            for record in delta["removed"]:
+                if min_x <= record["x"] <= max_x and min_y <= record["y"] <= max_y:
+                    self.remove(record["key"])
+            for record in columns.to_records(delta["updated"]):
+                self.upsert(record)
+            if sweep:
+                self._drop_unlisted(bounds, columns.contains_key)
+            self._mark_scanned(bounds, now)
+
+    def _drop_unlisted(self, bounds, listed):
+        min_x, min_y, max_x, max_y = bounds
+        for name in list(self._buckets):
+            for _, bucket in self._chunks_in(name, min_x, min_y, max_x, max_y):
+                stale = [key for key, r in bucket.items()
+                         if not listed(key) and min_x <= r["x"] <= max_x and min_y <= r["y"] <= max_y]
+                for key in stale:
+                    self.remove(key)
+
+    def _mark_scanned(self, bounds, now=None):
+        now = time.time() if now is None else now
+        min_x, min_y, max_x, max_y = bounds
+        min_cx, min_cy = self._chunk_of(min_x, min_y)
+        max_cx, max_cy = self._chunk_of(max_x, max_y)
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                if (cx * self.chunk_size >= min_x and (cx + 1) * self.chunk_size <= max_x
+                        and cy * self.chunk_size >= min_y and (cy + 1) * self.chunk_size <= max_y):
+                    self._scanned_chunks[(cx, cy)] = now
+
+    def is_scanned(self, x, y, radius, max_age, now=None):
+        """
+        True if every chunk overlapping the square around (x, y) was scanned within `max_age` seconds.
+        """
+        with self._lock:
+            now = time.time() if now is None else now
+            min_cx, min_cy = self._chunk_of(x - radius, y - radius)
+            max_cx, max_cy = self._chunk_of(x + radius, y + radius)
+            for cx in range(min_cx, max_cx + 1):
+                for cy in range(min_cy, max_cy + 1):
+                    scanned_at = self._scanned_chunks.get((cx, cy))
+                    if scanned_at is None or now - scanned_at > max_age:
+                        return False
+            return True
+
+    def _ring(self, origin, r):
+        ox, oy = origin
+        if r == 0:
+            yield origin
+            return
+        for dx in range(-r, r + 1):
+            yield (ox + dx, oy - r)
+            yield (ox + dx, oy + r)
+        for dy in range(-r + 1, r):
+            yield (ox - r, oy + dy)
+            yield (ox + r, oy + dy)
+
+    def nearest(self, name, x, y, k=1, max_radius=None):
+        """
+        Returns up to k records of `name` closest to (x, y), nearest first. Searches chunk rings
+        outward and stops once no unvisited ring can contain a closer record.
+        """
+        with self._lock:
+            chunks = self._buckets.get(name)
+            if not chunks:
+                return []
+            origin = self._chunk_of(x, y)
+            extent = self._extent[name]
+            max_ring = max(abs(origin[0] - extent[0]), abs(origin[0] - extent[2]),
+                           abs(origin[1] - extent[1]), abs(origin[1] - extent[3]))
+            if max_radius is not None:
+                max_ring = min(max_ring, int(max_radius // self.chunk_size) + 1)
+            max_dist_sq = max_radius * max_radius if max_radius is not None else float("inf")
+
+            candidates = []
+            for r in range(max_ring + 1):
+                for chunk in self._ring(origin, r):
+                    bucket = chunks.get(chunk)
+                    if not bucket:
+                        continue
+                    for record in bucket.values():
+                        dist_sq = (record["x"] - x) ** 2 + (record["y"] - y) ** 2
+                        if dist_sq <= max_dist_sq:
+                            candidates.append((dist_sq, record))
+                if len(candidates) >= k:
+                    candidates.sort(key=lambda c: c[0])
+                    del candidates[k:]
+                    # Anything in ring r+1 or beyond is at least r chunks away.
+                    if candidates[-1][0] <= (r * self.chunk_size) ** 2:
+                        break
+            candidates.sort(key=lambda c: c[0])
+            return [record for _, record in candidates[:k]]
+
+    def within_radius(self, name, x, y, radius):
+        """
+        Returns all records of `name` (or of every name if None) within `radius` of (x, y), nearest first.
+        """
+        with self._lock:
+            names = [name] if name is not None else list(self._buckets)
+            radius_sq = radius * radius
+            found = []
+            for n in names:
+                for _, bucket in self._chunks_in(n, x - radius, y - radius, x + radius, y + radius):
+                    for record in bucket.values():
+                        dist_sq = (record["x"] - x) ** 2 + (record["y"] - y) ** 2
+                        if dist_sq <= radius_sq:
+                            found.append((dist_sq, record))
+            found.sort(key=lambda f: f[0])
+            return [record for _, record in found]
+
+    def patches_near(self, x, y, name=None, radius=None, limit=None):
+        """
+        Summaries of the known resource patches (see PatchIndex.summary) closest to (x, y) first.
+        """
+        with self._lock:
+            return self.patches.query(x, y, name, radius, limit)
+
+    def nearest_in_patch(self, patch_id, x, y):
+        """
+        The record of the tile of patch `patch_id` closest to (x, y), or None if the patch is gone.
+        """
+        with self._lock:
+            key = self.patches.nearest_tile(patch_id, x, y)
+            return self.get(key) if key else None
+
+    def richest_patch_near(self, name, x, y, radius):
+        """
+        Finds the chunk within `radius` holding the most remaining `name` (summed amount, or tile
+        count for amount-less entities like trees). Returns a summary with the record in that
+        chunk closest to (x, y), or None if nothing is known.
+        """
+        with self._lock:
+            chunks = self._buckets.get(name)
+            if not chunks:
+                return None
+            best = None
+            for chunk, bucket in sorted(self._chunks_in(name, x - radius, y - radius, x + radius, y + radius), key=lambda c: c[0]):
+                total = sum(r.get("amount", 1) for r in bucket.values())
+                if best is None or total > best["total_amount"]:
+                    best = {"chunk": chunk, "total_amount": total, "count": len(bucket)}
+            if best is None:
+                return None
+            bucket = chunks[best["chunk"]]
+            best["centroid"] = (sum(r["x"] for r in bucket.values()) / len(bucket),
+                                sum(r["y"] for r in bucket.values()) / len(bucket))
+            best["closest"] = min(bucket.values(), key=lambda r: (r["x"] - x) ** 2 + (r["y"] - y) ** 2)
+            return best
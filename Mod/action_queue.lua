@@ -0,0 +1,274 @@
+local ActionQueueModule = {}
+local Events = require("events")
+local Pathfinding = require("pathfinding")
+
+-- Per-actor action queues run inside the game, tick by tick, so a whole "walk there, mine 50
+-- iron ore, moving on to the next tile whenever one runs out" sequence costs the agent one RCON
+-- call to start it and one event when it is done, instead of a round trip per mined unit.
+--
+-- Supported actions (fields other than type are optional unless noted):
+--   {type = "walk", x = required, y = required}
+--   {type = "mine", name = required, count = 1, x, y, radius = DEFAULT_MINE_RADIUS, item}
+-- A mine action mines `count` units of `item` (default: the first product of `name`) from the
+-- entities called `name` closest to x/y (default: the actor's position), walking within reach
+-- of each one first. It finishes early, without failing, when the inventory is full or no
+-- entity is left within `radius` after something was mined.
+local DEFAULT_MINE_RADIUS = 32
+local STALL_TICKS = 60 * 10 -- Mining that yields nothing for this long fails the action
+local MAX_SKIPPED_TARGETS = 5 -- Unreachable targets tried before a mine action fails
+local ARRIVAL_DISTANCE = 1.5
+
+ActionQueueModule.initialize_globals = function()
+    global.action_queues = global.action_queues or {} -- actor key -> job (kept after it finishes, for status)
+    global.action_queue_next_id = global.action_queue_next_id or 0
+    global.action_queue_running = global.action_queue_running or 0
+end
+
+local function distance(a, b)
+    local dx, dy = a.x - b.x, a.y - b.y
+    return math.sqrt(dx * dx + dy * dy)
+end
+
+local function item_count(actor, item)
+    if not item then return 0 end
+    return actor.get_item_count(item)
+end
+
+local function progress(job)
+    return {
+        job_id = job.id, state = job.state, current = math.min(job.index, #job.actions), total = #job.actions,
+        actions_done = job.actions_done, mined = job.mined, message = job.message,
+        started_tick = job.started_tick, ticks = (job.finished_tick or game.tick) - job.started_tick
+    }
+end
+
+local function stop_movement(job)
+    local step = job.step
+    if step.vehicle_key and step.moving then
+        Pathfinding.stop(step.vehicle_key, job.actor)
+    end
+    step.moving = false
+end
+
+local function finish(job, state, message)
+    if job.actor and job.actor.valid then
+        stop_movement(job)
+        if job.actor.type == "character" then job.actor.mining_state = {mining = false} end
+    end
+    job.state = state
+    job.message = message
+    job.finished_tick = game.tick
+    global.action_queue_running = math.max(0, global.action_queue_running - 1)
+    local summary = progress(job)
+    summary.actor_key = job.actor_key
+    Events.push("action_queue_done", summary)
+end
+
+local function next_action(job)
+    job.actions_done = job.actions_done + 1
+    job.index = job.index + 1
+    job.step = {}
+    if job.index > #job.actions then finish(job, "done") end
+end
+
+-- Starts (or keeps) a path towards `position`. Returns "arrived", "moving" or "failed".
+local function walk_towards(job, position, close_enough)
+    local step, actor = job.step, job.actor
+    if distance(actor.position, position) <= close_enough then
+        stop_movement(job)
+        return "arrived"
+    end
+    if not step.moving then
+        local result = Pathfinding.request_path_for_entity(actor, {x = position.x, y = position.y})
+        if result.status == "error" then return "failed", result.message end
+        step.vehicle_key, step.moving = result.vehicle_key, true
+        return "moving"
+    end
+    local state = Pathfinding.get_state(step.vehicle_key)
+    if state == Pathfinding.STATES.PATH_FAILED then
+        step.moving = false
+        return "failed", "No path to {" .. position.x .. ", " .. position.y .. "}"
+    elseif state == Pathfinding.STATES.IDLE then
+        -- The path ended; whatever distance is left is as close as it gets.
+        step.moving = false
+        if distance(actor.position, position) <= close_enough + ARRIVAL_DISTANCE then return "arrived" end
+        return "failed", "Path ended short of {" .. position.x .. ", " .. position.y .. "}"
+    end
+    return "moving"
+end
+
+local function run_walk(job, action)
+    local target = {x = tonumber(action.x), y = tonumber(action.y)}
+    if not (target.x and target.y) then return finish(job, "failed", "walk needs x and y") end
+    local status, message = walk_towards(job, target, ARRIVAL_DISTANCE)
+    if status == "arrived" then
+        next_action(job)
+    elseif status == "failed" then
+        finish(job, "failed", message)
+    end
+end
+
+local function record_mined(job, step)
+    if step.item and step.mined > 0 then
+        job.mined[step.item] = (job.mined[step.item] or 0) + step.mined
+    end
+end
+
+-- Closest entity called `name` within the action's radius that was not given up on.
+local function find_target(job, action, step)
+    local actor = job.actor
+    local center = step.center
+    local candidates = actor.surface.find_entities_filtered{position = center, radius = tonumber(action.radius) or DEFAULT_MINE_RADIUS, name = action.name}
+    local best, best_distance
+    for _, entity in ipairs(candidates) do
+        local key = entity.position.x .. "," .. entity.position.y
+        if not step.skipped[key] then
+            local d = distance(actor.position, entity.position)
+            if not best_distance or d < best_distance then best, best_distance = entity, d end
+        end
+    end
+    return best
+end
+
+local function run_mine(job, action)
+    local actor, step = job.actor, job.step
+    if actor.type ~= "character" then return finish(job, "failed", "Only characters can mine") end
+    if not action.name then return finish(job, "failed", "mine needs name") end
+    if not step.center then
+        step.center = {x = tonumber(action.x) or actor.position.x, y = tonumber(action.y) or actor.position.y}
+        step.count = tonumber(action.count) or 1
+        step.item = action.item
+        step.start_count = item_count(actor, step.item)
+        step.mined = 0
+        step.skipped, step.skips = {}, 0
+        step.last_progress_tick = game.tick
+    end
+
+    step.mined = item_count(actor, step.item) - step.start_count
+    if step.mined >= step.count then
+        actor.mining_state = {mining = false}
+        record_mined(job, step)
+        return next_action(job)
+    end
+
+    if not (step.target and step.target.valid) then
+        stop_movement(job)
+        step.target = find_target(job, action, step)
+        if not step.target then
+            record_mined(job, step)
+            if step.mined > 0 then return next_action(job) end
+            return finish(job, "failed", "No " .. action.name .. " within reach of {" .. step.center.x .. ", " .. step.center.y .. "}")
+        end
+        if not step.item then
+            local products = step.target.prototype.mineable_properties.products
+            step.item = products and products[1] and products[1].name or action.name
+            step.start_count = item_count(actor, step.item)
+        end
+        step.last_progress_tick = game.tick
+    end
+
+    local target = step.target
+    if not actor.can_insert({name = step.item, count = 1}) then
+        record_mined(job, step)
+        if step.mined > 0 then
+            job.message = "inventory full"
+            actor.mining_state = {mining = false}
+            return next_action(job)
+        end
+        return finish(job, "failed", "Inventory full")
+    end
+
+    local reach = target.type == "resource" and actor.resource_reach_distance or actor.reach_distance
+    if distance(actor.position, target.position) > reach then
+        local status = walk_towards(job, target.position, reach)
+        if status == "failed" then
+            step.skipped[target.position.x .. "," .. target.position.y] = true
+            step.skips = step.skips + 1
+            step.target = nil
+            if step.skips >= MAX_SKIPPED_TARGETS then
+                record_mined(job, step)
+                return finish(job, "failed", "Could not reach any " .. action.name)
+            end
+        end
+        step.last_progress_tick = game.tick
+        return
+    end
+    stop_movement(job)
+
+    -- Mining only continues while the state is refreshed every tick, as if the button were held.
+    actor.update_selected_entity(target.position)
+    actor.mining_state = {mining = true, position = target.position}
+    if step.mined > (step.last_mined or 0) then
+        step.last_mined = step.mined
+        step.last_progress_tick = game.tick
+    elseif game.tick - step.last_progress_tick > STALL_TICKS then
+        record_mined(job, step)
+        return finish(job, "failed", "Mining " .. target.name .. " made no progress")
+    end
+end
+
+local RUNNERS = { walk = run_walk, mine = run_mine }
+
+-- Replaces the actor's queue (cancelling a running one) unless `append` is set and a job is
+-- running, in which case the actions are added to its end. Returns the job's progress table.
+ActionQueueModule.enqueue = function(actor, actor_key, actions, append)
+    if type(actions) ~= "table" or #actions == 0 then return {status = "error", message = "actions not provided"} end
+    for i, action in ipairs(actions) do
+        if not RUNNERS[action.type] then
+            return {status = "error", message = "Unknown action type at " .. i .. ": " .. tostring(action.type)}
+        end
+    end
+    local job = global.action_queues[actor_key]
+    if job and job.state == "running" then
+        if append then
+            for _, action in ipairs(actions) do table.insert(job.actions, action) end
+            local result = progress(job)
+            result.status = "appended"
+            return result
+        end
+        finish(job, "cancelled", "Replaced by a new queue")
+    end
+
+    global.action_queue_next_id = global.action_queue_next_id + 1
+    job = {
+        id = global.action_queue_next_id, actor = actor, actor_key = actor_key, actions = actions, index = 1,
+        step = {}, state = "running", actions_done = 0, mined = {}, started_tick = game.tick
+    }
+    global.action_queues[actor_key] = job
+    global.action_queue_running = global.action_queue_running + 1
+    local result = progress(job)
+    result.status = "queued"
+    return result
+end
+
+ActionQueueModule.status = function(actor_key)
+    local job = global.action_queues[actor_key]
+    if not job then return {state = "none"} end
+    local result = progress(job)
+    if job.state == "running" then result.action = job.actions[job.index] end
+    return result
+end
+
+ActionQueueModule.cancel = function(actor_key)
+    local job = global.action_queues[actor_key]
+    if not (job and job.state == "running") then return {state = job and job.state or "none"} end
+    finish(job, "cancelled", "Cancelled")
+    return progress(job)
+end
+
+-- on_tick handler: advances every running job by one step.
+ActionQueueModule.on_tick = function(event)
+    if not (global.action_queue_running and global.action_queue_running > 0) then return end
+    for _, job in pairs(global.action_queues) do
+        if job.state == "running" then
+            if not (job.actor and job.actor.valid) then
+                finish(job, "failed", "Actor no longer exists")
+            else
+                local action = job.actions[job.index]
+                RUNNERS[action.type](job, action)
+            end
+        end
+    end
+end
+
+return ActionQueueModule
@@ -4,58 +4,162 @@
 
 local actions = {}
 local Pathfinding = require("pathfinding")
+local Events = require("events")
+local ActionQueue = require("action_queue")
+local Recipes = require("recipes")
 
--- Utility function for simple JSON construction
-local function to_json_string(data_table)
-    if type(data_table) ~= "table" then
-        if type(data_table) == "string" then return "\"" .. string.gsub(data_table, "\"", "\\\"") .. "\""
-        elseif type(data_table) == "boolean" then return tostring(data_table)
-        else return tostring(data_table) end
+-- JSON serialization
+-- Single pass into one shared buffer. Strings are fully escaped, numbers are emitted natively
+-- (integers without a fraction, NaN/inf as null). Empty tables encode as [] like before.
+local JSON_ESCAPES = { ['"'] = '\\"', ['\\'] = '\\\\', ['\b'] = '\\b', ['\f'] = '\\f', ['\n'] = '\\n', ['\r'] = '\\r', ['\t'] = '\\t' }
+
+local function escape_json_char(c)
+  return JSON_ESCAPES[c] or string.format("\\u%04x", string.byte(c))
+end
+
+local function encode_json_string(s)
+  return '"' .. string.gsub(s, '[%c"\\]', escape_json_char) .. '"'
+end
+
+local function encode_json_number(v)
+  if v ~= v or v == math.huge or v == -math.huge then return "null" end
+  if v == math.floor(v) and v >= -9007199254740992 and v <= 9007199254740992 then
+    return string.format("%d", v)
+  end
+  return string.format("%.14g", v)
+end
+
+-- A table is an array if its keys are exactly 1..#t. The common cases (empty table, or nothing
+-- after index #t in traversal order) are decided without walking the whole table.
+local function is_json_array(t)
+  local n = #t
+  if n == 0 then return next(t) == nil end
+  if next(t, n) == nil then return true end
+  local count = 0
+  for k, _ in pairs(t) do
+    if type(k) ~= "number" or k < 1 or k > n or k ~= math.floor(k) then return false end
+    count = count + 1
+  end
+  return count == n
+end
+
+-- Object keys repeat constantly (field names, item names), so their encoded form is cached.
+-- This is a plain local, not part of global, and does not affect game state.
+local encoded_json_keys = {}
+
+local function encode_json_key(k)
+  local encoded = encoded_json_keys[k]
+  if not encoded then
+    encoded = encode_json_string(tostring(k)) .. ":"
+    encoded_json_keys[k] = encoded
+  end
+  return encoded
+end
+
+local encode_json_value
+
+local function encode_json_table(t, buf, n)
+  if is_json_array(t) then
+    n = n + 1; buf[n] = "["
+    for i = 1, #t do
+      if i > 1 then n = n + 1; buf[n] = "," end
+      n = encode_json_value(t[i], buf, n)
     end
-    local parts = {}
-    local is_array = true; local max_idx = 0
-    for k, _ in pairs(data_table) do
-        if type(k) ~= "number" or k < 1 or k > #data_table + 1000 then is_array = false end
-        if type(k) == "number" and k > max_idx then max_idx = k end
+    n = n + 1; buf[n] = "]"
+  else
+    n = n + 1; buf[n] = "{"
+    local first = true
+    for k, v in pairs(t) do
+      if not first then n = n + 1; buf[n] = "," end
+      n = n + 1; buf[n] = encode_json_key(k)
+      n = encode_json_value(v, buf, n)
+      first = false
     end
-    if max_idx > 0 and #data_table ~= max_idx then is_array = false end
-    if is_array then
-        table.insert(parts, "[")
-        for i = 1, #data_table do
-            table.insert(parts, to_json_string(data_table[i]))
-            if i < #data_table then table.insert(parts, ",") end
-        end
-        table.insert(parts, "]")
-    else
-        table.insert(parts, "{")
-        local first = true
-        for k, v in pairs(data_table) do
-            if not first then table.insert(parts, ",") end
-            table.insert(parts, "\"" .. tostring(k) .. "\":" .. to_json_string(v))
-            first = false
-        end
-        table.insert(parts, "}")
+    n = n + 1; buf[n] = "}"
+  end
+  return n
+end
+
+encode_json_value = function(v, buf, n)
+  local t = type(v)
+  n = n + 1
+  if t == "string" then buf[n] = encode_json_string(v)
+  elseif t == "number" then buf[n] = encode_json_number(v)
+  elseif t == "boolean" then buf[n] = v and "true" or "false"
+  elseif t == "table" then return encode_json_table(v, buf, n - 1)
+  else buf[n] = "null" end
+  return n
+end
+
+local function to_json_string(data)
+  local buf = {}
+  encode_json_value(data, buf, 0)
+  return table.concat(buf)
+end
+
+-- Rounds to two decimals but keeps the value numeric on the wire.
+local function round2(value)
+  return math.floor(value * 100 + 0.5) / 100
+end
+
+-- Actors: every action works on the player named by params.player_index (default 1) or on the
+-- character/vehicle named by params.unit_number, so one agent process can drive several bots.
+local function get_player(params)
+  local player = game.get_player(params and tonumber(params.player_index) or 1)
+  if not (player and player.valid) then return nil, "Player " .. tostring(params and params.player_index or 1) .. " not found" end
+  return player
+end
+
+-- Returns the acting entity and its player (nil for a vehicle without one), or nil and an error.
+local function get_actor(params)
+  local unit_number = params and tonumber(params.unit_number)
+  if unit_number then
+    for _, surface in pairs(game.surfaces) do
+      local entity = surface.find_entity_by_unit_number(unit_number)
+      if entity and entity.valid and (entity.type == "character" or entity.commandable) then
+        return entity, entity.type == "character" and entity.player or nil
+      end
     end
-    return table.concat(parts, "")
+    return nil, "Entity with unit number " .. unit_number .. " not found or not commandable"
+  end
+  local player, err = get_player(params)
+  if not player then return nil, err end
+  if not (player.character and player.character.valid) then return nil, "Player " .. player.index .. " has no character" end
+  return player.character, player
+end
+
+-- Key for per-actor state kept in global; matches the pathfinding module's vehicle_key.
+local function actor_key(entity, player)
+  if player then return "player_" .. player.index end
+  return entity.unit_number
+end
+
+local function get_actor_inventory(entity, player)
+  if entity.type == "character" then return entity.get_inventory(defines.inventory.character_main) end
+  if entity.type == "car" then return entity.get_inventory(defines.inventory.car_trunk) end
+  if entity.type == "spider-vehicle" then return entity.get_inventory(defines.inventory.spider_trunk) end
+  return player and player.get_main_inventory() or nil
 end
 
 -- RCON function implementations
-function actions.get_player_info()
-  local player = game.players[1]
-  if not player then return to_json_string({error = "Player not found"}) end
+function actions.get_player_info(params)
+  local actor, player_or_err = get_actor(params)
+  if not actor then return to_json_string({error = player_or_err}) end
+  local contents = {}
+  local inventory = get_actor_inventory(actor, player_or_err)
+  if inventory then
+    for i = 1, #inventory do
+      local stack = inventory[i]
+      if stack.valid_for_read and stack.count > 0 then contents[stack.name] = (contents[stack.name] or 0) + stack.count end
+    end
+  end
   return to_json_string({
-    position = {x = string.format("%.2f", player.position.x), y = string.format("%.2f", player.position.y)},
-    inventory = (function()
-        local c = {}
-        if player.get_main_inventory() then
-            for i=1, #player.get_main_inventory() do
-                local stack = player.get_main_inventory()[i]
-                if stack.valid and stack.count > 0 then c[stack.name] = (c[stack.name] or 0) + stack.count end
-            end
-        end
-        return c
-    end)(),
-    health = player.character and string.format("%.1f", player.character.health) or nil,
+    player_index = player_or_err and player_or_err.index or nil,
+    unit_number = actor.unit_number,
+    position = {x = round2(actor.position.x), y = round2(actor.position.y)},
+    inventory = contents,
+    health = actor.health and round2(actor.health) or nil,
+    research_epoch = Recipes.epoch(actor.force),
     tick = game.tick
   })
 end
@@ -65,7 +169,7 @@ end
 -- DOES NOT WORK AS OF NOW
 -- TODO: FIX PATHFINDING
 function actions.move_to_position(params)
-  local player = game.players[1]
+  local player = get_player(params)
   if not (player and player.character) then return to_json_string({status = "error", message = "Player or character not found"}) end
   if not (params and params.x and params.y) then return to_json_string({status = "error", message = "Target coordinates not provided"}) end
 
@@ -87,95 +191,213 @@ function actions.move_to_position(params)
 end
 
 -- This is simplified to just check the character's walking state.
-function actions.get_movement_status()
-  local player = game.players[1]
-  if not (player and player.character) then return to_json_string({is_moving = false}) end
+function actions.get_movement_status(params)
+  local actor = get_actor(params)
+  if not actor then return to_json_string({is_moving = false}) end
 
-  local is_moving = player.character.walking_state.walking
+  local is_moving
+  if actor.type == "character" then is_moving = actor.walking_state.walking else is_moving = (actor.speed or 0) ~= 0 end
   return to_json_string({is_moving = is_moving})
 end
 
+-- Resource names reported by scans; trees are matched by type.
+local SCAN_RESOURCE_NAMES = { ["iron-ore"] = true, ["copper-ore"] = true, ["stone"] = true, ["coal"] = true }
+
+-- Stable identity for scanned entities (resources and trees have no unit_number).
+local function scan_entity_key(name, x, y)
+  return name .. "@" .. string.format("%.2f", x) .. "," .. string.format("%.2f", y)
+end
+
+-- Converts scan records into the legacy list-of-objects format.
+local function encode_scan_records(records)
+  local list = {}
+  for i, r in ipairs(records) do
+    local data = { name = r.name, key = r.key, position = {x = string.format("%.2f", r.x), y = string.format("%.2f", r.y)}, unit_number = r.unit_number }
+    if r.amount then data.amount = r.amount end
+    list[i] = data
+  end
+  return list
+end
+
+-- Converts scan records into parallel numeric columns with an interned name table
+-- (name_id is a 0-based index into names). Trees get amount 0.
+local function encode_scan_columns(records, with_keys)
+  local names, name_index = {}, {}
+  local name_id, xs, ys, amounts, keys = {}, {}, {}, {}, {}
+  for i, r in ipairs(records) do
+    local id = name_index[r.name]
+    if not id then
+      table.insert(names, r.name)
+      id = #names - 1
+      name_index[r.name] = id
+    end
+    name_id[i] = id; xs[i] = r.x; ys[i] = r.y; amounts[i] = r.amount or 0
+    if with_keys then keys[i] = r.key end
+  end
+  return {format = "columns", names = names, name_id = name_id, x = xs, y = ys, amount = amounts, key = with_keys and keys or nil}
+end
+
+-- Scans the square of `radius` around the player with a single find_entities_filtered call.
+-- With params.delta, the result is diffed against a per-player snapshot kept in global:
+-- if params.token matches the stored snapshot only added/removed/changed entities are returned,
+-- otherwise a full list is sent along with a fresh token.
+-- With params.format = "columns", entity lists are sent as numeric columns (see encode_scan_columns).
 function actions.scan_nearby_entities(params)
-  local player = game.players[1]
-  if not (player and player.character) then return to_json_string({error = "Player not found"}) end
+  local actor, player_or_err = get_actor(params)
+  if not actor then return to_json_string({error = player_or_err}) end
   if not (params and params.radius) then return to_json_string({error = "Radius not provided"}) end
   local radius = tonumber(params.radius)
   if not (radius and radius > 0) then return to_json_string({error = "Invalid radius"}) end
-  local area = {{player.position.x - radius, player.position.y - radius}, {player.position.x + radius, player.position.y + radius}}
-  local resource_names = { "iron-ore", "copper-ore", "stone", "coal", "tree" }
-  local found_entities = {}
-  for _, name in ipairs(resource_names) do
-    local entities_found
-    if name == "tree" then entities_found = player.surface.find_entities_filtered{area=area, type="tree"} else entities_found = player.surface.find_entities_filtered{area=area, name=name, type="resource"} end
-    for _, entity in pairs(entities_found) do
-      if entity.valid then
-        local data = { name = entity.name, position = {x = string.format("%.2f", entity.position.x), y = string.format("%.2f", entity.position.y)}, unit_number = entity.unit_number }
-        if entity.type == "resource" and entity.amount then data.amount = entity.amount end
-        table.insert(found_entities, data)
-      end
+  local px, py = actor.position.x, actor.position.y
+  local area = {{px - radius, py - radius}, {px + radius, py + radius}}
+  local columns = params.format == "columns"
+  local records = {}
+  local snapshot = {} -- key -> amount (0 for trees); this is what gets stored in global
+  for _, entity in pairs(actor.surface.find_entities_filtered{area=area, type={"resource", "tree"}}) do
+    if entity.valid and (entity.type == "tree" or SCAN_RESOURCE_NAMES[entity.name]) then
+      local x, y = entity.position.x, entity.position.y
+      local record = { name = entity.name, key = scan_entity_key(entity.name, x, y), x = x, y = y, unit_number = entity.unit_number }
+      if entity.type == "resource" and entity.amount then record.amount = entity.amount end
+      table.insert(records, record)
+      snapshot[record.key] = record.amount or 0
     end
   end
-  return to_json_string({entities = found_entities})
-end
-
-function actions.get_all_unlocked_recipes()
-  local player = game.players[1]
-  if not player then return to_json_string({error = "Player not found"}) end
-  local force = player.force
-  if not (force and force.recipes) then return to_json_string({error = "Player force or recipes not available."}) end
-  local recipes = {}
-  for _, recipe in pairs(force.recipes) do
-    if recipe.enabled then
-      local data = { name = recipe.name, ingredients = {}, products = {} }
-      for _, ingredient in ipairs(recipe.ingredients) do table.insert(data.ingredients, { name = ingredient.name, amount = ingredient.amount, type = ingredient.type or "item" }) end
-      for _, product in ipairs(recipe.products) do table.insert(data.products, { name = product.name, amount = product.amount, type = product.type or "item" }) end
-      table.insert(recipes, data)
+  local function encode(list)
+    if columns then return encode_scan_columns(list, params.delta) end
+    return encode_scan_records(list)
+  end
+  if not params.delta then
+    if columns then return to_json_string(encode(records)) end
+    return to_json_string({entities = encode(records)})
+  end
+
+  local cache_key = actor_key(actor, player_or_err)
+  local cache = global.scan_cache[cache_key]
+  local token = (cache and cache.token or 0) + 1
+  local client_token = tonumber(params.token)
+  if not (cache and client_token and client_token == cache.token) then
+    global.scan_cache[cache_key] = {token = token, entities = snapshot}
+    return to_json_string({full = true, token = token, entities = encode(records)})
+  end
+
+  local added, changed, removed = {}, {}, {}
+  for _, record in ipairs(records) do
+    local old_amount = cache.entities[record.key]
+    if old_amount == nil then
+      table.insert(added, record)
+    elseif old_amount ~= snapshot[record.key] then
+      table.insert(changed, {key = record.key, amount = snapshot[record.key]})
     end
   end
-  return to_json_string({recipes = recipes})
+  -- Entities that were mined out or left the scan square are both reported as removed,
+  -- so the client's copy always mirrors the current scan area.
+  for key, _ in pairs(cache.entities) do
+    if not snapshot[key] then table.insert(removed, key) end
+  end
+  global.scan_cache[cache_key] = {token = token, entities = snapshot}
+  return to_json_string({full = false, token = token, added = encode(added), changed = changed, removed = removed})
+end
+
+local function get_force(params)
+  local actor, player_or_err = get_actor(params)
+  if actor then return actor.force end
+  local player = get_player(params)
+  if not player then return nil, player_or_err end
+  return player.force
+end
+
+-- Enabled recipes of the actor's force. With params.limit only that many, starting after
+-- params.offset; the response's `next` is the offset of the following page.
+function actions.get_all_unlocked_recipes(params)
+  local force, err = get_force(params)
+  if not force then return to_json_string({error = err}) end
+  if not force.recipes then return to_json_string({error = "Player force or recipes not available."}) end
+  local limit = params and tonumber(params.limit)
+  return to_json_string(Recipes.page(force, params and tonumber(params.offset) or 0, limit and math.max(1, limit) or nil))
 end
 
+-- Identity of the force's recipe set (active mods and research); the agent keys its on-disk
+-- recipe cache with it and only fetches recipes when it changes.
+function actions.get_recipe_fingerprint(params)
+  local force, err = get_force(params)
+  if not force then return to_json_string({error = err}) end
+  local result = Recipes.fingerprint(force)
+  return to_json_string({fingerprint = result.fingerprint, epoch = result.epoch, researched = result.researched,
+                         page_size = Recipes.DEFAULT_PAGE_SIZE, event_cursor = Events.last_id()})
+end
+
+-- The target is params.target_unit_number, or for entities without one (resources, trees) the
+-- entity named params.target_name at params.x/params.y. Older callers pass the target as
+-- params.unit_number, in which case the actor can only be chosen by player_index.
 function actions.mine_target_entity(params)
-  local player = game.players[1]
-  if not player or not player.character then return to_json_string({status = "error", message = "Player or character not found"}) end
-  if not (params and params.unit_number) then return to_json_string({status = "error", message = "unit_number not provided"}) end
-  local entities = player.surface.find_entities_filtered{position = player.position, radius = 10, unit_number = params.unit_number}
-  if #entities == 0 then return to_json_string({status = "error", message = "Target entity not found", entity_id = params.unit_number}) end
+  params = params or {}
+  local target_unit_number = params.target_unit_number or (not (params.x and params.y) and params.unit_number) or nil
+  local actor_params = (params.target_unit_number or (params.x and params.y)) and params or {player_index = params.player_index}
+  local actor, player_or_err = get_actor(actor_params)
+  if not actor then return to_json_string({status = "error", message = player_or_err}) end
+  if actor.type ~= "character" then return to_json_string({status = "error", message = "Only characters can mine"}) end
+  local entities
+  if target_unit_number then
+    entities = actor.surface.find_entities_filtered{position = actor.position, radius = 10, unit_number = target_unit_number}
+  elseif params.x and params.y then
+    entities = actor.surface.find_entities_filtered{position = {x = tonumber(params.x), y = tonumber(params.y)}, radius = 0.5, name = params.target_name, limit = 1}
+  else
+    return to_json_string({status = "error", message = "target_unit_number or x/y not provided"})
+  end
+  if #entities == 0 then return to_json_string({status = "error", message = "Target entity not found", entity_id = target_unit_number}) end
   local target = entities[1]
-  if not player.character.can_mine(target) then return to_json_string({status = "error", message = "Target not mineable", entity_id = params.unit_number, entity_name = target.name}) end
-  player.character.mine(target)
-  return to_json_string({ status = "mining_initiated", entity_id = params.unit_number, entity_name = target.name })
+  if not actor.can_mine(target) then return to_json_string({status = "error", message = "Target not mineable", entity_id = target_unit_number, entity_name = target.name}) end
+  -- The cursor is taken before mining so the agent sees the player_mined_item event it causes.
+  local event_cursor = Events.last_id()
+  local target_name = target.name
+  if not actor.mine_entity(target) then return to_json_string({status = "error", message = "Mining failed", entity_id = target_unit_number, entity_name = target_name}) end
+  return to_json_string({ status = "mining_initiated", entity_id = target_unit_number, entity_name = target_name, event_cursor = event_cursor })
 end
 
--- Setup function
-local function setup_mod()
-  remote.add_interface("factorio_autonomo_bot", actions)
-end
-
--- Utility to get a vehicle entity (can be player character or actual vehicle)
--- This is kept in control.lua for actions.pf_set_destination to use before calling the module.
-local function get_control_lua_vehicle_entity(unit_number, player_index)
-    if unit_number then
-        for _, surface in pairs(game.surfaces) do
-            local entity = surface.find_entity_by_unit_number(unit_number)
-            if entity and entity.valid and (entity.type == "player" or entity.commandable) then
-                return entity
-            end
-        end
-        return nil, "Control.lua: Vehicle with unit number " .. unit_number .. " not found or not commandable."
-    end
-    local player = game.players[player_index or 1]
-    if player and player.character and player.character.valid then
-        return player.character, nil
+-- Runs several actions in the same tick and returns one JSON envelope keyed by request id.
+-- params.calls is a list of {id = "...", fn = "action_name", params = {...}}.
+-- Each action already returns a JSON string, so results are spliced in without re-encoding.
+function actions.batch(params)
+  if not (params and params.calls) then return to_json_string({error = "calls not provided"}) end
+  local parts = {}
+  for i, call in ipairs(params.calls) do
+    local id = tostring(call.id or i)
+    local fn = call.fn ~= "batch" and actions[call.fn] or nil
+    local result
+    if not fn then
+      result = to_json_string({error = "Unknown action: " .. tostring(call.fn)})
+    else
+      local ok, res = pcall(fn, call.params)
+      if ok then result = res else result = to_json_string({error = tostring(res)}) end
     end
-    return nil, "Control.lua: Player " .. (player_index or 1) .. " character not found."
+    table.insert(parts, to_json_string(id) .. ":" .. (result or "null"))
+  end
+  return "{\"tick\":" .. game.tick .. ",\"results\":{" .. table.concat(parts, ",") .. "}}"
 end
 
+-- Markers written around every remote interface response, so the agent can locate the payload
+-- even when game.print debug lines (which often contain braces) are interleaved in the RCON output.
+local RESPONSE_START = "<<AFB>>"
+local RESPONSE_END = "<</AFB>>"
+
+local function framed(fn)
+  return function(...)
+    local result = fn(...)
+    if type(result) == "string" then return RESPONSE_START .. result .. RESPONSE_END end
+    return result
+  end
+end
+
+-- Setup function
+-- Actions call each other (e.g. batch) unframed; only the registered interface adds the markers.
+local function setup_mod()
+  local interface = {}
+  for name, fn in pairs(actions) do interface[name] = framed(fn) end
+  remote.add_interface("factorio_autonomo_bot", interface)
+end
 
 -- RCON action to set destination and trigger pathfinding
 function actions.pf_set_destination(params)
-    local player_index = params.player_index or 1
-    local unit_number = params.unit_number
     local target_x = tonumber(params.x)
     local target_y = tonumber(params.y)
 
@@ -183,192 +405,97 @@ function actions.pf_set_destination(params)
         return to_json_string({status = "error", message = "Target coordinates (x, y) not provided or invalid."})
     end
 
-    local vehicle_entity, err_msg = get_vehicle_entity(unit_number, player_index)
+    local vehicle_entity, err_msg = get_actor(params)
     if not vehicle_entity then
         return to_json_string({status = "error", message = err_msg})
     end
 
-    local vehicle_key
-    if vehicle_entity.unit_number then
-        vehicle_key = vehicle_entity.unit_number
-    else
-        vehicle_key = "player_" .. vehicle_entity.player.index
-    end
-
-    -- Ensure basic structure exists for this vehicle
-    if not global.pf_vehicles[vehicle_key] then
-        global.pf_vehicles[vehicle_key] = {}
-        global.pf_vehicles[vehicle_key].entity_name = vehicle_entity.name
-        set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.IDLE) -- Initialize to IDLE
-    else
-        -- If vehicle is already known, ensure its name is up-to-date
-        global.pf_vehicles[vehicle_key].entity_name = vehicle_entity.name
-    end
-
-    local request_id, req_err_msg = request_vehicle_path(vehicle_entity, {x = target_x, y = target_y})
-    if request_id then
-        set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.REQUESTING_PATH)
-        return to_json_string({status = "path_requested", vehicle_key = vehicle_key, request_id = request_id, entity_name = vehicle_entity.name, state = global.pf_vehicles[vehicle_key].pf_state})
-    else
-        -- If request_vehicle_path itself fails before sending, it's a path failure.
-        set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.PATH_FAILED)
-        return to_json_string({status = "error", message = "Failed to initiate path request: " .. (req_err_msg or "Unknown error"), state = global.pf_vehicles[vehicle_key].pf_state})
-    end
+    local result = Pathfinding.request_path_for_entity(vehicle_entity, {x = target_x, y = target_y})
+    -- Cursor into the event queue after the request was made; the agent waits for
+    -- pf_state events with a greater id to learn when this movement finishes.
+    result.event_cursor = Events.last_id()
+    return to_json_string(result)
 end
 
--- Event handler for path request completion
-local function on_script_path_request_finished_handler(event)
-    local request_id = event.id
-    local vehicle_key = global.pf_request_to_vehicle_map[request_id]
-
-    if not vehicle_key then
-        -- game.print("Path request finished for an unknown request ID: " .. request_id) -- Can be noisy
-        return
-    end
-
-    local vehicle_data = global.pf_vehicles[vehicle_key]
-    if not vehicle_data or vehicle_data.active_request_id ~= request_id then
-        game.print("Path request finished for vehicle key " .. vehicle_key .. ", but ID mismatch or no active request. Event ID: " .. request_id .. ", Stored ID: " .. (vehicle_data and vehicle_data.active_request_id or "nil"))
-        return
-    end
-
-    game.print("Path request finished for vehicle key: " .. vehicle_key .. " (Name: " .. (vehicle_data.entity_name or "N/A") .. ")")
-    if event.success then
-        game.print("Path found successfully! Number of waypoints: " .. #event.path)
-        if #event.path < 10 and #event.path > 0 then
-             game.print("Path waypoints: " .. to_json_string(event.path))
-        elseif #event.path == 0 then
-            game.print("Path found, but it has zero waypoints (start is likely at/near goal).")
-        else
-            game.print("Path is too long to print all waypoints here (" .. #event.path .. " waypoints).")
-        end
-        vehicle_data.current_path = event.path -- Store the path for later use
-        set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.PATH_RECEIVED)
-    else
-        game.print("Pathfinding failed for vehicle key: " .. vehicle_key)
-        vehicle_data.current_path = nil
-        set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.PATH_FAILED)
-    end
-
-    vehicle_data.active_request_id = nil -- Clear the active request ID
-    global.pf_request_to_vehicle_map[request_id] = nil -- Clean up map
-
-    -- If path was received successfully, attempt to start movement
-    if vehicle_data.pf_state == PF_VEHICLE_STATES.PATH_RECEIVED and vehicle_data.current_path and #vehicle_data.current_path > 0 then
-        vehicle_data.current_waypoint_index = 1 -- Start with the first waypoint
-        execute_next_movement_command(vehicle_key)
-    elseif vehicle_data.pf_state == PF_VEHICLE_STATES.PATH_RECEIVED and vehicle_data.current_path and #vehicle_data.current_path == 0 then
-        -- Path received but it's empty (e.g. start is goal), so consider it done.
-        game.print("Vehicle " .. vehicle_key .. " (Name: " .. vehicle_data.entity_name .. ") received an empty path. Considering navigation complete.")
-        set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.IDLE)
-    end
+-- Walks the player's character to {x, y} using the pathfinding module.
+function actions.start_pathfinding_to(params)
+    if not params then return to_json_string({status = "error", message = "Target coordinates not provided"}) end
+    return actions.pf_set_destination({x = params.x, y = params.y, player_index = params.player_index, unit_number = params.unit_number})
 end
 
-local function get_vehicle_key_from_entity(entity)
-    if not (entity and entity.valid) then return nil end
-    if entity.unit_number then return entity.unit_number end
-    -- For player character, entity.player exists
-    if entity.type == "player" and entity.player and entity.player.valid then
-        return "player_" .. entity.player.index
-    end
-    return nil
+-- Queues a list of walk/mine actions that the mod runs tick by tick for the actor (see
+-- action_queue.lua). params.actions = {{type = "walk", x = .., y = ..}, {type = "mine", name = .., count = ..}, ...};
+-- params.append adds them to a running queue instead of replacing it. When the queue ends, an
+-- action_queue_done event with the job_id and a summary (state, actions_done, mined) is pushed.
+function actions.enqueue_actions(params)
+    params = params or {}
+    local actor, player_or_err = get_actor(params)
+    if not actor then return to_json_string({status = "error", message = player_or_err}) end
+    local event_cursor = Events.last_id()
+    local result = ActionQueue.enqueue(actor, actor_key(actor, player_or_err), params.actions, params.append)
+    result.event_cursor = event_cursor
+    return to_json_string(result)
 end
 
-local function execute_next_movement_command(vehicle_key)
-    local vehicle_data = global.pf_vehicles[vehicle_key]
-    if not vehicle_data then
-        game.print("Execute movement: No data for vehicle_key: " .. vehicle_key)
-        return
-    end
-
-    -- Ensure entity is still valid and commandable before proceeding
-    local entity_unit_number
-    local entity_player_index
-    if type(vehicle_key) == "string" and string.sub(vehicle_key, 1, 7) == "player_" then
-        entity_player_index = tonumber(string.sub(vehicle_key, 8))
-    else
-        entity_unit_number = vehicle_key
-    end
-    local vehicle_entity, err_msg = get_vehicle_entity(entity_unit_number, entity_player_index)
-
-    if not (vehicle_entity and vehicle_entity.valid and vehicle_entity.commandable) then
-        game.print("Vehicle " .. vehicle_key .. " (Name: " .. (vehicle_data.entity_name or "N/A") .. "): Entity not found, invalid, or not commandable for movement. Error: " .. (err_msg or "N/A"))
-        set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.PATH_FAILED)
-        vehicle_data.current_path = nil
-        vehicle_data.current_waypoint_index = nil
-        return
-    end
-
-    if not (vehicle_data.current_path and vehicle_data.current_waypoint_index) then
-        game.print("Vehicle " .. vehicle_key .. " (Name: " .. vehicle_data.entity_name .. "): Cannot execute movement. Missing path or waypoint index.")
-        set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.IDLE)
-        return
-    end
-
-    if vehicle_data.current_waypoint_index > #vehicle_data.current_path then
-        game.print("Vehicle " .. vehicle_key .. " (Name: " .. vehicle_data.entity_name .. ") has completed all waypoints.")
-        set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.IDLE)
-        vehicle_data.current_path = nil
-        vehicle_data.current_waypoint_index = nil
-        return
-    end
-
-    local destination = vehicle_data.current_path[vehicle_data.current_waypoint_index]
-    if not destination then
-        game.print("Vehicle " .. vehicle_key .. " (Name: " .. vehicle_data.entity_name .. "): Invalid destination at waypoint index " .. vehicle_data.current_waypoint_index)
-        set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.PATH_FAILED)
-        vehicle_data.current_path = nil
-        vehicle_data.current_waypoint_index = nil
-        return
-    end
-
-    local command = {type = defines.command.go_to_location, destination = destination, follow_path = true}
-    -- `follow_path = true` is used as per guide's initial suggestion for `set_command`.
-    -- Refinements for stuttering (section 2.4) can be future work.
-
-    vehicle_entity.commandable.set_command(command)
-    set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.FOLLOWING_PATH)
-    game.print("Vehicle " .. vehicle_key .. " (Name: " .. vehicle_data.entity_name .. ") moving to waypoint " .. vehicle_data.current_waypoint_index .. "/" .. #vehicle_data.current_path .. " at {" .. string.format("%.2f", destination.x) .. ", " .. string.format("%.2f", destination.y) .. "}")
+-- Progress of the actor's current (or last) action queue.
+function actions.get_action_queue_status(params)
+    local actor, player_or_err = get_actor(params)
+    if not actor then return to_json_string({status = "error", message = player_or_err}) end
+    return to_json_string(ActionQueue.status(actor_key(actor, player_or_err)))
 end
 
-local function on_ai_command_completed_handler(event)
-    if not (event and event.entity and event.entity.valid) then return end
-
-    local vehicle_entity = event.entity
-    local vehicle_key = get_vehicle_key_from_entity(vehicle_entity)
-
-    if not vehicle_key then
-        -- Not an entity we are tracking by this keying scheme
-        return
-    end
+function actions.cancel_action_queue(params)
+    local actor, player_or_err = get_actor(params)
+    if not actor then return to_json_string({status = "error", message = player_or_err}) end
+    return to_json_string(ActionQueue.cancel(actor_key(actor, player_or_err)))
+end
 
-    local vehicle_data = global.pf_vehicles[vehicle_key]
-    if not (vehicle_data and vehicle_data.pf_state == PF_VEHICLE_STATES.FOLLOWING_PATH) then
-        -- Not our vehicle or not in the correct state to process command completion
-        return
-    end
+-- Hit/miss counters and size of the pathfinding module's path cache.
+function actions.path_cache_stats(params)
+    return to_json_string(Pathfinding.path_cache_stats())
+end
 
-    -- TODO: As per guide, check event.result for more robust error handling (e.g. defines.command_result.fail)
-    game.print("Vehicle " .. vehicle_key .. " (Name: " .. vehicle_data.entity_name .. ") AI command completed to waypoint " .. (vehicle_data.current_waypoint_index or "?") .. ". Result: " .. event.result)
+-- Returns queued agent events with id > params.since (e.g. pathfinding state transitions).
+function actions.poll_events(params)
+    local since = params and tonumber(params.since) or 0
+    local limit = params and tonumber(params.limit) or nil
+    local events, cursor = Events.poll(since, limit)
+    return to_json_string({events = events, cursor = cursor, tick = game.tick})
+end
 
-    if vehicle_data.current_waypoint_index then -- Ensure it was set
-        vehicle_data.current_waypoint_index = vehicle_data.current_waypoint_index + 1
-        execute_next_movement_command(vehicle_key) -- Attempt to move to the next waypoint or finalize
-    else
-        game.print("Vehicle " .. vehicle_key .. " (Name: " .. vehicle_data.entity_name .. ") completed a command but current_waypoint_index was nil. Setting to IDLE.")
-        set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.IDLE)
-    end
+local function initialize_globals()
+    Pathfinding.initialize_globals()
+    Events.initialize_globals()
+    ActionQueue.initialize_globals()
+    Recipes.initialize_globals()
+    global.scan_cache = global.scan_cache or {}
 end
 
 -- Event Registrations
 script.on_init(function()
     setup_mod()
-    initialize_pf_globals()
+    initialize_globals()
 end)
 script.on_load(function()
     setup_mod()
-    initialize_pf_globals()
+end)
+script.on_configuration_changed(function()
+    initialize_globals()
 end)
 
-script.on_event(defines.events.on_script_path_request_finished, on_script_path_request_finished_handler)
-script.on_event(defines.events.on_ai_command_completed, on_ai_command_completed_handler)
+script.on_event(defines.events.on_script_path_request_finished, Pathfinding.on_script_path_request_finished)
+script.on_event(defines.events.on_ai_command_completed, Pathfinding.on_ai_command_completed)
+script.on_event(defines.events.on_tick, ActionQueue.on_tick)
+-- Research changes the unlocked recipes: bump the epoch the agent watches for a reload.
+script.on_event({defines.events.on_research_finished, defines.events.on_research_reversed,
+                 defines.events.on_technology_effects_reset, defines.events.on_force_reset}, Recipes.on_research_changed)
+-- Anything that changes what can be walked through drops the cached paths crossing those chunks.
+script.on_event({defines.events.on_built_entity, defines.events.on_robot_built_entity, defines.events.script_raised_built,
+                 defines.events.script_raised_revive, defines.events.on_player_mined_entity, defines.events.on_robot_mined_entity,
+                 defines.events.on_entity_died, defines.events.script_raised_destroy}, Pathfinding.on_entity_changed)
+script.on_event({defines.events.on_player_built_tile, defines.events.on_robot_built_tile, defines.events.script_raised_set_tiles},
+                Pathfinding.on_tiles_changed)
+-- Lets the agent wait for mining to finish instead of sleeping for a guessed duration.
+script.on_event(defines.events.on_player_mined_item, function(event)
+    Events.push("player_mined_item", {player_index = event.player_index, item = event.item_stack.name, count = event.item_stack.count})
+end)
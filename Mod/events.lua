@@ -0,0 +1,50 @@
+local EventsModule = {}
+
+-- Bounded queue of agent-facing events (pathfinding transitions, etc.) stored in global.
+-- Events get monotonically increasing ids so the agent can drain everything after a cursor
+-- in one RCON call instead of polling individual status functions.
+local MAX_EVENTS = 512
+
+EventsModule.initialize_globals = function()
+    global.agent_events = global.agent_events or {}
+    global.agent_events_first_id = global.agent_events_first_id or 1
+    global.agent_events_last_id = global.agent_events_last_id or 0
+end
+
+-- Appends an event; `data` is a flat table merged into the event record.
+EventsModule.push = function(event_type, data)
+    if not global.agent_events then return end
+    local id = global.agent_events_last_id + 1
+    local event = {id = id, tick = game.tick, type = event_type}
+    if data then
+        for k, v in pairs(data) do event[k] = v end
+    end
+    global.agent_events[id] = event
+    global.agent_events_last_id = id
+    -- Drop the oldest events once the queue is full.
+    while id - global.agent_events_first_id >= MAX_EVENTS do
+        global.agent_events[global.agent_events_first_id] = nil
+        global.agent_events_first_id = global.agent_events_first_id + 1
+    end
+    return id
+end
+
+EventsModule.last_id = function()
+    return global.agent_events_last_id or 0
+end
+
+-- Returns the events with id > since_id (at most `limit` of them) plus the new cursor.
+EventsModule.poll = function(since_id, limit)
+    local events = {}
+    if not global.agent_events then return events, 0 end
+    local first = math.max((since_id or 0) + 1, global.agent_events_first_id)
+    local last = global.agent_events_last_id
+    if limit and last - first + 1 > limit then last = first + limit - 1 end
+    for id = first, last do
+        local event = global.agent_events[id]
+        if event then table.insert(events, event) end
+    end
+    return events, math.max(last, since_id or 0)
+end
+
+return EventsModule
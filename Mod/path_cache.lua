@@ -0,0 +1,249 @@
+local PathCacheModule = {}
+
+-- Cache of pathfinder results, stored in global so it survives save/load.
+-- Entries are keyed by surface, collision mask and the quantized start and goal cells; a path
+-- also serves the opposite direction, and two cached paths that meet in a cell are joined.
+-- Building, mining or destroying an entity (or placing tiles) drops every path through the
+-- affected chunks, and entries older than MAX_AGE_TICKS are not used at all.
+local CELL_SIZE = 2 -- Tiles per quantization cell for start and goal
+local CHUNK_SIZE = 32
+local MAX_ENTRIES = 256
+local MAX_AGE_TICKS = 60 * 60 * 10
+
+PathCacheModule.initialize_globals = function()
+    global.pf_path_cache = global.pf_path_cache or {} -- key -> entry
+    global.pf_path_cache_by_chunk = global.pf_path_cache_by_chunk or {} -- surface_index -> chunk_key -> {key = true}
+    global.pf_path_cache_by_cell = global.pf_path_cache_by_cell or {} -- prefix .. cell -> {key = true}
+    global.pf_path_cache_count = global.pf_path_cache_count or 0
+    global.pf_path_cache_stats = global.pf_path_cache_stats or {hits = 0, reverse_hits = 0, joined_hits = 0, misses = 0, stores = 0, invalidated = 0}
+end
+
+-- Stable string for a collision mask in either the 2.0 ({layers = {name = true}}) or the
+-- 1.1 ({"layer-name", ...} / {["layer-name"] = true}) format.
+local function collision_mask_key(mask)
+    local layers = {}
+    local source = (type(mask) == "table" and mask.layers) or mask or {}
+    for k, v in pairs(source) do
+        if type(k) == "string" and v then
+            table.insert(layers, k)
+        elseif type(v) == "string" then
+            table.insert(layers, v)
+        end
+    end
+    table.sort(layers)
+    return table.concat(layers, "|")
+end
+
+local function cell_of(position)
+    return math.floor(position.x / CELL_SIZE) .. "," .. math.floor(position.y / CELL_SIZE)
+end
+
+-- Everything a lookup or store needs to know about one path request.
+PathCacheModule.request_info = function(entity, start, goal)
+    local box = entity.prototype.selection_box
+    local size = string.format("%.1fx%.1f", box.right_bottom.x - box.left_top.x, box.right_bottom.y - box.left_top.y)
+    return {
+        surface_index = entity.surface.index,
+        prefix = entity.surface.index .. ":" .. collision_mask_key(entity.prototype.collision_mask) .. ":" .. size .. ":",
+        start = {x = start.x, y = start.y},
+        goal = {x = goal.x, y = goal.y}
+    }
+end
+
+local function entry_key(prefix, from_cell, to_cell)
+    return prefix .. from_cell .. ">" .. to_cell
+end
+
+local function index_add(index, key, member)
+    index[key] = index[key] or {}
+    index[key][member] = true
+end
+
+local function index_remove(index, key, member)
+    local set = index[key]
+    if set then
+        set[member] = nil
+        if next(set) == nil then index[key] = nil end
+    end
+end
+
+local function remove_entry(key)
+    local entry = global.pf_path_cache[key]
+    if not entry then return end
+    global.pf_path_cache[key] = nil
+    global.pf_path_cache_count = global.pf_path_cache_count - 1
+    local by_chunk = global.pf_path_cache_by_chunk[entry.surface_index]
+    if by_chunk then
+        for chunk in pairs(entry.chunks) do index_remove(by_chunk, chunk, key) end
+    end
+    index_remove(global.pf_path_cache_by_cell, entry.prefix .. entry.from_cell, key)
+    index_remove(global.pf_path_cache_by_cell, entry.prefix .. entry.to_cell, key)
+end
+
+local function evict_oldest()
+    local oldest_key, oldest_tick
+    for key, entry in pairs(global.pf_path_cache) do
+        if not oldest_tick or entry.last_used < oldest_tick then
+            oldest_key, oldest_tick = key, entry.last_used
+        end
+    end
+    if oldest_key then remove_entry(oldest_key) end
+end
+
+-- Stores a found path (a list of {x, y} positions) for the request described by `info`.
+PathCacheModule.store = function(info, positions)
+    if not (info and positions and #positions > 0) then return end
+    local from_cell, to_cell = cell_of(info.start), cell_of(info.goal)
+    local key = entry_key(info.prefix, from_cell, to_cell)
+    remove_entry(key)
+    if global.pf_path_cache_count >= MAX_ENTRIES then evict_oldest() end
+
+    local chunks = {}
+    local previous = info.start
+    for _, position in ipairs(positions) do
+        -- Every chunk the segment's bounding box touches (waypoints are usually a tile or two apart)
+        for cx = math.floor(math.min(previous.x, position.x) / CHUNK_SIZE), math.floor(math.max(previous.x, position.x) / CHUNK_SIZE) do
+            for cy = math.floor(math.min(previous.y, position.y) / CHUNK_SIZE), math.floor(math.max(previous.y, position.y) / CHUNK_SIZE) do
+                chunks[cx .. "," .. cy] = true
+            end
+        end
+        previous = position
+    end
+
+    global.pf_path_cache[key] = {
+        surface_index = info.surface_index, prefix = info.prefix, from_cell = from_cell, to_cell = to_cell,
+        start = info.start, positions = positions, chunks = chunks, tick = game.tick, last_used = game.tick
+    }
+    global.pf_path_cache_count = global.pf_path_cache_count + 1
+    global.pf_path_cache_by_chunk[info.surface_index] = global.pf_path_cache_by_chunk[info.surface_index] or {}
+    local by_chunk = global.pf_path_cache_by_chunk[info.surface_index]
+    for chunk in pairs(chunks) do index_add(by_chunk, chunk, key) end
+    index_add(global.pf_path_cache_by_cell, info.prefix .. from_cell, key)
+    index_add(global.pf_path_cache_by_cell, info.prefix .. to_cell, key)
+    global.pf_path_cache_stats.stores = global.pf_path_cache_stats.stores + 1
+end
+
+local function usable(key)
+    local entry = global.pf_path_cache[key]
+    if not entry then return nil end
+    if game.tick - entry.tick > MAX_AGE_TICKS then
+        remove_entry(key)
+        return nil
+    end
+    return entry
+end
+
+-- Waypoints of `entry` walked from `from_cell` to the other end.
+local function oriented(entry, from_cell)
+    if entry.from_cell == from_cell then
+        local copy = {}
+        for i, position in ipairs(entry.positions) do copy[i] = position end
+        return copy
+    end
+    local reversed = {}
+    for i = #entry.positions - 1, 1, -1 do table.insert(reversed, entry.positions[i]) end
+    table.insert(reversed, entry.start) -- The reverse walk ends where the recorded one began
+    return reversed
+end
+
+local function other_cell(entry, cell)
+    return entry.from_cell == cell and entry.to_cell or entry.from_cell
+end
+
+-- Returns a list of {x, y} waypoints ending exactly at info.goal, or nil if nothing cached fits.
+PathCacheModule.lookup = function(info)
+    local stats = global.pf_path_cache_stats
+    local from_cell, to_cell = cell_of(info.start), cell_of(info.goal)
+    local path, kind, used
+
+    local forward = usable(entry_key(info.prefix, from_cell, to_cell))
+    local backward = not forward and usable(entry_key(info.prefix, to_cell, from_cell))
+    if forward or backward then
+        used = {forward or backward}
+        path = oriented(used[1], from_cell)
+        kind = forward and "hits" or "reverse_hits"
+    else
+        -- Two cached paths that share a middle cell: start -> middle -> goal.
+        local from_set = global.pf_path_cache_by_cell[info.prefix .. from_cell] or {}
+        local to_set = global.pf_path_cache_by_cell[info.prefix .. to_cell] or {}
+        local to_by_middle = {}
+        for key in pairs(to_set) do
+            local entry = usable(key)
+            if entry then to_by_middle[other_cell(entry, to_cell)] = entry end
+        end
+        for key in pairs(from_set) do
+            local first = usable(key)
+            local second = first and to_by_middle[other_cell(first, from_cell)]
+            if second and second ~= first then
+                local middle = other_cell(first, from_cell)
+                path = oriented(first, from_cell)
+                for _, position in ipairs(oriented(second, middle)) do table.insert(path, position) end
+                used = {first, second}
+                kind = "joined_hits"
+                break
+            end
+        end
+    end
+
+    if not path then
+        stats.misses = stats.misses + 1
+        return nil
+    end
+    for _, entry in ipairs(used) do entry.last_used = game.tick end
+    stats[kind] = stats[kind] + 1
+    -- Cells are CELL_SIZE tiles wide, so finish at the exact requested goal.
+    local last = path[#path]
+    if not last or last.x ~= info.goal.x or last.y ~= info.goal.y then
+        table.insert(path, {x = info.goal.x, y = info.goal.y})
+    end
+    if kind == "joined_hits" then PathCacheModule.store(info, path) end
+    return path, kind
+end
+
+-- Drops cached paths through the chunks an area (expanded by a tile for the walker's own size) touches.
+PathCacheModule.invalidate_area = function(surface_index, left_top, right_bottom)
+    local by_chunk = global.pf_path_cache_by_chunk and global.pf_path_cache_by_chunk[surface_index]
+    if not by_chunk then return end
+    for cx = math.floor((left_top.x - 1) / CHUNK_SIZE), math.floor((right_bottom.x + 1) / CHUNK_SIZE) do
+        for cy = math.floor((left_top.y - 1) / CHUNK_SIZE), math.floor((right_bottom.y + 1) / CHUNK_SIZE) do
+            local keys = by_chunk[cx .. "," .. cy]
+            if keys then
+                local doomed = {}
+                for key in pairs(keys) do table.insert(doomed, key) end
+                for _, key in ipairs(doomed) do
+                    remove_entry(key)
+                    global.pf_path_cache_stats.invalidated = global.pf_path_cache_stats.invalidated + 1
+                end
+            end
+        end
+    end
+end
+
+-- Handler for entity built/mined/destroyed events.
+PathCacheModule.on_entity_changed = function(event)
+    local entity = event.entity or event.created_entity
+    if not (entity and entity.valid) then return end
+    local box = entity.bounding_box
+    PathCacheModule.invalidate_area(entity.surface.index, box.left_top, box.right_bottom)
+end
+
+-- Handler for tile placement events (landfill turns water walkable, and so on).
+PathCacheModule.on_tiles_changed = function(event)
+    if not (event.tiles and event.tiles[1]) then return end
+    local first = event.tiles[1].position
+    local left_top, right_bottom = {x = first.x, y = first.y}, {x = first.x + 1, y = first.y + 1}
+    for _, tile in ipairs(event.tiles) do
+        local position = tile.position
+        left_top.x, left_top.y = math.min(left_top.x, position.x), math.min(left_top.y, position.y)
+        right_bottom.x, right_bottom.y = math.max(right_bottom.x, position.x + 1), math.max(right_bottom.y, position.y + 1)
+    end
+    PathCacheModule.invalidate_area(event.surface_index, left_top, right_bottom)
+end
+
+PathCacheModule.stats = function()
+    local stats = {entries = global.pf_path_cache_count or 0}
+    for k, v in pairs(global.pf_path_cache_stats or {}) do stats[k] = v end
+    return stats
+end
+
+return PathCacheModule
@@ -1,4 +1,6 @@
 local PathfindingModule = {}
+local Events = require("events")
+local PathCache = require("path_cache")
 
 -- Define Pathfinding Vehicle States
 local PF_VEHICLE_STATES = {
@@ -27,16 +29,26 @@ set_vehicle_pf_state = function(vehicle_key, new_state)
     global.pf_vehicles[vehicle_key].pf_state = new_state
     if old_state ~= new_state then
         game.print("PathfindingModule: Vehicle " .. vehicle_key .. " (Name: " .. (global.pf_vehicles[vehicle_key].entity_name or "N/A") .. ") state changed from " .. (old_state or "nil") .. " to: " .. new_state)
+        Events.push("pf_state", {vehicle_key = vehicle_key, state = new_state, old_state = old_state})
     end
 end
 
+-- Placeholder for a to_json_string if control.lua doesn't provide one to the module.
+-- Factorio's game.table_to_json is a good default for simple logging.
+local function table_to_json_string_for_logging(tbl)
+    if game.table_to_json then
+        return game.table_to_json(tbl)
+    end
+    return "(table data - game.table_to_json not available)"
+end
+
 -- Utility to get a vehicle entity (can be player character or actual vehicle)
 -- This will be called by the main request function in the module.
 get_vehicle_entity = function(unit_number, player_index)
     if unit_number then
         for _, surface in pairs(game.surfaces) do
             local entity = surface.find_entity_by_unit_number(unit_number)
-            if entity and entity.valid and (entity.type == "player" or entity.commandable) then
+            if entity and entity.valid and (entity.type == "character" or entity.commandable) then
                 return entity
             end
         end
@@ -75,6 +87,7 @@ request_vehicle_path_internal = function(vehicle_entity, target_pos)
     }
 
     local request_id = surface.request_path(request_params)
+    local path_request_info = PathCache.request_info(vehicle_entity, request_params.start, target_pos)
     local vehicle_key
 
     if vehicle_entity.unit_number then
@@ -88,6 +101,7 @@ request_vehicle_path_internal = function(vehicle_entity, target_pos)
         global.pf_vehicles[vehicle_key].active_request_id = request_id
         global.pf_vehicles[vehicle_key].entity_name = vehicle_entity.name
         global.pf_vehicles[vehicle_key].target_pos = target_pos
+        global.pf_vehicles[vehicle_key].path_request_info = path_request_info -- Lets the finished path be cached
 
         global.pf_request_to_vehicle_map[request_id] = vehicle_key
 
@@ -178,6 +192,7 @@ PathfindingModule.on_script_path_request_finished = function(event)
     local vehicle_data = global.pf_vehicles[vehicle_key]
     if not vehicle_data or vehicle_data.active_request_id ~= request_id then
         game.print("PathfindingModule: Path request finished for vehicle key " .. vehicle_key .. ", but ID mismatch or no active request. Event ID: " .. request_id .. ", Stored ID: " .. (vehicle_data and vehicle_data.active_request_id or "nil"))
+        global.pf_request_to_vehicle_map[request_id] = nil
         return
     end
 
@@ -192,7 +207,13 @@ PathfindingModule.on_script_path_request_finished = function(event)
         else
             game.print("PathfindingModule: Path is too long to print all waypoints here (" .. #event.path .. " waypoints).")
         end
-        vehicle_data.current_path = event.path
+        -- Waypoints are {position = ..., needs_destroy_to_reach = ...}; movement commands and the cache use plain positions.
+        local positions = {}
+        for i, waypoint in ipairs(event.path) do
+            positions[i] = {x = waypoint.position.x, y = waypoint.position.y}
+        end
+        vehicle_data.current_path = positions
+        PathCache.store(vehicle_data.path_request_info, positions)
         set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.PATH_RECEIVED)
     else
         game.print("PathfindingModule: Pathfinding failed for vehicle key: " .. vehicle_key)
@@ -201,6 +222,7 @@ PathfindingModule.on_script_path_request_finished = function(event)
     end
 
     vehicle_data.active_request_id = nil
+    vehicle_data.path_request_info = nil
     global.pf_request_to_vehicle_map[request_id] = nil
 
     if vehicle_data.pf_state == PF_VEHICLE_STATES.PATH_RECEIVED and vehicle_data.current_path and #vehicle_data.current_path > 0 then
@@ -245,9 +267,35 @@ end
 PathfindingModule.initialize_globals = function()
     global.pf_vehicles = global.pf_vehicles or {}
     global.pf_request_to_vehicle_map = global.pf_request_to_vehicle_map or {}
+    PathCache.initialize_globals()
     game.print("PathfindingModule: Globals initialized.")
 end
 
+PathfindingModule.STATES = PF_VEHICLE_STATES
+PathfindingModule.path_cache_stats = PathCache.stats
+PathfindingModule.on_entity_changed = PathCache.on_entity_changed
+PathfindingModule.on_tiles_changed = PathCache.on_tiles_changed
+
+-- Current state of a vehicle key returned by request_path_for_entity, or nil if it never moved.
+PathfindingModule.get_state = function(vehicle_key)
+    local vehicle_data = global.pf_vehicles and global.pf_vehicles[vehicle_key]
+    return vehicle_data and vehicle_data.pf_state or nil
+end
+
+-- Stops a vehicle that is requesting or following a path (e.g. it got close enough) and sets it IDLE.
+PathfindingModule.stop = function(vehicle_key, vehicle_entity)
+    local vehicle_data = global.pf_vehicles and global.pf_vehicles[vehicle_key]
+    if not vehicle_data then return end
+    if vehicle_entity and vehicle_entity.valid and vehicle_entity.commandable and vehicle_entity.commandable.valid then
+        vehicle_entity.commandable.set_command({type=defines.command.stop, ticks_to_wait=0})
+    end
+    vehicle_data.active_request_id = nil -- A request still in flight is ignored when it finishes
+    vehicle_data.path_request_info = nil
+    vehicle_data.current_path = nil
+    vehicle_data.current_waypoint_index = nil
+    set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.IDLE)
+end
+
 -- Main function to be called from control.lua to request a path
 -- vehicle_entity is the actual LuaEntity
 PathfindingModule.request_path_for_entity = function(vehicle_entity, target_pos)
@@ -282,6 +330,20 @@ PathfindingModule.request_path_for_entity = function(vehicle_entity, target_pos)
         -- active_request_id will be overwritten by new request_vehicle_path_internal call
     end
 
+    -- A cached path (or two joined ones) lets the vehicle start moving this tick without asking the pathfinder.
+    local cached_path, cache_kind = PathCache.lookup(PathCache.request_info(vehicle_entity, vehicle_entity.position, target_pos))
+    if cached_path then
+        local vehicle_data = global.pf_vehicles[vehicle_key]
+        vehicle_data.active_request_id = nil -- A request still in flight is ignored when it finishes
+        vehicle_data.target_pos = target_pos
+        vehicle_data.current_path = cached_path
+        game.print("PathfindingModule: Using cached path (" .. cache_kind .. ") for " .. vehicle_entity.name .. " (Key: " .. vehicle_key .. "), " .. #cached_path .. " waypoints.")
+        set_vehicle_pf_state(vehicle_key, PF_VEHICLE_STATES.PATH_RECEIVED)
+        vehicle_data.current_waypoint_index = 1
+        execute_next_movement_command(vehicle_key)
+        return {status = "path_cached", cache = cache_kind, vehicle_key = vehicle_key, entity_name = vehicle_entity.name, state = vehicle_data.pf_state}
+    end
+
     local request_id, returned_vk, err_msg = request_vehicle_path_internal(vehicle_entity, target_pos)
 
     if request_id then
@@ -293,20 +355,4 @@ PathfindingModule.request_path_for_entity = function(vehicle_entity, target_pos)
     end
 end
 
--- Placeholder for a to_json_string if control.lua doesn't provide one to the module.
--- Factorio's game.table_to_json is a good default for simple logging.
-local function table_to_json_string_for_logging(tbl)
-    if game.table_to_json then
-        return game.table_to_json(tbl)
-    end
-    return "(table data - game.table_to_json not available)"
-end
-
--- Update the reference in on_script_path_request_finished
--- from वैश्विक.to_json_string_placeholder to table_to_json_string_for_logging
--- This change will be done by finding that line and replacing it.
--- Searching for: game.print("PathfindingModule: Path waypoints (first few): " .. वैश्विक.to_json_string_placeholder(event.path))
--- Replacing with: game.print("PathfindingModule: Path waypoints (first few): " .. table_to_json_string_for_logging(event.path))
--- The diff tool will handle this specific line change. I'll construct the diff for that.
-
 return PathfindingModule
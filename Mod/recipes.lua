@@ -0,0 +1,90 @@
+local RecipesModule = {}
+local Events = require("events")
+
+-- Recipe export for the agent. The agent keeps the recipe set on disk keyed by fingerprint(),
+-- which only changes with the active mods and the force's research, so a restart costs one
+-- small call instead of serializing every recipe in one tick. When it does need the recipes it
+-- fetches them in pages, one page per RCON call (and so per tick).
+--
+-- Research events bump a per-force epoch (reported by get_player_info) and drop the memoized
+-- fingerprint; the agent reloads its recipes when it sees the epoch change.
+local DEFAULT_PAGE_SIZE = 100
+local HASH_MODULUS = 2147483647
+
+RecipesModule.initialize_globals = function()
+    global.research_epochs = global.research_epochs or {} -- force index -> counter
+    -- Memoized fingerprints are dropped on load as well: a mod update changes them.
+    global.recipe_fingerprints = {}
+end
+
+RecipesModule.epoch = function(force)
+    return global.research_epochs and global.research_epochs[force.index] or 0
+end
+
+local function hash_string(hash, text)
+    for i = 1, #text do
+        hash = (hash * 31 + string.byte(text, i)) % HASH_MODULUS
+    end
+    return hash
+end
+
+-- Cheap identity of the force's recipe set: active mod versions plus a hash of the researched
+-- technologies. Memoized per force until research changes.
+RecipesModule.fingerprint = function(force)
+    local cached = global.recipe_fingerprints[force.index]
+    if cached then return cached end
+
+    local mods = {}
+    for name, version in pairs(script.active_mods) do table.insert(mods, name .. "@" .. version) end
+    table.sort(mods)
+    local researched, hash = 0, 0
+    for name, technology in pairs(force.technologies) do
+        if technology.researched then
+            researched = researched + 1
+            hash = hash_string(hash, name .. ";")
+        end
+    end
+    cached = {
+        fingerprint = table.concat(mods, ",") .. "|" .. force.name .. "|" .. researched .. ":" .. hash,
+        epoch = RecipesModule.epoch(force),
+        researched = researched
+    }
+    global.recipe_fingerprints[force.index] = cached
+    return cached
+end
+
+local function recipe_data(recipe)
+    local data = { name = recipe.name, category = recipe.category, energy = recipe.energy, ingredients = {}, products = {} }
+    for _, ingredient in ipairs(recipe.ingredients) do table.insert(data.ingredients, { name = ingredient.name, amount = ingredient.amount, type = ingredient.type or "item" }) end
+    for _, product in ipairs(recipe.products) do table.insert(data.products, { name = product.name, amount = product.amount, type = product.type or "item" }) end
+    return data
+end
+
+-- Enabled recipes number offset + 1 .. offset + limit (all of them without a limit), in
+-- prototype order, plus the total and the offset of the next page (nil after the last one).
+RecipesModule.page = function(force, offset, limit)
+    offset = offset or 0
+    local recipes, total = {}, 0
+    for _, recipe in pairs(force.recipes) do
+        if recipe.enabled then
+            total = total + 1
+            if total > offset and (not limit or #recipes < limit) then table.insert(recipes, recipe_data(recipe)) end
+        end
+    end
+    local next_offset = offset + #recipes
+    return {recipes = recipes, offset = offset, total = total, next = next_offset < total and limit and next_offset or nil}
+end
+
+RecipesModule.DEFAULT_PAGE_SIZE = DEFAULT_PAGE_SIZE
+
+-- Handler for on_research_finished / on_research_reversed / on_technology_effects_reset / on_force_reset.
+RecipesModule.on_research_changed = function(event)
+    local force = event.force or (event.research and event.research.force)
+    if not (force and force.valid) then return end
+    global.research_epochs[force.index] = RecipesModule.epoch(force) + 1
+    global.recipe_fingerprints[force.index] = nil
+    Events.push("recipes_changed", {force = force.name, epoch = global.research_epochs[force.index],
+                                    research = event.research and event.research.name or nil})
+end
+
+return RecipesModule
@@ -0,0 +1,186 @@
+"""
+End-to-end agent benchmark that needs neither Factorio nor the Gemini API.
+
+Runs the real FactorioRCONClient and AgentLoop (or AgentPool for several bots) against
+fake_factorio.FakeFactorioServer with stub_policy.StubPolicy making the decisions, then reports
+loop iterations per second, p50/p99 latency per phase, bytes on the wire and memory use.
+
+Run from the repository root:
+    python bench/agent_benchmark.py [--loops N] [--bots N] [--latency S] [--think-latency S] [--json out.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "Agent"))
+sys.path.insert(0, BENCH_DIR)
+
+from agent_pool import AgentPool # noqa: E402
+from exploration_map import ExplorationMap # noqa: E402
+from fake_factorio import FakeFactorioServer, FakeServerThread, SyntheticWorld # noqa: E402
+from local_policy import LocalPolicy # noqa: E402
+from main import FactorioRCONClient # noqa: E402
+from pipeline import AgentLoop # noqa: E402
+from recipe_cache import RecipeCache # noqa: E402
+from stub_policy import StubPolicy # noqa: E402
+from world_model import WorldModel # noqa: E402
+
+PHASES = ("sense", "think", "act")
+
+
+class TimedAgentLoop(AgentLoop):
+    """
+    AgentLoop that records the wall time of every sense/think/act call into `timings`.
+    """
+    timings = None
+
+    def _timed(self, phase, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.timings[phase].append(time.perf_counter() - start)
+
+    def sense(self):
+        return self._timed("sense", super().sense)
+
+    def think(self, snapshot):
+        return self._timed("think", super().think, snapshot)
+
+    def act(self, decision, snapshot, mine_target=None):
+        return self._timed("act", super().act, decision, snapshot, mine_target)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100.0 * len(ordered) + 0.5)) - 1))]
+
+
+def run(args):
+    world = SyntheticWorld(size=args.world_size, patches=args.patches, trees=args.trees, seed=args.seed)
+    server = FakeFactorioServer(world, players=args.bots, latency=args.latency, jitter=args.jitter,
+                                time_scale=args.time_scale, debug_noise=not args.no_noise, recipes=args.recipes, seed=args.seed)
+    policy = StubPolicy(think_latency=args.think_latency)
+    if args.local_policy:
+        policy = LocalPolicy(policy, goal_item=args.goal_item, goal_quantity=args.goal_quantity)
+    TimedAgentLoop.timings = {phase: [] for phase in PHASES}
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    with FakeServerThread(server):
+        client = FactorioRCONClient("127.0.0.1", server.port, server.password, pool_size=args.pool_size)
+        client.connect()
+        try:
+            recipe_cache = RecipeCache(args.recipe_cache)
+            recipes = recipe_cache.load(client)
+            options = {"scan_radius": args.scan_radius, "speculate": not args.no_speculate, "recipe_cache": recipe_cache}
+            if args.exploration_map:
+                options["exploration"] = ExplorationMap(args.exploration_map)
+            log = sys.stdout if args.verbose else open(os.devnull, "w")
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(log):
+                if args.bots > 1:
+                    runner = AgentPool(client, policy, WorldModel(), recipes, [{"player_index": i} for i in range(1, args.bots + 1)],
+                                       llm_concurrency=args.llm_concurrency, loop_class=TimedAgentLoop, **options)
+                    loops = list(runner.loops.values())
+                else:
+                    runner = TimedAgentLoop(client.for_actor(player_index=1), policy, WorldModel(), recipes, **options)
+                    loops = [runner]
+                try:
+                    runner.run(args.loops)
+                finally:
+                    runner.close()
+                    if options.get("exploration"):
+                        options["exploration"].close()
+            elapsed = time.perf_counter() - start
+        finally:
+            client.disconnect()
+
+    peak_traced = None
+    if args.tracemalloc:
+        peak_traced = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    cycles = sum(loop.stats["cycles"] for loop in loops)
+    report = {
+        "config": vars(args),
+        "elapsed_s": elapsed,
+        "iterations": cycles,
+        "iterations_per_s": cycles / elapsed if elapsed else None,
+        "speculative_hits": sum(loop.stats["speculative_hits"] for loop in loops),
+        "speculative_misses": sum(loop.stats["speculative_misses"] for loop in loops),
+        "phases_ms": {phase: {"count": len(values),
+                              "p50": percentile(values, 50) * 1000 if values else None,
+                              "p99": percentile(values, 99) * 1000 if values else None}
+                      for phase, values in TimedAgentLoop.timings.items()},
+        "wire": {"commands": server.commands, "bytes_to_server": server.bytes_in, "bytes_from_server": server.bytes_out,
+                 "bytes_per_iteration": (server.bytes_in + server.bytes_out) / cycles if cycles else None},
+        "memory": {"max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "tracemalloc_peak_bytes": peak_traced},
+        "decisions": policy.stats if args.local_policy else {"model": policy.decisions},
+        "game": {"ticks": server.tick, "inventories": {i: p["inventory"] for i, p in server.players.items()}},
+    }
+    return report
+
+
+def print_report(report):
+    print(f"iterations: {report['iterations']} in {report['elapsed_s']:.2f}s -> {report['iterations_per_s']:.2f} it/s "
+          f"(speculation hits/misses: {report['speculative_hits']}/{report['speculative_misses']})")
+    print(f"{'phase':<8}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for phase, stats in report["phases_ms"].items():
+        if stats["count"]:
+            print(f"{phase:<8}{stats['count']:>8}{stats['p50']:>10.2f}{stats['p99']:>10.2f}")
+    wire = report["wire"]
+    print(f"wire: {wire['commands']} commands, {wire['bytes_to_server'] / 1e3:.1f} kB sent, {wire['bytes_from_server'] / 1e3:.1f} kB received"
+          f" ({(wire['bytes_per_iteration'] or 0) / 1e3:.1f} kB/iteration)")
+    memory = report["memory"]
+    traced = f", tracemalloc peak {memory['tracemalloc_peak_bytes'] / 1e6:.1f} MB" if memory["tracemalloc_peak_bytes"] else ""
+    print(f"memory: max RSS {memory['max_rss_kb'] / 1e3:.1f} MB{traced}")
+    print(f"decisions: {report['decisions']}")
+    print(f"game: {report['game']['ticks']} ticks, inventories {report['game']['inventories']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--loops", type=int, default=30, help="Iterations per bot")
+    parser.add_argument("--bots", type=int, default=1)
+    parser.add_argument("--pool-size", type=int, default=1, help="RCON connections")
+    parser.add_argument("--llm-concurrency", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.002, help="Seconds added to every RCON response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, seconds")
+    parser.add_argument("--think-latency", type=float, default=0.0, help="Seconds per stub decision (emulates the LLM)")
+    parser.add_argument("--time-scale", type=float, default=20.0, help="Game speed multiplier (walking time)")
+    parser.add_argument("--world-size", type=int, default=512)
+    parser.add_argument("--patches", type=int, default=16)
+    parser.add_argument("--trees", type=int, default=3000)
+    parser.add_argument("--recipes", type=int, default=200)
+    parser.add_argument("--scan-radius", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-speculate", action="store_true")
+    parser.add_argument("--exploration-map", help="Directory of a persistent exploration map to record scans in and explore with")
+    parser.add_argument("--local-policy", action="store_true",
+                        help="Decide routine gathering with LocalPolicy, escalating to the stub policy as the model")
+    parser.add_argument("--goal-item", default="iron-gear-wheel", help="Goal the local policy plans raw materials for")
+    parser.add_argument("--goal-quantity", type=int, default=10)
+    parser.add_argument("--recipe-cache", help="JSON file to keep the fetched recipes in between runs (memory only if unset)")
+    parser.add_argument("--no-noise", action="store_true", help="Do not prepend pathfinding debug lines to responses")
+    parser.add_argument("--tracemalloc", action="store_true", help="Track Python allocations (slows the run)")
+    parser.add_argument("--verbose", action="store_true", help="Show the agent's log output")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Micro-benchmark for RCON response decoding.
+
+Compares the old greedy-regex extraction with the framed protocol (sentinel slice +
+json / orjson) on multi-megabyte recipe and scan payloads, with and without interleaved
+game.print debug lines like the ones the pathfinding handlers emit.
+
+Run from the repository root:
+    python bench/decode_benchmark.py [--repeat N] [--scale N]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Agent"))
+
+import rcon # noqa: E402
+
+
+def legacy_parse(raw_response):
+    """The pre-framing parser: greedy regex over the whole payload, then json.loads."""
+    json_match = re.search(r'(\{.*\})|(\[.*\])', raw_response)
+    if not json_match:
+        return None
+    try:
+        return json.loads(json_match.group(0))
+    except json.JSONDecodeError:
+        return None
+
+
+def make_recipes(count):
+    rng = random.Random(1)
+    items = [f"item-{i}" for i in range(count // 2)]
+    return {"recipes": [
+        {"name": f"recipe-{i}",
+         "ingredients": [{"name": rng.choice(items), "amount": rng.randint(1, 10), "type": "item"} for _ in range(rng.randint(1, 6))],
+         "products": [{"name": rng.choice(items), "amount": rng.randint(1, 4), "type": "item"} for _ in range(rng.randint(1, 3))]}
+        for i in range(count)]}
+
+
+def make_scan(count):
+    rng = random.Random(2)
+    names = ["iron-ore", "copper-ore", "stone", "coal", "tree"]
+    entities = []
+    for _ in range(count):
+        x, y = rng.randint(-500, 500) + 0.5, rng.randint(-500, 500) + 0.5
+        name = rng.choice(names)
+        entity = {"name": name, "key": f"{name}@{x:.2f},{y:.2f}", "position": {"x": f"{x:.2f}", "y": f"{y:.2f}"}}
+        if name != "tree":
+            entity["amount"] = rng.randint(100, 5000)
+        entities.append(entity)
+    return {"entities": entities}
+
+
+DEBUG_LINES = "\n".join([
+    "PathfindingModule: Vehicle player_1 (Name: character) moving to waypoint 3/12 at {12.50, -4.25}",
+    "PathfindingModule: Path waypoints (first few): [{\"position\":{\"x\":1,\"y\":2}},{\"position\":{\"x\":3",
+    "PathfindingModule: Vehicle 42 state changed from REQUESTING_PATH to: PATH_RECEIVED",
+]) + "\n"
+
+
+def timeit(fn, raw, repeat):
+    best = float("inf")
+    result = None
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            result = None
+            start = time.perf_counter()
+            result = fn(raw)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=int, default=1, help="Multiplier for payload size")
+    args = parser.parse_args()
+
+    payloads = {
+        "recipes": make_recipes(8000 * args.scale),
+        "scan": make_scan(40000 * args.scale),
+    }
+
+    def framed(raw):
+        return rcon.parse_json_response(raw)
+
+    def framed_stdlib(raw):
+        saved, rcon.orjson = rcon.orjson, None
+        try:
+            return rcon.parse_json_response(raw)
+        finally:
+            rcon.orjson = saved
+
+    parsers = [("legacy regex", legacy_parse), ("framed json", framed_stdlib)]
+    if rcon.orjson is not None:
+        parsers.append(("framed orjson", framed))
+    else:
+        print("(orjson not installed; skipping orjson fast path)")
+
+    print(f"{'payload':<22}{'size':>10}  " + "".join(f"{name:>16}" for name, _ in parsers))
+    for label, payload in payloads.items():
+        body = json.dumps(payload, separators=(",", ":"))
+        for noisy in (False, True):
+            raw = (DEBUG_LINES if noisy else "") + rcon.RESPONSE_START + body + rcon.RESPONSE_END
+            legacy_raw = (DEBUG_LINES if noisy else "") + body # The old mod sent no frame
+            cells = []
+            for name, fn in parsers:
+                seconds, result = timeit(fn, legacy_raw if name == "legacy regex" else raw, args.repeat)
+                ok = result == payload
+                cells.append(f"{seconds * 1000:>11.1f} ms{'' if ok else ' !'}")
+            name = f"{label}{' +debug' if noisy else ''}"
+            print(f"{name:<22}{len(raw) / 1e6:>8.2f}MB  " + "".join(f"{c:>16}" for c in cells))
+    print("'!' marks a parser that returned the wrong value (e.g. picked up a debug line).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,651 @@
+"""
+Local stand-in for a Factorio server running the Autonomo-Bot mod, for offline benchmarks.
+
+Speaks Source RCON, accepts the same `/sc game.print(remote.call("factorio_autonomo_bot", ...))`
+commands the agent sends and answers the way the mod does: framed with <<AFB>>...<</AFB>>,
+encoded with to_json_string's quirks (empty tables as [], integers without a fraction, nil
+fields omitted) and, optionally, with the pathfinding module's game.print debug lines in front.
+
+The world is synthetic (ore patches and trees on a square map) and deterministic for a given
+seed. Game time runs at 60 ticks per second times `time_scale`; walking takes as long as a
+character would need. As in the game, resources and trees have no unit_number and are mined by
+position.
+"""
+import asyncio
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Agent"))
+
+from rcon import (MOD_INTERFACE_NAME, RESPONSE_END, RESPONSE_START, SERVERDATA_AUTH, # noqa: E402
+                  SERVERDATA_AUTH_RESPONSE, SERVERDATA_RESPONSE_VALUE, encode_packet, read_packet)
+
+TICKS_PER_SECOND = 60
+CHARACTER_SPEED = 0.15 # Tiles per tick (about 8.9 tiles/s)
+CHUNK_SIZE = 32
+ORE_NAMES = ["iron-ore", "copper-ore", "coal", "stone"]
+TREE_NAMES = [f"tree-0{i}" for i in range(1, 10)]
+MAX_EVENTS = 512
+MINING_TICKS = {"resource": 120, "tree": 40} # Per mined unit at the default character mining speed
+RESOURCE_REACH = 2.7
+TREE_REACH = 10.0
+MINE_RADIUS = 32
+
+_COMMAND_RE = re.compile(r'^/(?:sc|silent-command) game\.print\(remote\.call\("([^"]+)", "([^"]+)"(?:, (.*))?\)\)\s*$', re.S)
+_NUMBER_RE = re.compile(r'-?(?:inf|nan|\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)')
+_IDENT_RE = re.compile(r'([A-Za-z_][A-Za-z0-9_]*)\s*=')
+_STRING_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", '"': '"', "\\": "\\"}
+
+
+def parse_lua_literal(text):
+    """
+    Parses the Lua table/literal syntax produced by rcon.to_lua_literal into Python values.
+    Tables with only positional entries become lists, everything else dicts.
+    """
+    value, pos = _parse_value(text, 0)
+    return value
+
+
+def _skip(text, pos):
+    while pos < len(text) and text[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+def _parse_value(text, pos):
+    pos = _skip(text, pos)
+    c = text[pos]
+    if c == "{":
+        return _parse_table(text, pos + 1)
+    if c == '"':
+        out = []
+        pos += 1
+        while text[pos] != '"':
+            if text[pos] == "\\":
+                pos += 1
+                out.append(_STRING_ESCAPES.get(text[pos], text[pos]))
+            else:
+                out.append(text[pos])
+            pos += 1
+        return "".join(out), pos + 1
+    for word, value in (("nil", None), ("true", True), ("false", False)):
+        if text.startswith(word, pos):
+            return value, pos + len(word)
+    match = _NUMBER_RE.match(text, pos)
+    if not match:
+        raise ValueError(f"Unexpected Lua syntax at {pos}: {text[pos:pos + 20]!r}")
+    number = match.group(0)
+    if number.lstrip("-").isdigit():
+        return int(number), match.end()
+    return float(number), match.end()
+
+
+def _parse_table(text, pos):
+    items, fields = [], {}
+    while True:
+        pos = _skip(text, pos)
+        if text[pos] == "}":
+            pos += 1
+            break
+        if text[pos] == "[":
+            key, pos = _parse_value(text, pos + 1)
+            pos = _skip(text, pos) + 1 # ]
+            pos = _skip(text, pos) + 1 # =
+            fields[key], pos = _parse_value(text, pos)
+        else:
+            match = _IDENT_RE.match(text, pos)
+            if match:
+                fields[match.group(1)], pos = _parse_value(text, match.end())
+            else:
+                value, pos = _parse_value(text, pos)
+                items.append(value)
+        pos = _skip(text, pos)
+        if text[pos] == ",":
+            pos += 1
+    if items and not fields:
+        return items, pos
+    for i, value in enumerate(items):
+        fields[i + 1] = value
+    return fields, pos
+
+
+def lua_json(value):
+    """
+    Encodes like the mod's to_json_string: nil fields disappear, empty tables are [],
+    integral numbers have no fraction, NaN/inf become null, other floats use %.14g.
+    """
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if value != value or value in (math.inf, -math.inf):
+            return "null"
+        if value == math.floor(value) and abs(value) <= 2**53:
+            return "%d" % value
+        return "%.14g" % value
+    if isinstance(value, str):
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r").replace("\t", "\\t") + '"'
+    if isinstance(value, dict):
+        parts = [lua_json(str(k)) + ":" + lua_json(v) for k, v in value.items() if v is not None]
+        if not parts:
+            return "[]"
+        return "{" + ",".join(parts) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(lua_json(v) for v in value) + "]"
+    raise TypeError(f"Cannot encode {type(value)}")
+
+
+def round2(value):
+    return math.floor(value * 100 + 0.5) / 100
+
+
+def scan_key(name, x, y):
+    return f"{name}@{x:.2f},{y:.2f}"
+
+
+class SyntheticWorld:
+    """
+    Ore patches and trees on a `size` x `size` map centered on the origin, indexed by chunk.
+    """
+
+    def __init__(self, size=512, patches=16, patch_radius=12, trees=3000, seed=1):
+        rng = random.Random(seed)
+        self.entities = {} # internal id -> record
+        self.chunks = {} # (cx, cy) -> set of ids
+        self._next_unit = 1
+        half = size // 2
+        for i in range(patches):
+            name = ORE_NAMES[i % len(ORE_NAMES)]
+            cx, cy = rng.randint(-half, half), rng.randint(-half, half)
+            if i < len(ORE_NAMES): # One patch of each ore close to spawn
+                cx, cy = rng.randint(-40, 40), rng.randint(-40, 40)
+            for dx in range(-patch_radius, patch_radius + 1):
+                for dy in range(-patch_radius, patch_radius + 1):
+                    distance = math.hypot(dx, dy)
+                    if distance <= patch_radius:
+                        richness = 1.0 - distance / (patch_radius + 1)
+                        self.add(name, "resource", cx + dx + 0.5, cy + dy + 0.5, int(200 + 2000 * richness * rng.random()))
+        for _ in range(trees):
+            self.add(rng.choice(TREE_NAMES), "tree", rng.uniform(-half, half), rng.uniform(-half, half))
+
+    def add(self, name, entity_type, x, y, amount=None):
+        entity_id = self._next_unit
+        self._next_unit += 1
+        self.entities[entity_id] = {"id": entity_id, "name": name, "type": entity_type, "x": x, "y": y,
+                                    "amount": amount, "key": scan_key(name, x, y)}
+        self.chunks.setdefault((math.floor(x / CHUNK_SIZE), math.floor(y / CHUNK_SIZE)), set()).add(entity_id)
+        return entity_id
+
+    def remove(self, entity_id):
+        record = self.entities.pop(entity_id, None)
+        if record:
+            self.chunks[(math.floor(record["x"] / CHUNK_SIZE), math.floor(record["y"] / CHUNK_SIZE))].discard(entity_id)
+
+    def find_in_area(self, min_x, min_y, max_x, max_y):
+        found = []
+        for cx in range(math.floor(min_x / CHUNK_SIZE), math.floor(max_x / CHUNK_SIZE) + 1):
+            for cy in range(math.floor(min_y / CHUNK_SIZE), math.floor(max_y / CHUNK_SIZE) + 1):
+                for entity_id in self.chunks.get((cx, cy), ()):
+                    record = self.entities[entity_id]
+                    if min_x <= record["x"] <= max_x and min_y <= record["y"] <= max_y:
+                        found.append(record)
+        return found
+
+
+class FakeFactorioServer:
+    """
+    asyncio RCON server that emulates the factorio_autonomo_bot remote interface.
+
+    latency/jitter (seconds) delay every response; debug_noise prepends the pathfinding
+    module's game.print lines to movement responses. bytes_in/bytes_out and commands count
+    the traffic.
+    """
+
+    def __init__(self, world=None, password="bench", players=1, latency=0.0, jitter=0.0, time_scale=1.0,
+                 debug_noise=True, recipes=200, seed=1):
+        self.world = world or SyntheticWorld(seed=seed)
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.time_scale = time_scale
+        self.debug_noise = debug_noise
+        self._rng = random.Random(seed)
+        self._start = time.monotonic()
+        self.players = {}
+        for index in range(1, players + 1):
+            self.players[index] = {"index": index, "unit_number": 10_000_000 + index, "x": 0.5 + 3 * (index - 1), "y": 0.5,
+                                   "inventory": {}, "scan_cache": None, "movement": None, "job": None}
+        self.recipes = self._make_recipes(recipes)
+        self.research_epoch = 0
+        self.events = []
+        self.last_event_id = 0
+        self.last_job_id = 0
+        self.path_requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.commands = 0
+        self.port = None
+        self._server = None
+
+    # --- Game state ---
+
+    @property
+    def tick(self):
+        return int((time.monotonic() - self._start) * TICKS_PER_SECOND * self.time_scale)
+
+    def push_event(self, event_type, tick=None, **data):
+        self.last_event_id += 1
+        event = {"id": self.last_event_id, "tick": self.tick if tick is None else tick, "type": event_type}
+        event.update(data)
+        self.events.append(event)
+        if len(self.events) > MAX_EVENTS:
+            del self.events[:len(self.events) - MAX_EVENTS]
+
+    def advance(self):
+        """
+        Completes movements whose arrival tick has passed.
+        """
+        now = self.tick
+        for player in self.players.values():
+            movement = player["movement"]
+            if movement and movement["end_tick"] <= now:
+                player["x"], player["y"] = movement["x"], movement["y"]
+                player["movement"] = None
+                self.push_event("pf_state", tick=movement["end_tick"], vehicle_key=player["unit_number"], state="IDLE", old_state="FOLLOWING_PATH")
+            elif movement:
+                progress = (now - movement["start_tick"]) / max(1, movement["end_tick"] - movement["start_tick"])
+                player["x"] = movement["from_x"] + (movement["x"] - movement["from_x"]) * progress
+                player["y"] = movement["from_y"] + (movement["y"] - movement["from_y"]) * progress
+            job = player["job"]
+            if job and job["state"] == "running":
+                self._apply_job_steps(player, job, now)
+                if not job["steps"]:
+                    self._finish_job(player, job, job["final_state"], job["message"], job["end_tick"])
+
+    # --- Action queue ---
+    # A queued job is planned in full when it is enqueued (the world's entities are used up right
+    # away); its steps (arrivals, mined units) take effect on the player as their ticks pass.
+
+    def _plan_mine(self, job, action, at):
+        x, y, tick = at
+        name = action.get("name")
+        count = int(action.get("count") or 1)
+        center = (action.get("x", x), action.get("y", y))
+        radius = action.get("radius") or MINE_RADIUS
+        mined = 0
+        while mined < count:
+            candidates = [r for r in self.world.find_in_area(center[0] - radius, center[1] - radius, center[0] + radius, center[1] + radius)
+                          if r["name"] == name]
+            if not candidates:
+                if mined:
+                    break
+                return None, f"No {name} within reach of {{{center[0]}, {center[1]}}}"
+            record = min(candidates, key=lambda r: (math.hypot(r["x"] - x, r["y"] - y), r["id"]))
+            reach = RESOURCE_REACH if record["type"] == "resource" else TREE_REACH
+            distance = math.hypot(record["x"] - x, record["y"] - y)
+            if distance > reach:
+                fraction = (distance - reach) / distance
+                x, y = x + (record["x"] - x) * fraction, y + (record["y"] - y) * fraction
+                tick += math.ceil((distance - reach) / CHARACTER_SPEED)
+                job["steps"].append({"tick": tick, "x": x, "y": y})
+            item, per_unit = (record["name"], 1) if record["type"] == "resource" else ("wood", 4)
+            while mined < count:
+                tick += MINING_TICKS[record["type"]]
+                mined += per_unit
+                job["steps"].append({"tick": tick, "item": item, "count": per_unit})
+                if record["type"] == "resource" and record["amount"] > 1:
+                    record["amount"] -= 1
+                else:
+                    self.world.remove(record["id"])
+                    break
+        return (x, y, tick), None
+
+    def _apply_job_steps(self, player, job, now):
+        while job["steps"] and job["steps"][0]["tick"] <= now:
+            step = job["steps"].pop(0)
+            if "item" in step:
+                player["inventory"][step["item"]] = player["inventory"].get(step["item"], 0) + step["count"]
+                job["mined"][step["item"]] = job["mined"].get(step["item"], 0) + step["count"]
+                self.push_event("player_mined_item", tick=step["tick"], player_index=player["index"], item=step["item"], count=step["count"])
+            else:
+                player["x"], player["y"] = step["x"], step["y"]
+            if step.get("action_done"):
+                job["actions_done"] += 1
+
+    def _finish_job(self, player, job, state, message=None, tick=None):
+        job["state"] = state
+        job["message"] = message
+        job["finished_tick"] = tick if tick is not None else self.tick
+        job["steps"] = []
+        self.push_event("action_queue_done", tick=job["finished_tick"], actor_key=f"player_{player['index']}", **self._job_progress(job))
+
+    def _job_progress(self, job):
+        return {"job_id": job["id"], "state": job["state"], "current": min(job["actions_done"] + 1, job["total"]), "total": job["total"],
+                "actions_done": job["actions_done"], "mined": dict(job["mined"]), "message": job["message"],
+                "started_tick": job["started_tick"], "ticks": job.get("finished_tick", self.tick) - job["started_tick"]}
+
+    def enqueue_actions(self, params):
+        player, err = self._actor(params)
+        if not player:
+            return {"status": "error", "message": err}
+        actions = params.get("actions") or []
+        if not actions:
+            return {"status": "error", "message": "actions not provided"}
+        for i, action in enumerate(actions, start=1):
+            if not isinstance(action, dict) or action.get("type") not in ("walk", "mine"):
+                return {"status": "error", "message": f"Unknown action type at {i}: {action.get('type') if isinstance(action, dict) else action}"}
+        cursor = self.last_event_id
+        if player["job"] and player["job"]["state"] == "running":
+            self._finish_job(player, player["job"], "cancelled", "Replaced by a new queue")
+        now = self.tick
+        self.last_job_id += 1
+        job = {"id": self.last_job_id, "state": "running", "total": len(actions), "actions_done": 0, "mined": {},
+               "message": None, "started_tick": now, "steps": [], "final_state": "done"}
+        at = (player["x"], player["y"], now)
+        for action in actions:
+            if action["type"] == "walk":
+                distance = math.hypot(action["x"] - at[0], action["y"] - at[1])
+                at = (float(action["x"]), float(action["y"]), at[2] + 2 + math.ceil(distance / CHARACTER_SPEED))
+                job["steps"].append({"tick": at[2], "x": at[0], "y": at[1]})
+                error = None
+            else:
+                planned, error = self._plan_mine(job, action, at)
+                at = planned or at
+            if error:
+                job["final_state"], job["message"] = "failed", error
+                break
+            if job["steps"]:
+                job["steps"][-1]["action_done"] = True
+            else:
+                job["actions_done"] += 1
+        job["end_tick"] = at[2]
+        player["job"] = job
+        player["movement"] = None
+        result = self._job_progress(job)
+        result.update(status="queued", event_cursor=cursor)
+        return result
+
+    def get_action_queue_status(self, params):
+        player, err = self._actor(params)
+        if not player:
+            return {"status": "error", "message": err}
+        return self._job_progress(player["job"]) if player["job"] else {"state": "none"}
+
+    def cancel_action_queue(self, params):
+        player, err = self._actor(params)
+        if not player:
+            return {"status": "error", "message": err}
+        job = player["job"]
+        if not (job and job["state"] == "running"):
+            return {"state": job["state"] if job else "none"}
+        self._finish_job(player, job, "cancelled", "Cancelled")
+        return self._job_progress(job)
+
+    def _make_recipes(self, count):
+        recipes = [
+            {"name": "iron-plate", "category": "smelting", "energy": 3.2, "ingredients": [{"name": "iron-ore", "amount": 1, "type": "item"}], "products": [{"name": "iron-plate", "amount": 1, "type": "item"}]},
+            {"name": "copper-plate", "category": "smelting", "energy": 3.2, "ingredients": [{"name": "copper-ore", "amount": 1, "type": "item"}], "products": [{"name": "copper-plate", "amount": 1, "type": "item"}]},
+            {"name": "stone-brick", "category": "smelting", "energy": 3.2, "ingredients": [{"name": "stone", "amount": 2, "type": "item"}], "products": [{"name": "stone-brick", "amount": 1, "type": "item"}]},
+            {"name": "iron-gear-wheel", "category": "crafting", "energy": 0.5, "ingredients": [{"name": "iron-plate", "amount": 2, "type": "item"}], "products": [{"name": "iron-gear-wheel", "amount": 1, "type": "item"}]},
+            {"name": "copper-cable", "category": "crafting", "energy": 0.5, "ingredients": [{"name": "copper-plate", "amount": 1, "type": "item"}], "products": [{"name": "copper-cable", "amount": 2, "type": "item"}]},
+            {"name": "electronic-circuit", "category": "crafting", "energy": 0.5, "ingredients": [{"name": "iron-plate", "amount": 1, "type": "item"}, {"name": "copper-cable", "amount": 3, "type": "item"}], "products": [{"name": "electronic-circuit", "amount": 1, "type": "item"}]},
+            {"name": "stone-furnace", "category": "crafting", "energy": 0.5, "ingredients": [{"name": "stone", "amount": 5, "type": "item"}], "products": [{"name": "stone-furnace", "amount": 1, "type": "item"}]},
+        ]
+        rng = random.Random(7)
+        items = [r["name"] for r in recipes]
+        for i in range(max(0, count - len(recipes))):
+            name = f"synthetic-item-{i}"
+            recipes.append({"name": name, "category": "crafting", "energy": 0.5,
+                            "ingredients": [{"name": rng.choice(items), "amount": rng.randint(1, 5), "type": "item"} for _ in range(rng.randint(1, 4))],
+                            "products": [{"name": name, "amount": 1, "type": "item"}]})
+            items.append(name)
+        return recipes
+
+    def _actor(self, params):
+        params = params if isinstance(params, dict) else {}
+        unit_number = params.get("unit_number")
+        if unit_number is not None:
+            for player in self.players.values():
+                if player["unit_number"] == unit_number:
+                    return player, None
+            return None, f"Entity with unit number {unit_number} not found or not commandable"
+        player = self.players.get(params.get("player_index") or 1)
+        if player is None:
+            return None, f"Player {params.get('player_index')} not found"
+        return player, None
+
+    # --- Remote interface ---
+
+    def get_player_info(self, params):
+        player, err = self._actor(params)
+        if not player:
+            return {"error": err}
+        return {"player_index": player["index"], "unit_number": player["unit_number"],
+                "position": {"x": round2(player["x"]), "y": round2(player["y"])},
+                "inventory": dict(player["inventory"]), "health": 250.0, "research_epoch": self.research_epoch, "tick": self.tick}
+
+    def get_all_unlocked_recipes(self, params):
+        limit = params.get("limit")
+        if limit is None:
+            return {"recipes": self.recipes}
+        offset = int(params.get("offset") or 0)
+        page = {"recipes": self.recipes[offset:offset + max(1, int(limit))], "offset": offset, "total": len(self.recipes)}
+        if offset + len(page["recipes"]) < len(self.recipes):
+            page["next"] = offset + len(page["recipes"])
+        return page
+
+    def get_recipe_fingerprint(self, params):
+        return {"fingerprint": f"base@fake|player|{len(self.recipes)}:{self.research_epoch}", "epoch": self.research_epoch,
+                "researched": self.research_epoch, "page_size": 100, "event_cursor": self.last_event_id}
+
+    def scan_nearby_entities(self, params):
+        player, err = self._actor(params)
+        if not player:
+            return {"error": err}
+        radius = params.get("radius") if isinstance(params, dict) else None
+        if not radius or radius <= 0:
+            return {"error": "Radius not provided"}
+        px, py = player["x"], player["y"]
+        columns = params.get("format") == "columns"
+        records = [r for r in self.world.find_in_area(px - radius, py - radius, px + radius, py + radius)
+                   if r["type"] == "tree" or r["name"] in ORE_NAMES]
+        snapshot = {r["key"]: r["amount"] or 0 for r in records}
+
+        def encode(items):
+            if columns:
+                names, index = [], {}
+                name_id, xs, ys, amounts, keys = [], [], [], [], []
+                for r in items:
+                    if r["name"] not in index:
+                        index[r["name"]] = len(names)
+                        names.append(r["name"])
+                    name_id.append(index[r["name"]]); xs.append(r["x"]); ys.append(r["y"]); amounts.append(r["amount"] or 0); keys.append(r["key"])
+                return {"format": "columns", "names": names, "name_id": name_id, "x": xs, "y": ys, "amount": amounts,
+                        "key": keys if params.get("delta") else None}
+            return [{"name": r["name"], "key": r["key"], "position": {"x": f"{r['x']:.2f}", "y": f"{r['y']:.2f}"},
+                     "amount": r["amount"]} for r in items]
+
+        if not params.get("delta"):
+            return encode(records) if columns else {"entities": encode(records)}
+        cache = player["scan_cache"]
+        token = (cache["token"] if cache else 0) + 1
+        player["scan_cache"] = {"token": token, "entities": snapshot}
+        if not (cache and params.get("token") == cache["token"]):
+            return {"full": True, "token": token, "entities": encode(records)}
+        old = cache["entities"]
+        added = [r for r in records if r["key"] not in old]
+        changed = [{"key": r["key"], "amount": snapshot[r["key"]]} for r in records if r["key"] in old and old[r["key"]] != snapshot[r["key"]]]
+        removed = [key for key in old if key not in snapshot]
+        return {"full": False, "token": token, "added": encode(added), "changed": changed, "removed": removed}
+
+    def start_pathfinding_to(self, params):
+        return self.pf_set_destination(params)
+
+    def pf_set_destination(self, params):
+        player, err = self._actor(params)
+        if not player:
+            return {"status": "error", "message": err}
+        x, y = params.get("x"), params.get("y")
+        if x is None or y is None:
+            return {"status": "error", "message": "Target coordinates (x, y) not provided or invalid."}
+        now = self.tick
+        distance = math.hypot(x - player["x"], y - player["y"])
+        self.path_requests += 1
+        vehicle_key = player["unit_number"]
+        player["movement"] = {"from_x": player["x"], "from_y": player["y"], "x": float(x), "y": float(y),
+                              "start_tick": now, "end_tick": now + 2 + math.ceil(distance / CHARACTER_SPEED)}
+        for old_state, state in ((None, "REQUESTING_PATH"), ("REQUESTING_PATH", "PATH_RECEIVED"), ("PATH_RECEIVED", "FOLLOWING_PATH")):
+            self.push_event("pf_state", vehicle_key=vehicle_key, state=state, old_state=old_state)
+        result = {"status": "path_requested", "vehicle_key": vehicle_key, "request_id": self.path_requests,
+                  "entity_name": "character", "state": "REQUESTING_PATH", "event_cursor": self.last_event_id}
+        noise = None
+        if self.debug_noise:
+            noise = (f"PathfindingModule: Path request initiated for character (Key: {vehicle_key}) to {{{x},{y}}}. Request ID: {self.path_requests}\n"
+                     f"PathfindingModule: Vehicle {vehicle_key} (Name: character) state changed from IDLE to: REQUESTING_PATH\n"
+                     f"PathfindingModule: Path waypoints (first few): [{{\"position\":{{\"x\":{player['x']:.1f},\"y\":{player['y']:.1f}}}}}]\n")
+        return result, noise
+
+    def mine_target_entity(self, params):
+        params = params or {}
+        by_position = params.get("x") is not None and params.get("y") is not None
+        actor_params = params if params.get("target_unit_number") or by_position else {"player_index": params.get("player_index")}
+        player, err = self._actor(actor_params)
+        if not player:
+            return {"status": "error", "message": err}
+        if not by_position: # Only resources and trees exist in the fake world, and they have no unit_number
+            return {"status": "error", "message": "Target entity not found", "entity_id": params.get("target_unit_number") or params.get("unit_number")}
+        x, y = params["x"], params["y"]
+        candidates = [r for r in self.world.find_in_area(x - 0.5, y - 0.5, x + 0.5, y + 0.5)
+                      if math.hypot(r["x"] - x, r["y"] - y) <= 0.5 and (not params.get("target_name") or r["name"] == params["target_name"])]
+        if not candidates:
+            return {"status": "error", "message": "Target entity not found"}
+        record = candidates[0]
+        cursor = self.last_event_id
+        item, count = (record["name"], 1) if record["type"] == "resource" else ("wood", 4)
+        if record["type"] == "resource" and record["amount"] > 1:
+            record["amount"] -= 1
+        else:
+            self.world.remove(record["id"])
+        player["inventory"][item] = player["inventory"].get(item, 0) + count
+        self.push_event("player_mined_item", player_index=player["index"], item=item, count=count)
+        return {"status": "mining_initiated", "entity_name": record["name"], "event_cursor": cursor}
+
+    def poll_events(self, params):
+        since = (params or {}).get("since") or 0
+        limit = (params or {}).get("limit")
+        events = [e for e in self.events if e["id"] > since]
+        if limit:
+            events = events[:limit]
+        cursor = max(events[-1]["id"] if events else since, since)
+        return {"events": events, "cursor": cursor, "tick": self.tick}
+
+    def batch(self, params):
+        parts = []
+        for i, call in enumerate((params or {}).get("calls", []), start=1):
+            call_id = str(call.get("id", i))
+            handler = getattr(self, call.get("fn", ""), None) if call.get("fn") in self.ACTIONS and call.get("fn") != "batch" else None
+            if handler is None:
+                result = {"error": f"Unknown action: {call.get('fn')}"}
+            else:
+                result = handler(call.get("params") or {})
+                if isinstance(result, tuple):
+                    result = result[0]
+            parts.append(lua_json(call_id) + ":" + lua_json(result))
+        return '{"tick":' + str(self.tick) + ',"results":{' + ",".join(parts) + "}}"
+
+    ACTIONS = {"get_player_info", "get_all_unlocked_recipes", "get_recipe_fingerprint", "scan_nearby_entities", "start_pathfinding_to",
+               "pf_set_destination", "mine_target_entity", "enqueue_actions", "get_action_queue_status",
+               "cancel_action_queue", "poll_events", "batch"}
+
+    def execute(self, command):
+        """
+        Runs one console command and returns the text Factorio would send back.
+        """
+        match = _COMMAND_RE.match(command)
+        if not match or match.group(1) != MOD_INTERFACE_NAME:
+            return "Cannot execute command. Error: unsupported command in fake server\n"
+        function_name, raw_params = match.group(2), match.group(3)
+        if function_name not in self.ACTIONS:
+            return f"Cannot execute command. Error: Unknown interface: {function_name}\n"
+        params = parse_lua_literal(raw_params) if raw_params else {}
+        self.advance()
+        result = getattr(self, function_name)(params if isinstance(params, dict) else {})
+        noise = None
+        if isinstance(result, tuple):
+            result, noise = result
+        body = result if isinstance(result, str) else lua_json(result)
+        return (noise or "") + RESPONSE_START + body + RESPONSE_END + "\n"
+
+    # --- RCON transport ---
+
+    async def _handle(self, reader, writer):
+        authed = False
+        try:
+            while True:
+                request_id, packet_type, body = await read_packet(reader)
+                self.bytes_in += len(body) + 14
+                if packet_type == SERVERDATA_AUTH:
+                    authed = body == self.password
+                    writer.write(encode_packet(request_id if authed else -1, SERVERDATA_AUTH_RESPONSE, ""))
+                    await writer.drain()
+                    continue
+                if not authed:
+                    break
+                self.commands += 1
+                delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0)
+                asyncio.ensure_future(self._respond(writer, request_id, body, delay))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, request_id, command, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        response = self.execute(command)
+        packet = encode_packet(request_id, SERVERDATA_RESPONSE_VALUE, response)
+        self.bytes_out += len(packet)
+        if not writer.is_closing():
+            writer.write(packet)
+            await writer.drain()
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+class FakeServerThread:
+    """
+    Runs a FakeFactorioServer on its own event loop thread; use as a context manager.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-factorio", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.server.start(), self._loop).result()
+        return self.server
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
@@ -0,0 +1,84 @@
+"""
+Deterministic stand-ins for GeminiAgent used by the benchmarks.
+
+A policy only needs decide_next_action(game_state, nearby_entities, recipes) returning the same
+{"action", "parameters", "reasoning"} dicts the LLM produces, plus a `decision_cache` attribute.
+"""
+import time
+
+
+class StubPolicy:
+    """
+    Gathers resources in a fixed order: mines the nearest visible entity (or known patch) of the
+    first resource still below its target count, otherwise moves towards the densest remembered chunk of it or
+    explores the nearest unexplored chunk when the snapshot has exploration hints, else walks an
+    outward square spiral.
+    `think_latency` seconds are slept per decision to emulate a model call.
+    """
+
+    def __init__(self, targets=None, think_latency=0.0, step=24):
+        self.targets = targets or [("iron-ore", 50), ("coal", 20), ("stone", 10), ("copper-ore", 20)]
+        self.think_latency = think_latency
+        self.step = step
+        self.decision_cache = None
+        self.decisions = 0
+        self._spiral_index = 0
+
+    def _spiral_point(self, index):
+        # Square spiral: (1,0), (1,1), (0,1), (-1,1), (-1,0), ...
+        x = y = 0
+        dx, dy = 1, 0
+        leg, steps_in_leg, legs_done = 1, 0, 0
+        for _ in range(index + 1):
+            x += dx
+            y += dy
+            steps_in_leg += 1
+            if steps_in_leg == leg:
+                steps_in_leg = 0
+                dx, dy = -dy, dx
+                legs_done += 1
+                if legs_done % 2 == 0:
+                    leg += 1
+        return x * self.step, y * self.step
+
+    def decide_next_action(self, game_state, nearby_entities, recipes):
+        if self.think_latency:
+            time.sleep(self.think_latency)
+        self.decisions += 1
+        inventory = game_state.get("inventory") or {}
+        if not isinstance(inventory, dict):
+            inventory = {}
+        position = game_state.get("position") or {}
+        px, py = float(position.get("x", 0)), float(position.get("y", 0))
+        entities = (nearby_entities or {}).get("entities", [])
+
+        for name, wanted in self.targets:
+            if inventory.get(name, 0) >= wanted:
+                continue
+            candidates = [e for e in entities if e.get("name") == name]
+            patches = [p for p in (nearby_entities or {}).get("patches") or [] if p.get("name") == name]
+            if not candidates and patches: # Known patch, but closer entities filled the nearby list
+                patch = min(patches, key=lambda p: (p.get("distance", 0), p["patch_id"]))
+                return {"action": "MINE", "parameters": {"patch_id": patch["patch_id"], "quantity": wanted - inventory.get(name, 0)},
+                        "reasoning": f"Need {wanted - inventory.get(name, 0)} more {name} from patch {patch['patch_id']}."}
+            if not candidates:
+                continue
+            def distance_sq(entity):
+                pos = entity.get("position", {})
+                return (float(entity.get("x", pos.get("x", 0))) - px) ** 2 + (float(entity.get("y", pos.get("y", 0))) - py) ** 2
+            target = min(candidates, key=lambda e: (distance_sq(e), e.get("key", "")))
+            return {"action": "MINE", "parameters": {"target_entity_id": target.get("unit_number"), "target_name": name,
+                                                          "quantity": wanted - inventory.get(name, 0)},
+                    "reasoning": f"Need {wanted - inventory.get(name, 0)} more {name}."}
+
+        exploration = (nearby_entities or {}).get("exploration") or {}
+        for name, wanted in self.targets:
+            deposit = (exploration.get("densest") or {}).get(name)
+            if inventory.get(name, 0) < wanted and deposit:
+                return {"action": "MOVE", "parameters": {"x": deposit["x"], "y": deposit["y"]}, "reasoning": f"Going to remembered {name}."}
+        unexplored = exploration.get("unexplored")
+        if unexplored:
+            return {"action": "MOVE", "parameters": {"x": unexplored["x"], "y": unexplored["y"]}, "reasoning": "Exploring the nearest unexplored chunk."}
+        x, y = self._spiral_point(self._spiral_index)
+        self._spiral_index += 1
+        return {"action": "MOVE", "parameters": {"x": x + 0.5, "y": y + 0.5}, "reasoning": "Exploring."}
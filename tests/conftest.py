@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The agent modules are flat files run from Agent/ (python main.py); import them the same way.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Agent"))
@@ -0,0 +1,136 @@
+import random
+
+from patches import NEIGHBOURS, PatchIndex
+
+
+def tile(name, x, y, amount=100):
+    return {"key": f"{name}@{x},{y}", "name": name, "x": x + 0.5, "y": y + 0.5, "amount": amount}
+
+
+def components(tiles):
+    """
+    Brute-force 8-connected components of {(name, x, y): amount}, as sets of (name, x, y).
+    """
+    remaining = set(tiles)
+    found = []
+    while remaining:
+        start = remaining.pop()
+        component, stack = {start}, [start]
+        while stack:
+            name, x, y = stack.pop()
+            for dx, dy in NEIGHBOURS:
+                cell = (name, x + dx, y + dy)
+                if cell in remaining:
+                    remaining.discard(cell)
+                    component.add(cell)
+                    stack.append(cell)
+        found.append(component)
+    return found
+
+
+def index_components(index, tiles):
+    groups = {}
+    for name, x, y in tiles:
+        groups.setdefault(index.patch_of(f"{name}@{x},{y}"), set()).add((name, x, y))
+    return groups
+
+
+def assert_matches(index, tiles):
+    groups = index_components(index, tiles)
+    expected = sorted(sorted(c) for c in components(tiles))
+    assert sorted(sorted(g) for g in groups.values()) == expected
+    assert len(index) == len(expected)
+    for patch_id, cells in groups.items():
+        summary = index.summary(patch_id)
+        assert summary["tiles"] == len(cells)
+        assert summary["amount"] == sum(tiles[cell] for cell in cells)
+        xs = [x for _, x, _ in cells]
+        ys = [y for _, _, y in cells]
+        assert summary["bbox"] == [min(xs), min(ys), max(xs) + 1, max(ys) + 1]
+
+
+def test_diagonal_tiles_merge_into_one_patch():
+    index = PatchIndex()
+    first = index.add(tile("iron-ore", 0, 0))
+    assert index.add(tile("iron-ore", 1, 1)) == first
+    assert index.add(tile("copper-ore", 2, 2)) != first # Other resources never join
+    assert len(index) == 2
+
+
+def test_bridge_tile_merges_and_splits():
+    index = PatchIndex()
+    tiles = {}
+    for x in (0, 1, 3, 4):
+        index.add(tile("coal", x, 0))
+        tiles[("coal", x, 0)] = 100
+    assert len(index) == 2
+    index.add(tile("coal", 2, 0))
+    tiles[("coal", 2, 0)] = 100
+    assert len(index) == 1
+    assert_matches(index, tiles)
+
+    index.remove("coal@2,0")
+    del tiles[("coal", 2, 0)]
+    assert len(index) == 2
+    assert_matches(index, tiles)
+
+
+def test_removal_inside_ring_keeps_one_patch():
+    index = PatchIndex()
+    tiles = {}
+    for x in range(3):
+        for y in range(3):
+            index.add(tile("stone", x, y))
+            tiles[("stone", x, y)] = 100
+    index.remove("stone@1,1")
+    del tiles[("stone", 1, 1)]
+    assert_matches(index, tiles)
+    assert len(index) == 1
+
+
+def test_amount_update_and_trees_ignored():
+    index = PatchIndex()
+    patch_id = index.add(tile("iron-ore", 0, 0, 100))
+    index.add(tile("iron-ore", 0, 0, 40))
+    assert index.summary(patch_id)["amount"] == 40
+    assert index.add({"key": "tree@5,5", "name": "tree-01", "x": 5.5, "y": 5.5}) is None
+    assert index.add(tile("iron-ore", 0, 0, 0)) is None # Mined out
+    assert len(index) == 0
+
+
+def test_random_adds_and_removals_match_brute_force():
+    for seed in (1, 2, 3):
+        rng = random.Random(seed)
+        for _ in range(60):
+            index = PatchIndex()
+            tiles = {}
+            for _ in range(rng.randint(10, 80)):
+                name = rng.choice(("coal", "iron-ore"))
+                x, y = rng.randint(0, 9), rng.randint(0, 9)
+                if rng.random() < 0.3 and tiles:
+                    name, x, y = rng.choice(sorted(tiles))
+                    index.remove(f"{name}@{x},{y}")
+                    del tiles[(name, x, y)]
+                else:
+                    amount = rng.randint(1, 500)
+                    index.add(tile(name, x, y, amount))
+                    tiles[(name, x, y)] = amount
+                assert_matches(index, tiles)
+
+
+def test_mining_out_dense_patches_matches_brute_force():
+    # Removing tiles from dense, irregular patches exercises splits where the fills meet.
+    for seed in (1, 2, 3):
+        rng = random.Random(seed)
+        for _ in range(100):
+            index = PatchIndex()
+            tiles = {}
+            for x in range(8):
+                for y in range(8):
+                    if rng.random() < 0.6:
+                        index.add(tile("coal", x, y))
+                        tiles[("coal", x, y)] = 100
+            for name, x, y in rng.sample(sorted(tiles), len(tiles)):
+                index.remove(f"{name}@{x},{y}")
+                del tiles[(name, x, y)]
+                assert_matches(index, tiles)
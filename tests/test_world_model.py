@@ -0,0 +1,77 @@
+import random
+
+from entity_store import EntityColumns, NameTable
+from world_model import WorldModel
+
+
+def scan_payload(entities, center, radius, keys=None):
+    """
+    What the mod's columnar delta scan reports for the square around `center`.
+    """
+    cx, cy = center
+    inside = {key: e for key, e in entities.items() if abs(e["x"] - cx) <= radius and abs(e["y"] - cy) <= radius}
+    if keys is not None:
+        inside = {key: inside[key] for key in keys if key in inside}
+    names = sorted({e["name"] for e in inside.values()})
+    ordered = sorted(inside)
+    return inside, {"names": names, "name_id": [names.index(inside[k]["name"]) for k in ordered],
+                    "x": [inside[k]["x"] for k in ordered], "y": [inside[k]["y"] for k in ordered],
+                    "amount": [inside[k]["amount"] for k in ordered], "key": ordered}
+
+
+def snapshot(world):
+    return sorted((key, world.get(key).get("amount", 0)) for key in list(world._locations))
+
+
+def test_delta_ingest_matches_full_ingest():
+    rng = random.Random(5)
+    entities = {}
+    for _ in range(400):
+        x, y = rng.randint(-60, 60) + 0.5, rng.randint(-60, 60) + 0.5
+        name = rng.choice(("iron-ore", "coal"))
+        entities[f"{name}@{x},{y}"] = {"name": name, "x": x, "y": y, "amount": rng.randint(1, 300)}
+
+    full_world, delta_world = WorldModel(), WorldModel()
+    columns, previous, ingested_at = None, None, None
+    position = (0.5, 0.5)
+    for _ in range(40):
+        # Mine some entities anywhere (also outside the scan) and sometimes move.
+        for key in rng.sample(sorted(entities), 5):
+            if rng.random() < 0.5:
+                del entities[key]
+            else:
+                entities[key]["amount"] -= 1
+        if rng.random() < 0.5:
+            position = (position[0] + rng.randint(-20, 20), position[1] + rng.randint(-20, 20))
+
+        inside, payload = scan_payload(entities, position, 24)
+        full_world.ingest_scan(EntityColumns.from_wire(payload).to_records(), position[0], position[1], 24, now=0)
+
+        if columns is None:
+            columns = EntityColumns.from_wire(payload, NameTable())
+            delta = None
+        else:
+            added = [k for k in inside if k not in previous]
+            _, added_payload = scan_payload(entities, position, 24, keys=added)
+            changed = [{"key": k, "amount": inside[k]["amount"]} for k in inside if k in previous and previous[k] != inside[k]["amount"]]
+            removed = [k for k in previous if k not in inside]
+            delta = columns.apply_delta(added_payload, changed, removed)
+        delta_world.ingest_columns(columns, position[0], position[1], 24, delta=delta, sweep=ingested_at != position, now=0)
+        ingested_at = position
+        previous = {k: e["amount"] for k, e in inside.items()}
+
+        assert snapshot(delta_world) == snapshot(full_world)
+        assert sorted(p["tiles"] for p in delta_world.patches_near(0, 0)) == sorted(p["tiles"] for p in full_world.patches_near(0, 0))
+
+
+def test_large_radius_queries_only_visit_occupied_chunks():
+    world = WorldModel()
+    world.upsert({"key": "a", "name": "coal", "x": 10.5, "y": 10.5, "amount": 5})
+    world.upsert({"key": "b", "name": "coal", "x": 5000.5, "y": -3000.5, "amount": 50})
+    world.upsert({"key": "c", "name": "tree-01", "x": 40.5, "y": 0.5})
+    # A 2e6-tile square would be ~4e9 chunks if walked cell by cell.
+    assert [r["key"] for r in world.within_radius(None, 0, 0, 10 ** 6)] == ["a", "c", "b"]
+    assert world.richest_patch_near("coal", 0, 0, 10 ** 6)["closest"]["key"] == "b"
+    assert world.richest_patch_near("coal", 0, 0, 100)["closest"]["key"] == "a"
+    world.ingest_scan([], 0, 0, 10 ** 6, now=0) # Scanned everything, found nothing
+    assert len(world) == 0